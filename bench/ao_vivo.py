@@ -0,0 +1,94 @@
+# Atualizações ao vivo: N páginas abertas da mesma turma (streams de
+# pysrc/eventos.py) e o tempo entre o INSERT de uma avaliação e a chegada do
+# evento em todas elas, com as conexões do banco usadas pelo processo.
+#
+#   python bench/ao_vivo.py [--paginas 5000] [--avaliacoes 20]
+#
+# Consome os streams direto, sem servidor HTTP. As avaliações criadas
+# (comentário "bench ao vivo") são apagadas no final. Gere os dados antes com
+# bench/gerar_dados.py.
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pysrc import connection
+from pysrc import eventos
+
+
+async def conexoes_do_banco(conn):
+    async with conn.cursor() as curr:
+        await curr.execute(
+            "SELECT COUNT(*) FROM pg_stat_activity WHERE datname = current_database() AND pid <> pg_backend_pid()"
+        )
+        (qtd,) = await curr.fetchone()
+        return qtd
+
+
+async def main_async(args):
+    await connection.open_pool()
+    ouvinte = eventos.Ouvinte(connection.get_conninfo(), eventos.FILA)
+    ouvinte.start()
+    try:
+        async with connection.connect() as conn:
+            async with conn.cursor() as curr:
+                await curr.execute("SELECT MIN(id) FROM Users")
+                (user_id,) = await curr.fetchone()
+                await curr.execute("SELECT MIN(id) FROM Turmas")
+                (turma_id,) = await curr.fetchone()
+        if user_id is None or turma_id is None:
+            raise SystemExit("Banco sem dados: rode antes python bench/gerar_dados.py --limpar")
+
+        # Cada página marca quando recebeu cada evento "inseridas"
+        chegadas = [asyncio.Queue() for _ in range(args.paginas)]
+
+        async def pagina(fila):
+            async for evento in ouvinte.stream(turma_id):
+                if evento.startswith(b"event: inseridas"):
+                    fila.put_nowait(time.perf_counter())
+
+        tarefas = [asyncio.create_task(pagina(fila)) for fila in chegadas]
+        while ouvinte.stats()["paginas"] < args.paginas or not ouvinte.conectado:
+            await asyncio.sleep(0.05)
+
+        async with connection.connect() as conn:
+            print(f"{args.paginas} páginas abertas, {await conexoes_do_banco(conn)} conexões no banco")
+            latencias = []
+            for i in range(args.avaliacoes):
+                inicio = time.perf_counter()
+                await conn.execute(
+                    "INSERT INTO Avaliacoes (user_id, turma_id, comentario, pontuacao) VALUES (%s, %s, %s, 5)",
+                    (user_id, turma_id, f"bench ao vivo {i}"),
+                )
+                ultima = max([await fila.get() for fila in chegadas])
+                latencias.append((ultima - inicio) * 1000)
+
+            await conn.execute("DELETE FROM Avaliacoes WHERE comentario LIKE 'bench ao vivo %'")
+
+        for tarefa in tarefas:
+            tarefa.cancel()
+        await asyncio.gather(*tarefas, return_exceptions=True)
+
+        latencias.sort()
+        print(f"INSERT até o evento chegar em todas as páginas: mediana {statistics.median(latencias):.1f} ms, "
+              f"máx {latencias[-1]:.1f} ms")
+        print(ouvinte.stats())
+    finally:
+        await ouvinte.stop()
+        await connection.close_pool()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python bench/ao_vivo.py")
+    parser.add_argument("--paginas", type=int, default=5000)
+    parser.add_argument("--avaliacoes", type=int, default=20)
+    args = parser.parse_args(argv)
+    asyncio.run(main_async(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+# Latência de /api/busca (models.buscar_avaliacoes) para um termo, por padrão
+# um que casa com boa parte dos comentários gerados: exata (o padrão) e com os
+# limites BUSCA_JANELA e BUSCA_MAX_CANDIDATOS.
+#
+#   python bench/busca.py [--termo professor] [--repeticoes 50] [--janela 200000] [--max-candidatos 2000]
+#
+# Gere os dados antes com bench/gerar_dados.py.
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import psycopg
+
+from pysrc import connection
+from pysrc import models
+
+
+def percentil(valores, p):
+    valores = sorted(valores)
+    return valores[min(len(valores) - 1, int(len(valores) * p / 100))]
+
+
+async def medir(conn, termo, repeticoes):
+    latencias = []
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        _, resultado = await models.buscar_avaliacoes(conn, termo)
+        latencias.append((time.perf_counter() - inicio) * 1000)
+    return latencias, resultado
+
+
+async def main_async(args):
+    async with await psycopg.AsyncConnection.connect(connection.get_conninfo(), autocommit=True) as conn:
+        async with conn.cursor() as curr:
+            await curr.execute(
+                "SELECT COUNT(*) FROM Avaliacoes WHERE comentario_tsv @@ websearch_to_tsquery('portuguese', %s)",
+                (args.termo,),
+            )
+            (ocorrencias,) = await curr.fetchone()
+        print(f"termo {args.termo!r}: {ocorrencias} ocorrências")
+        print(f"{'janela':>10} {'candidatos':>10} {'p50 ms':>8} {'p99 ms':>8} {'limitado':>9}")
+        for janela, max_candidatos in ((0, 0), (args.janela, 0), (0, args.max_candidatos), (args.janela, args.max_candidatos)):
+            models.BUSCA_JANELA, models.BUSCA_MAX_CANDIDATOS = janela, max_candidatos
+            latencias, resultado = await medir(conn, args.termo, args.repeticoes)
+            print(
+                f"{janela or 'todas':>10} {max_candidatos or 'todos':>10} "
+                f"{percentil(latencias, 50):>8.1f} {percentil(latencias, 99):>8.1f} {str(resultado.limitado):>9}"
+            )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python bench/busca.py")
+    parser.add_argument("--termo", default="professor")
+    parser.add_argument("--repeticoes", type=int, default=50)
+    parser.add_argument("--janela", type=int, default=200000)
+    parser.add_argument("--max-candidatos", type=int, default=2000)
+    args = parser.parse_args(argv)
+    asyncio.run(main_async(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,449 @@
+# Teste de carga ponta a ponta: dispara todas as rotas de index.py com uma
+# mistura realista de leituras e escritas contra o Postgres local.
+#
+#   python bench/carga.py [--duracao 30] [--concorrencia 32] [--url http://localhost:8000]
+#                         [--saida resultado.json] [--comparar anterior.json]
+#
+# Sem --url a aplicação roda no próprio processo (httpx.ASGITransport, com o
+# lifespan: pool, migrations, agendador); com --url o alvo é um servidor já no
+# ar. Nos dois casos o tempo de banco vem do cabeçalho Server-Timing.
+#
+# Reporta por rota: requisições/s, p50/p95/p99/máx de latência, tempo médio de
+# banco e contagem de status; grava tudo em JSON (bench/resultados/ por padrão)
+# para comparar execuções com --comparar. Usa httpx (pip install httpx).
+# Gere os dados antes com bench/gerar_dados.py: as escritas alteram o banco.
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+from collections import Counter, defaultdict
+from typing import Optional
+
+import httpx
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pysrc import connection
+from gerar_dados import PALAVRAS
+
+RESULTADOS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "resultados")
+
+
+
+def tempo_db(server_timing: str) -> Optional[float]:
+    # Segundos de banco informados pela aplicação no cabeçalho Server-Timing
+    # (pysrc/metrics.py), ex.: "total;dur=6.8, conn;dur=0.02, db;dur=4.5;desc=..."
+    for metrica in server_timing.split(","):
+        nome, _, params = metrica.strip().partition(";")
+        if nome == "db":
+            for param in params.split(";"):
+                chave, _, valor = param.partition("=")
+                if chave == "dur":
+                    return float(valor) / 1000
+    return None
+
+
+class Amostra:
+    # Ids reais do banco usados para montar as requisições. As turmas mais
+    # avaliadas aparecem com mais frequência (popularidade enviesada).
+    def __init__(self, departamentos, professores, disciplinas, turmas, turmas_populares, usuarios, admin):
+        self.departamentos = departamentos
+        self.professores = professores
+        self.disciplinas = disciplinas
+        self.turmas = turmas
+        self.turmas_populares = turmas_populares
+        self.usuarios = usuarios
+        # Nome de um administrador, para as importações
+        self.admin = admin
+        self.pesos_populares = [1 / (k ** 0.8) for k in range(1, len(turmas_populares) + 1)]
+
+    def turma(self, rnd: random.Random) -> int:
+        if self.turmas_populares and rnd.random() < 0.8:
+            return rnd.choices(self.turmas_populares, weights=self.pesos_populares)[0]
+        return rnd.choice(self.turmas)
+
+
+async def carregar_amostra() -> Amostra:
+    async with connection.connect() as conn:
+        async with conn.cursor() as curr:
+            async def ids(sql):
+                await curr.execute(sql)
+                return [row[0] for row in await curr.fetchall()]
+
+            departamentos = await ids("SELECT id FROM Departamentos")
+            professores = await ids("SELECT id FROM Professores")
+            disciplinas = await ids("SELECT id FROM Disciplinas")
+            turmas = await ids("SELECT id FROM Turmas")
+            populares = await ids(
+                "SELECT turma_id FROM Turmas_Avaliacoes_Stats ORDER BY qtd_avaliacoes DESC LIMIT 2000"
+            )
+            # Usuários do gerar_dados.py, todos com a senha "senha"
+            await curr.execute("SELECT id, nome FROM Users WHERE nome LIKE 'aluno-%' ORDER BY random() LIMIT 10000")
+            usuarios = await curr.fetchall()
+            await curr.execute("SELECT nome FROM Users WHERE is_admin AND nome LIKE 'aluno-%' LIMIT 1")
+            admin = await curr.fetchone()
+
+    if not (professores and disciplinas and turmas and usuarios):
+        raise SystemExit("Banco sem dados: rode antes python bench/gerar_dados.py --limpar")
+    return Amostra(departamentos, professores, disciplinas, turmas, populares, usuarios, admin and admin[0])
+
+
+class Carga:
+    def __init__(self, amostra: Amostra, args):
+        self.amostra = amostra
+        self.args = args
+        self.etags: dict[str, str] = {}
+        # Avaliações criadas por esta execução, candidatas ao DELETE:
+        # id -> (turma_id, user_id)
+        self.criadas: dict[int, tuple[int, int]] = {}
+        self.excluidas: set[int] = set()
+        # user_id -> token de sessão obtido em POST /api/login
+        self.tokens: dict[int, str] = {}
+        # Sessão de administrador usada nas importações (login no início)
+        self.token_admin: Optional[str] = None
+        self.latencias = defaultdict(list)
+        self.tempos_db = defaultdict(list)
+        self.status = defaultdict(Counter)
+        self.bytes = Counter()
+        self.seq = 0
+
+    # Cada operação devolve (nome da rota, método, url, corpo ou None), ou None se
+    # não puder ser feita agora (ex.: nada criado ainda para excluir)
+    def op_raiz(self, rnd):
+        return "GET /", "GET", "/", None
+
+    def op_professores(self, rnd):
+        return "GET /api/professores", "GET", "/api/professores", None
+
+    def op_disciplinas(self, rnd):
+        return "GET /api/disciplinas", "GET", "/api/disciplinas", None
+
+    def op_disciplina(self, rnd):
+        return "GET /api/disciplina/{id}", "GET", f"/api/disciplina/{rnd.choice(self.amostra.disciplinas)}", None
+
+    def op_professor(self, rnd):
+        return "GET /api/professor/{id}", "GET", f"/api/professor/{rnd.choice(self.amostra.professores)}", None
+
+    def op_ranking(self, rnd):
+        return "GET /api/ranking", "GET", f"/api/ranking?limit={rnd.choice([10, 10, 50])}", None
+
+    def op_ranking_departamento(self, rnd):
+        url = f"/api/departamento/{rnd.choice(self.amostra.departamentos)}/ranking"
+        return "GET /api/departamento/{id}/ranking", "GET", url, None
+
+    def op_busca(self, rnd):
+        termos = "%20".join(rnd.sample(PALAVRAS, rnd.choice([1, 1, 2, 3])))
+        filtro = rnd.choice(["", "", f"&professor_id={rnd.choice(self.amostra.professores)}"])
+        return "GET /api/busca", "GET", f"/api/busca?q={termos}{filtro}", None
+
+    def op_turma(self, rnd):
+        turma = self.amostra.turma(rnd)
+        return "GET /api/turma/{id}", "GET", f"/api/turma/{turma}", None
+
+    def op_turma_stream(self, rnd):
+        turma = self.amostra.turma(rnd)
+        return "GET /api/turma/{id}?stream", "GET", f"/api/turma/{turma}?stream=true", None
+
+    def op_turma_avaliacoes(self, rnd):
+        turma = self.amostra.turma(rnd)
+        return "GET /api/turma/{id}/avaliacoes", "GET", f"/api/turma/{turma}/avaliacoes?limit=20", None
+
+    def op_turma_usuario(self, rnd):
+        if not self.tokens:
+            return None
+        turma = self.amostra.turma(rnd)
+        user_id = rnd.choice(list(self.tokens))
+        return "GET /api/turma/{id}/{user_id}", "GET", f"/api/turma/{turma}/{user_id}", None
+
+    def op_login(self, rnd):
+        _, nome = rnd.choice(self.amostra.usuarios)
+        return "POST /api/login", "POST", "/api/login", {"nome": nome, "senha": "senha"}
+
+    def op_pool(self, rnd):
+        return "GET /api/pool", "GET", "/api/pool", None
+
+    def op_cache(self, rnd):
+        return "GET /api/cache", "GET", "/api/cache", None
+
+    def op_comentar(self, rnd):
+        if not self.tokens:
+            return None
+        turma = self.amostra.turma(rnd)
+        user_id = rnd.choice(list(self.tokens))
+        corpo = {
+            "user_id": user_id,
+            "comentario": "bench " + " ".join(rnd.choices(PALAVRAS, k=rnd.randint(4, 20))),
+            "pontuacao": rnd.randint(1, 5),
+        }
+        return "POST /api/turma/{id}/{user_id}/comentario", "POST", f"/api/turma/{turma}/{user_id}/comentario", corpo
+
+    def op_excluir(self, rnd):
+        # Só dá para excluir avaliações de usuários com sessão
+        candidatas = [a for a, (_, user_id) in self.criadas.items() if user_id in self.tokens]
+        if not candidatas:
+            return None
+        avaliacao_id = rnd.choice(candidatas)
+        turma, user_id = self.criadas.pop(avaliacao_id)
+        self.excluidas.add(avaliacao_id)
+        url = f"/api/turma/{turma}/{user_id}/comentario/{avaliacao_id}"
+        return "DELETE /api/turma/{id}/{user_id}/comentario/{id}", "DELETE", url, None
+
+    def op_cadastro(self, rnd):
+        self.seq += 1
+        nome = f"bench-{self.args.execucao}-{self.seq}"
+        corpo = {"email": f"{nome}@example.com", "nome": nome, "matricula": str(self.seq),
+                 "curso": "bench", "senha": "bench"}
+        return "POST /api/usuario", "POST", "/api/usuario", corpo
+
+    def op_importar_avaliacoes(self, rnd):
+        if self.token_admin is None:
+            return None
+        linhas = []
+        for _ in range(50):
+            user_id, _ = rnd.choice(self.amostra.usuarios)
+            linhas.append(json.dumps({
+                "turma_id": self.amostra.turma(rnd), "user_id": user_id, "pontuacao": rnd.randint(1, 5),
+                "comentario": "bench import " + " ".join(rnd.choices(PALAVRAS, k=8)),
+            }))
+        corpo = ("\n".join(linhas) + "\n").encode("utf-8")
+        return "POST /api/importacao/avaliacoes", "POST", "/api/importacao/avaliacoes?formato=ndjson", corpo
+
+    # (operação, peso): ~93% leituras, ~7% escritas
+    def operacoes(self):
+        return [
+            (self.op_raiz, 1), (self.op_professores, 2), (self.op_disciplinas, 2),
+            (self.op_disciplina, 5), (self.op_professor, 8),
+            (self.op_ranking, 5), (self.op_ranking_departamento, 2), (self.op_busca, 5),
+            (self.op_turma, 20), (self.op_turma_stream, 1), (self.op_turma_avaliacoes, 10),
+            (self.op_turma_usuario, 20), (self.op_login, 3),
+            (self.op_pool, 0.2), (self.op_cache, 0.2),
+            (self.op_comentar, 5), (self.op_excluir, 1.5), (self.op_cadastro, 0.5),
+            (self.op_importar_avaliacoes, 0.1),
+        ]
+
+    async def requisicao(self, client: httpx.AsyncClient, rnd: random.Random, gravar: bool):
+        operacoes, pesos = zip(*self.operacoes())
+        op = rnd.choices(operacoes, weights=pesos)[0](rnd) or self.op_turma(rnd)
+        nome, metodo, url, corpo = op
+
+        headers = {}
+        if metodo == "GET" and url in self.etags and rnd.random() < self.args.revalidacao:
+            headers["If-None-Match"] = self.etags[url]
+        if "{user_id}" in nome:
+            user_id = int(url.split("/")[4].split("?")[0])
+            headers["Authorization"] = f"Bearer {self.tokens[user_id]}"
+        if nome.startswith("POST /api/importacao"):
+            headers["Authorization"] = f"Bearer {self.token_admin}"
+
+        kwargs = {"headers": headers}
+        if isinstance(corpo, bytes):
+            kwargs["content"] = corpo
+        elif corpo is not None:
+            kwargs["json"] = corpo
+
+        inicio = time.perf_counter()
+        try:
+            r = await client.request(metodo, url, **kwargs)
+            status, conteudo = r.status_code, r.content
+        except httpx.HTTPError as e:
+            status, conteudo, r = type(e).__name__, b"", None
+        latencia = time.perf_counter() - inicio
+
+        if r is not None and "etag" in r.headers:
+            self.etags[url] = r.headers["etag"]
+        if nome == "POST /api/login" and status == 200:
+            resposta = r.json()
+            self.tokens[resposta["user"]["id"]] = resposta["token"]
+            # O token vai no cabeçalho Authorization; o cookie não é compartilhado
+            client.cookies.clear()
+        if nome.startswith("POST /api/turma") and status == 200:
+            self.lembrar_avaliacao(url, r.json())
+        if nome == "GET /api/turma/{id}/avaliacoes" and status == 200:
+            turma = int(url.split("/")[3])
+            for a in r.json()["avaliacoes"]:
+                if a["comentario"].startswith("bench ") and a["id"] not in self.excluidas:
+                    self.criadas[a["id"]] = (turma, a["user_id"])
+
+        if gravar:
+            self.latencias[nome].append(latencia)
+            self.status[nome][str(status)] += 1
+            self.bytes[nome] += len(conteudo)
+            db = tempo_db(r.headers.get("server-timing", "")) if r is not None else None
+            if db is not None:
+                self.tempos_db[nome].append(db)
+
+    async def login_admin(self, client: httpx.AsyncClient):
+        # Importações exigem administrador (pysrc/auth.py:exigir_admin)
+        if self.amostra.admin is None:
+            print("Sem administrador no banco: importações fora da carga")
+            return
+        r = await client.post("/api/login", json={"nome": self.amostra.admin, "senha": "senha"})
+        client.cookies.clear()
+        if r.status_code == 200:
+            self.token_admin = r.json()["token"]
+
+    def lembrar_avaliacao(self, url: str, resposta: dict):
+        if "id" in resposta:
+            _, _, _, turma, user_id, _ = url.split("/")
+            self.criadas[resposta["id"]] = (int(turma), int(user_id))
+
+    async def worker(self, client, n: int, aquecimento_ate: float, fim: float):
+        rnd = random.Random(self.args.seed * 1000 + n)
+        while (agora := time.perf_counter()) < fim:
+            await self.requisicao(client, rnd, gravar=agora >= aquecimento_ate)
+
+
+def percentil(valores: list[float], p: float) -> float:
+    if not valores:
+        return 0.0
+    ordenados = sorted(valores)
+    return ordenados[min(len(ordenados) - 1, max(0, round(p / 100 * len(ordenados)) - 1))]
+
+
+def resumo(carga: Carga, duracao: float) -> dict:
+    rotas = {}
+    for nome, latencias in sorted(carga.latencias.items()):
+        ms = [x * 1000 for x in latencias]
+        db = [x * 1000 for x in carga.tempos_db.get(nome, [])]
+        erros = sum(n for status, n in carga.status[nome].items() if status[0] not in "23")
+        rotas[nome] = {
+            "requisicoes": len(ms),
+            "rps": len(ms) / duracao,
+            "erros": erros,
+            "status": dict(carga.status[nome]),
+            "p50_ms": percentil(ms, 50),
+            "p95_ms": percentil(ms, 95),
+            "p99_ms": percentil(ms, 99),
+            "max_ms": max(ms),
+            "media_ms": sum(ms) / len(ms),
+            "db_media_ms": sum(db) / len(db) if db else None,
+            "db_p95_ms": percentil(db, 95) if db else None,
+            "bytes_medio": carga.bytes[nome] / len(ms),
+        }
+
+    todas = [x * 1000 for latencias in carga.latencias.values() for x in latencias]
+    total = {
+        "requisicoes": len(todas),
+        "rps": len(todas) / duracao,
+        "erros": sum(r["erros"] for r in rotas.values()),
+        "p50_ms": percentil(todas, 50),
+        "p95_ms": percentil(todas, 95),
+        "p99_ms": percentil(todas, 99),
+    }
+    return {"total": total, "rotas": rotas}
+
+
+def imprimir(resultado: dict, anterior: dict = None):
+    def delta(rota, campo, valor):
+        if anterior is None:
+            return ""
+        antes = (anterior["rotas"].get(rota) if rota else anterior["total"]) or {}
+        if not antes.get(campo):
+            return "        "
+        return f" ({(valor / antes[campo] - 1) * 100:+5.0f}%)"
+
+    print(f"{'rota':<52} {'req/s':>8} {'erros':>6} {'p50':>8} {'p95':>8} {'p99':>8} {'máx':>8} {'db':>8}")
+    for rota, r in resultado["rotas"].items():
+        db = f"{r['db_media_ms']:8.2f}" if r["db_media_ms"] is not None else f"{'-':>8}"
+        print(
+            f"{rota:<52} {r['rps']:8.1f} {r['erros']:6d} {r['p50_ms']:8.2f} "
+            f"{r['p95_ms']:8.2f}{delta(rota, 'p95_ms', r['p95_ms'])} {r['p99_ms']:8.2f} {r['max_ms']:8.2f} {db}"
+        )
+    t = resultado["total"]
+    print(
+        f"{'total':<52} {t['rps']:8.1f}{delta(None, 'rps', t['rps'])} {t['erros']:6d} {t['p50_ms']:8.2f} "
+        f"{t['p95_ms']:8.2f}{delta(None, 'p95_ms', t['p95_ms'])} {t['p99_ms']:8.2f}"
+    )
+    print("(latências e db em ms; db = tempo médio esperando o Postgres por requisição)")
+
+
+def commit_atual() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+
+async def executar(args) -> dict:
+    amostra = await carregar_amostra()
+    carga = Carga(amostra, args)
+
+    if args.url:
+        client = httpx.AsyncClient(base_url=args.url, timeout=60)
+        lifespan = None
+    else:
+        import index
+        client = httpx.AsyncClient(transport=httpx.ASGITransport(app=index.app), base_url="http://bench", timeout=60)
+        lifespan = index.app.router.lifespan_context(index.app)
+
+    async with client:
+        if lifespan is not None:
+            await lifespan.__aenter__()
+        try:
+            await carga.login_admin(client)
+            inicio = time.perf_counter()
+            aquecimento_ate = inicio + args.aquecimento
+            fim = aquecimento_ate + args.duracao
+            await asyncio.gather(*(
+                carga.worker(client, n, aquecimento_ate, fim) for n in range(args.concorrencia)
+            ))
+        finally:
+            if lifespan is not None:
+                await lifespan.__aexit__(None, None, None)
+
+    resultado = resumo(carga, args.duracao)
+    resultado["config"] = {
+        "commit": commit_atual(),
+        "inicio": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "url": args.url or "em processo",
+        "duracao": args.duracao,
+        "aquecimento": args.aquecimento,
+        "concorrencia": args.concorrencia,
+        "revalidacao": args.revalidacao,
+        "seed": args.seed,
+        "turmas": len(amostra.turmas),
+        "usuarios_amostra": len(amostra.usuarios),
+    }
+    return resultado
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python bench/carga.py")
+    parser.add_argument("--url", help="servidor alvo (padrão: aplicação no próprio processo)")
+    parser.add_argument("--duracao", type=float, default=30, help="segundos medidos (padrão 30)")
+    parser.add_argument("--aquecimento", type=float, default=3, help="segundos iniciais descartados (padrão 3)")
+    parser.add_argument("--concorrencia", type=int, default=32, help="clientes simultâneos (padrão 32)")
+    parser.add_argument("--revalidacao", type=float, default=0.3,
+                        help="fração dos GETs repetidos que mandam If-None-Match (padrão 0.3)")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--saida", help="arquivo JSON do resultado (padrão: bench/resultados/carga-<data>.json)")
+    parser.add_argument("--comparar", help="JSON de uma execução anterior para mostrar a variação")
+    args = parser.parse_args(argv)
+    args.execucao = f"{int(time.time())}-{os.getpid()}"
+
+    resultado = asyncio.run(executar(args))
+
+    anterior = None
+    if args.comparar:
+        with open(args.comparar, encoding="utf-8") as f:
+            anterior = json.load(f)
+    imprimir(resultado, anterior)
+
+    saida = args.saida
+    if saida is None:
+        os.makedirs(RESULTADOS_DIR, exist_ok=True)
+        saida = os.path.join(RESULTADOS_DIR, f"carga-{time.strftime('%Y%m%d-%H%M%S')}.json")
+    with open(saida, "w", encoding="utf-8") as f:
+        json.dump(resultado, f, indent=2, ensure_ascii=False)
+    print(f"resultado gravado em {saida}")
+
+
+if __name__ == "__main__":
+    main()
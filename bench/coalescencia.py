@@ -0,0 +1,90 @@
+# Thundering herd: N GETs idênticos e simultâneos (o link de um professor ou
+# de uma turma compartilhado) com e sem coalescência (pysrc/coalescer.py).
+#
+#   python bench/coalescencia.py [--rota professor] [--concorrencias 1,10,50,100,200,500]
+#
+# Roda a aplicação em processo (sem servidor HTTP), com o cache de leitura
+# desligado para que toda execução vá ao banco. Para cada concorrência mostra
+# o tempo da rajada, quantas consultas foram ao Postgres e quantas conexões
+# foram pedidas ao pool (as consultas incluem o aquecimento das conexões
+# novas que o pool abre durante a rajada). Com coalescência as consultas
+# ficam constantes.
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+os.environ["CACHE_MAX_SIZE"] = "0"
+
+import httpx
+
+import index
+from pysrc import coalescer
+from pysrc import connection
+from pysrc import metrics
+from pysrc import templates
+
+URLS = {
+    "professor": "/api/professor/{id}",
+    "turma": "/api/turma/{id}",
+    "disciplina": "/api/disciplina/{id}",
+    "professores": "/api/professores",
+}
+
+
+def contador(metrica) -> float:
+    return sum(
+        amostra.value for familia in metrica.collect() for amostra in familia.samples
+        if amostra.name.endswith("_count")
+    )
+
+
+async def rajada(cliente, url, n):
+    consultas, conexoes = contador(metrics.CONSULTA_DURACAO), contador(metrics.CONEXAO_DURACAO)
+    inicio = time.perf_counter()
+    respostas = await asyncio.gather(*(cliente.get(url) for _ in range(n)))
+    duracao = time.perf_counter() - inicio
+    if any(r.status_code != 200 for r in respostas):
+        raise SystemExit(f"{url}: status {sorted({r.status_code for r in respostas})}")
+    return (
+        duracao,
+        contador(metrics.CONSULTA_DURACAO) - consultas,
+        contador(metrics.CONEXAO_DURACAO) - conexoes,
+    )
+
+
+async def main_async(args):
+    templates.load_all()
+    await connection.open_pool()
+    try:
+        url = URLS[args.rota].format(id=args.id)
+        transporte = httpx.ASGITransport(app=index.app)
+        async with httpx.AsyncClient(transport=transporte, base_url="http://bench") as cliente:
+            await cliente.get(url)
+            print(f"{url}")
+            print(f"{'modo':>14} {'concorrência':>12} {'ms':>9} {'consultas':>10} {'conexões':>9}")
+            for modo, rotas in (("sem", frozenset()), ("coalescência", frozenset({args.rota}))):
+                coalescer.coalescer.rotas = rotas
+                for n in args.concorrencias:
+                    duracao, consultas, conexoes = await rajada(cliente, url, n)
+                    print(f"{modo:>14} {n:>12} {duracao * 1000:>9.1f} {consultas:>10.0f} {conexoes:>9.0f}")
+    finally:
+        await connection.close_pool()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python bench/coalescencia.py")
+    parser.add_argument("--rota", choices=sorted(URLS), default="professor")
+    parser.add_argument("--id", type=int, default=1)
+    parser.add_argument(
+        "--concorrencias", type=lambda s: [int(n) for n in s.split(",")], default=[1, 10, 50, 100, 200, 500]
+    )
+    args = parser.parse_args(argv)
+    asyncio.run(main_async(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,221 @@
+# Gerador determinístico de dados sintéticos em grande escala, carregados via COPY.
+#
+#   python bench/gerar_dados.py --limpar [--professores N] [--usuarios N] [--avaliacoes N] [--seed S]
+#
+# Ex.: --professores 10000 --usuarios 1000000 --avaliacoes 50000000
+#
+# O schema é criado/atualizado pelas migrations (pysrc/migrations.py). Com a
+# mesma seed e --limpar, gera exatamente os mesmos dados (e os mesmos ids).
+# A popularidade é enviesada (Zipf): poucas turmas concentram a maioria das
+# avaliações e poucos usuários escrevem a maioria delas; cada turma tem uma
+# "qualidade" que puxa as notas. As datas das avaliações se espalham pelos
+# últimos --semestres semestres (uma partição de Avaliacoes por semestre).
+import argparse
+import asyncio
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+from itertools import accumulate
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pysrc import connection
+from pysrc import migrations
+from pysrc import models
+from pysrc import particoes
+
+# Avaliações por COPY: cada COPY é um comando, então os triggers de agregados
+# rodam uma vez por lote
+LOTE = 500_000
+
+# Índices secundários de Avaliacoes (migration 0009). Com
+# --recriar-indices são removidos antes da carga e criados de novo no final,
+# o que é bem mais rápido que atualizá-los linha a linha.
+INDICES_AVALIACOES = {
+    "Avaliacoes_turma_id_id": "CREATE INDEX Avaliacoes_turma_id_id ON Avaliacoes (turma_id, id)",
+    "Avaliacoes_comentario_tsv": "CREATE INDEX Avaliacoes_comentario_tsv ON Avaliacoes USING GIN (comentario_tsv)",
+}
+
+PALAVRAS = (
+    "professor aula prova difícil fácil ótimo péssimo explica bem mal matéria trabalhos listas "
+    "exercícios cobra presença didática excelente horrível recomendo não muito pouco atencioso "
+    "monitor projeto cálculo programação algoritmos banco dados estatística demais provas notas "
+    "média reprovação aprova justo injusto chato legal divertido carga horária slides livro quadro "
+    "dúvidas responde email atrasado pontual organizado bagunçado avaliação semestre turma conteúdo "
+    "extenso prático teórico laboratório código paciência calmo rigoroso flexível entrega prazo "
+    "ajuda ensina aprendi bastante nada tudo sempre nunca online presencial material apostila "
+    "resumo revisão surpresa gabarito correção nota final substitutiva"
+).split()
+
+CURSOS = ["Ciência da Computação", "Engenharia de Computação", "Matemática", "Estatística", "Física"]
+
+
+def zipf_cum_weights(n: int, s: float) -> list[float]:
+    return list(accumulate(1 / (k ** s) for k in range(1, n + 1)))
+
+
+def copy_text(value) -> str:
+    # Formato texto do COPY: os dados gerados não têm tab, quebra de linha nem barra
+    return "\\N" if value is None else str(value)
+
+
+async def copy_lines(conn, sql: str, linhas):
+    async with conn.cursor() as curr:
+        async with curr.copy(sql) as copy:
+            buffer = []
+            for linha in linhas:
+                buffer.append("\t".join(map(copy_text, linha)) + "\n")
+                if len(buffer) >= 10_000:
+                    await copy.write("".join(buffer))
+                    buffer = []
+            if buffer:
+                await copy.write("".join(buffer))
+
+
+async def max_id(conn, tabela: str) -> int:
+    async with conn.cursor() as curr:
+        await curr.execute(f"SELECT COALESCE(MAX(id), 0) FROM {tabela}")
+        return (await curr.fetchone())[0]
+
+
+def etapa(nome: str, inicio: float, qtd: int):
+    dt = time.perf_counter() - inicio
+    print(f"{nome:>14}: {qtd:>11,} linhas em {dt:7.1f}s ({qtd / max(dt, 1e-9):>12,.0f}/s)")
+
+
+async def gerar(args):
+    rnd = random.Random(args.seed)
+    async with connection.connect() as conn:
+        await migrations.aplicar(conn)
+
+        if args.limpar:
+            await conn.execute(
+                "TRUNCATE Denuncias, Avaliacoes, Users, Turmas, Disciplinas, Professores, Departamentos "
+                "RESTART IDENTITY CASCADE"
+            )
+
+        inicio = time.perf_counter()
+        base = await max_id(conn, "Departamentos")
+        await copy_lines(conn, "COPY Departamentos (id, nome) FROM STDIN", (
+            (base + i, f"Departamento {base + i}") for i in range(1, args.departamentos + 1)
+        ))
+        departamentos = list(range(base + 1, base + args.departamentos + 1))
+        etapa("departamentos", inicio, args.departamentos)
+
+        inicio = time.perf_counter()
+        base = await max_id(conn, "Professores")
+        await copy_lines(conn, "COPY Professores (nome, departamento_id) FROM STDIN", (
+            (f"Professor {i}", rnd.choice(departamentos)) for i in range(1, args.professores + 1)
+        ))
+        professores = range(base + 1, base + args.professores + 1)
+        etapa("professores", inicio, args.professores)
+
+        inicio = time.perf_counter()
+        base = await max_id(conn, "Disciplinas")
+        await copy_lines(conn, "COPY Disciplinas (nome, departamento_id) FROM STDIN", (
+            (f"Disciplina {i}", rnd.choice(departamentos)) for i in range(1, args.disciplinas + 1)
+        ))
+        disciplinas = range(base + 1, base + args.disciplinas + 1)
+        etapa("disciplinas", inicio, args.disciplinas)
+
+        inicio = time.perf_counter()
+        base = await max_id(conn, "Turmas")
+        await copy_lines(conn, "COPY Turmas (numero, professor_id, disciplina_id) FROM STDIN", (
+            (f"{i % 20 + 1:02d}", rnd.choice(professores), rnd.choice(disciplinas))
+            for i in range(args.turmas)
+        ))
+        turmas = list(range(base + 1, base + args.turmas + 1))
+        etapa("turmas", inicio, args.turmas)
+
+        inicio = time.perf_counter()
+        base = await max_id(conn, "Users")
+        await copy_lines(conn, "COPY Users (email, nome, matricula, curso, senha, is_admin) FROM STDIN", (
+            (f"aluno{base + i}@example.com", f"aluno-{base + i}", f"{20_000_000 + base + i}",
+             rnd.choice(CURSOS), "senha", i % 1000 == 0)
+            for i in range(1, args.usuarios + 1)
+        ))
+        usuarios = list(range(base + 1, base + args.usuarios + 1))
+        etapa("usuarios", inicio, args.usuarios)
+
+        # Popularidade: a ordem de turmas/usuários é embaralhada para que os
+        # "populares" não sejam simplesmente os primeiros ids
+        rnd.shuffle(turmas)
+        rnd.shuffle(usuarios)
+        pesos_turmas = zipf_cum_weights(len(turmas), args.zipf_turmas)
+        pesos_usuarios = zipf_cum_weights(len(usuarios), args.zipf_usuarios)
+        qualidade = {t: rnd.uniform(1.5, 4.8) for t in turmas}
+        comentarios = [
+            " ".join(rnd.choices(PALAVRAS, k=rnd.randint(4, 30))) for _ in range(20_000)
+        ]
+
+        if args.recriar_indices:
+            for nome in INDICES_AVALIACOES:
+                await conn.execute(f"DROP INDEX IF EXISTS {nome}")
+
+        agora = datetime.now(timezone.utc)
+        primeiro_semestre = models.inicio_tendencia(args.semestres, agora)
+        janela = (agora - primeiro_semestre).total_seconds()
+        await particoes.criar(conn, primeiro_semestre, agora)
+
+        inicio = time.perf_counter()
+        restantes = args.avaliacoes
+        while restantes > 0:
+            n = min(LOTE, restantes)
+            lote_turmas = rnd.choices(turmas, cum_weights=pesos_turmas, k=n)
+            lote_usuarios = rnd.choices(usuarios, cum_weights=pesos_usuarios, k=n)
+            lote_comentarios = rnd.choices(comentarios, k=n)
+            copy_sql = "COPY Avaliacoes (pontuacao, comentario, user_id, turma_id, criado_em) FROM STDIN"
+            await copy_lines(conn, copy_sql, (
+                (min(5, max(1, round(rnd.gauss(qualidade[t], 1.0)))), c, u, t,
+                 (primeiro_semestre + timedelta(seconds=rnd.random() * janela)).isoformat())
+                for t, u, c in zip(lote_turmas, lote_usuarios, lote_comentarios)
+            ))
+            restantes -= n
+            feitas = args.avaliacoes - restantes
+            print(f"    {feitas:>11,} / {args.avaliacoes:,} avaliações", end="\r", flush=True)
+        etapa("avaliacoes", inicio, args.avaliacoes)
+
+        if args.recriar_indices:
+            inicio = time.perf_counter()
+            await conn.execute("SET maintenance_work_mem = '512MB'")
+            for sql in INDICES_AVALIACOES.values():
+                await conn.execute(sql)
+            print(f"índices recriados em {time.perf_counter() - inicio:.1f}s")
+
+        inicio = time.perf_counter()
+        await conn.execute("CALL Atualizar_Professores_Ranking()")
+        await conn.execute("VACUUM ANALYZE")
+        print(f"ranking + VACUUM ANALYZE em {time.perf_counter() - inicio:.1f}s")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python bench/gerar_dados.py")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--limpar", action="store_true", help="apaga os dados existentes (TRUNCATE ... RESTART IDENTITY)")
+    parser.add_argument(
+        "--recriar-indices", action="store_true",
+        help="remove os índices secundários de Avaliacoes durante a carga e os recria no final"
+    )
+    parser.add_argument("--departamentos", type=int, default=20)
+    parser.add_argument("--professores", type=int, default=1_000)
+    parser.add_argument("--disciplinas", type=int, default=None, help="padrão: igual a --professores")
+    parser.add_argument("--turmas", type=int, default=None, help="padrão: 4 por professor")
+    parser.add_argument("--usuarios", type=int, default=100_000)
+    parser.add_argument("--avaliacoes", type=int, default=1_000_000)
+    parser.add_argument("--semestres", type=int, default=8, help="semestres (até o atual) pelos quais as avaliações se espalham")
+    # Expoentes da distribuição de popularidade (maior = mais concentrada)
+    parser.add_argument("--zipf-turmas", type=float, default=0.8)
+    parser.add_argument("--zipf-usuarios", type=float, default=0.6)
+    args = parser.parse_args(argv)
+    if args.disciplinas is None:
+        args.disciplinas = args.professores
+    if args.turmas is None:
+        args.turmas = 4 * args.professores
+
+    asyncio.run(gerar(args))
+
+
+if __name__ == "__main__":
+    main()
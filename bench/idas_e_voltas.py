@@ -0,0 +1,93 @@
+# Idas e voltas ao Postgres por rota, contadas pela aplicação (pysrc/metrics.py,
+# cabeçalho Server-Timing: db;desc="N consultas, M idas"), com o máximo
+# esperado para cada uma. Sai com status 1 se alguma rota passar do máximo.
+#
+#   python bench/idas_e_voltas.py
+#
+# Roda a aplicação no próprio processo, sem o cache de leitura, a
+# coalescência e as páginas pré-renderizadas, para que toda requisição vá ao
+# banco. Gere os dados antes com bench/gerar_dados.py.
+import asyncio
+import os
+import re
+import sys
+
+os.environ["CACHE_MAX_SIZE"] = "0"
+os.environ["COALESCER_ROTAS"] = ""
+os.environ["PRERENDER_DIR"] = ""
+os.environ.setdefault("EVENTOS", "0")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import httpx
+
+import index
+from pysrc import auth
+from pysrc import connection
+
+_IDAS = re.compile(r'db;[^,]*desc="(\d+) consultas, (\d+) idas"')
+
+
+async def ids(conn):
+    async with conn.cursor() as curr:
+        await curr.execute("SELECT turma_id FROM Turmas_Avaliacoes_Stats ORDER BY qtd_avaliacoes DESC LIMIT 1")
+        (turma_id,) = await curr.fetchone()
+        await curr.execute("SELECT professor_id, disciplina_id FROM Turmas WHERE id = %s", (turma_id,))
+        professor_id, disciplina_id = await curr.fetchone()
+        await curr.execute("SELECT MIN(id) FROM Users")
+        (user_id,) = await curr.fetchone()
+    return turma_id, professor_id, disciplina_id, user_id
+
+
+def casos(turma_id, professor_id, disciplina_id, user_id):
+    # (rota, url, máximo de idas); "304" repete a anterior com If-None-Match
+    return [
+        # Carimbo de versão no mesmo pipeline (ou na mesma consulta) que os dados
+        ("GET /api/turma/{id}", f"/api/turma/{turma_id}", 1),
+        ("GET /api/turma/{id} 304", f"/api/turma/{turma_id}", 1),
+        ("GET /api/turma/{id}?before_id", f"/api/turma/{turma_id}?before_id=2000000000", 1),
+        ("GET /api/turma/{id}/{user_id}", f"/api/turma/{turma_id}/{user_id}", 1),
+        ("GET /api/turma/{id}/{user_id} 304", f"/api/turma/{turma_id}/{user_id}", 1),
+        ("GET /api/turma/{id}/avaliacoes", f"/api/turma/{turma_id}/avaliacoes", 1),
+        ("GET /api/turma/{id}/avaliacoes 304", f"/api/turma/{turma_id}/avaliacoes", 1),
+        ("GET /api/professor/{id}", f"/api/professor/{professor_id}", 1),
+        ("GET /api/disciplina/{id}", f"/api/disciplina/{disciplina_id}", 1),
+        ("GET /api/professores", "/api/professores", 1),
+    ]
+
+
+async def main_async():
+    async with index.app.router.lifespan_context(index.app):
+        async with connection.connect() as conn:
+            turma_id, professor_id, disciplina_id, user_id = await ids(conn)
+        token, _ = auth.emitir(user_id, False)
+
+        transporte = httpx.ASGITransport(app=index.app)
+        async with httpx.AsyncClient(
+            transport=transporte, base_url="http://bench", headers={"Authorization": f"Bearer {token}"}
+        ) as cliente:
+            falhas = 0
+            etag = None
+            print(f"{'rota':<40} {'status':>6} {'consultas':>9} {'idas':>5} {'máx':>4}")
+            for rota, url, maximo in casos(turma_id, professor_id, disciplina_id, user_id):
+                headers = {"If-None-Match": etag} if rota.endswith(" 304") else {}
+                r = await cliente.get(url, headers=headers)
+                etag = r.headers.get("etag")
+                m = _IDAS.search(r.headers.get("server-timing", ""))
+                if m is None:
+                    raise SystemExit(f"{rota}: Server-Timing sem a contagem de idas")
+                consultas, idas = int(m.group(1)), int(m.group(2))
+                ok = r.status_code in (200, 304) and idas <= maximo
+                falhas += not ok
+                print(f"{rota:<40} {r.status_code:>6} {consultas:>9} {idas:>5} {maximo:>4}{'' if ok else '  FALHOU'}")
+    return falhas
+
+
+def main():
+    falhas = asyncio.run(main_async())
+    if falhas:
+        raise SystemExit(f"{falhas} rota(s) acima do máximo de idas e voltas")
+
+
+if __name__ == "__main__":
+    main()
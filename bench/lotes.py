@@ -0,0 +1,108 @@
+# Vazão de avaliações sob pico: um INSERT por requisição (caminho padrão de
+# POST /api/turma/{id}/{user_id}/comentario) x gravação em lotes (pysrc/batching.py).
+#
+#   python bench/lotes.py [--avaliacoes 20000] [--concorrencia 500] [--max-itens 200] [--max-espera-ms 5]
+#
+# Cada modo dispara --concorrencia "alunos" simultâneos enviando avaliações até
+# completar --avaliacoes, usando o pool como a aplicação (POSTGRES_POOL_MAX).
+# As avaliações criadas (comentário "bench lote ...") são apagadas no final.
+# Gere os dados antes com bench/gerar_dados.py.
+import argparse
+import asyncio
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pysrc import batching
+from pysrc import connection
+from pysrc import models
+
+
+async def amostra(conn):
+    async with conn.cursor() as curr:
+        await curr.execute("SELECT id FROM Turmas ORDER BY random() LIMIT 2000")
+        turmas = [row[0] for row in await curr.fetchall()]
+        await curr.execute("SELECT id FROM Users ORDER BY random() LIMIT 10000")
+        usuarios = [row[0] for row in await curr.fetchall()]
+    if not (turmas and usuarios):
+        raise SystemExit("Banco sem dados: rode antes python bench/gerar_dados.py --limpar")
+    return turmas, usuarios
+
+
+async def direto(turma_id, avaliacao):
+    async with connection.connect() as conn:
+        return await models.add_avaliacao_to_turma(conn, turma_id, avaliacao)
+
+
+def percentil(valores, p):
+    valores = sorted(valores)
+    return valores[min(len(valores) - 1, int(len(valores) * p / 100))]
+
+
+async def rodar(nome, enviar, args, turmas, usuarios):
+    rnd = random.Random(args.seed)
+    pendentes = iter(range(args.avaliacoes))
+    latencias = []
+
+    async def aluno():
+        for n in pendentes:
+            avaliacao = models.AvaliacaoIn(
+                user_id=rnd.choice(usuarios), comentario=f"bench lote {n}", pontuacao=rnd.randint(1, 5)
+            )
+            inicio = time.perf_counter()
+            await enviar(rnd.choice(turmas), avaliacao)
+            latencias.append(time.perf_counter() - inicio)
+
+    inicio = time.perf_counter()
+    await asyncio.gather(*(aluno() for _ in range(args.concorrencia)))
+    duracao = time.perf_counter() - inicio
+
+    ms = [x * 1000 for x in latencias]
+    print(f"{nome:>20} {len(ms) / duracao:>12,.0f} {percentil(ms, 50):>9.1f} {percentil(ms, 99):>9.1f}", end="")
+
+
+async def main_async(args):
+    await connection.open_pool()
+    try:
+        async with connection.connect() as conn:
+            turmas, usuarios = await amostra(conn)
+
+        print(f"{'modo':>20} {'avaliações/s':>12} {'p50 ms':>9} {'p99 ms':>9}")
+        await rodar("um INSERT por vez", direto, args, turmas, usuarios)
+        print()
+
+        for durabilidade, synchronous_commit in (("sincrona", True), ("assincrona", False)):
+            lotes = batching.Lotes(
+                max_itens=args.max_itens, max_espera=args.max_espera_ms / 1000,
+                tamanho_fila=args.fila, timeout_fila=60, synchronous_commit=synchronous_commit,
+            )
+            lotes.start()
+            try:
+                await rodar(f"lotes ({durabilidade})", lotes.add_avaliacao, args, turmas, usuarios)
+            finally:
+                await lotes.stop()
+            stats = lotes.stats()
+            print(f"   {stats['lotes']} lotes, média {stats['media_por_lote']:.0f} por lote")
+    finally:
+        async with connection.connect() as conn:
+            await conn.execute("DELETE FROM Avaliacoes WHERE comentario LIKE 'bench lote %'")
+        await connection.close_pool()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python bench/lotes.py")
+    parser.add_argument("--avaliacoes", type=int, default=20_000)
+    parser.add_argument("--concorrencia", type=int, default=500)
+    parser.add_argument("--max-itens", type=int, default=200)
+    parser.add_argument("--max-espera-ms", type=float, default=5)
+    parser.add_argument("--fila", type=int, default=5000)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args(argv)
+    asyncio.run(main_async(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+# Vazão da moderação: excluir avaliações denunciadas uma por requisição
+# (DELETE /api/turma/{id}/{user_id}/comentario/{id}, o botão de cada
+# comentário) x em lotes (POST /api/moderacao).
+#
+#   python bench/moderacao.py [--avaliacoes 5000] [--concorrencia 20] [--lote 1000]
+#
+# Roda a aplicação em processo (sem servidor HTTP), com uma sessão de admin.
+# Para cada modo cria --avaliacoes avaliações (comentário "bench moderacao
+# ...") com uma denúncia cada e mede o tempo para excluir todas. O que sobrar
+# é apagado no final. Gere os dados antes com bench/gerar_dados.py.
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import httpx
+
+import index
+from pysrc import auth
+from pysrc import connection
+from pysrc import templates
+
+
+async def criar(conn, n):
+    # Avaliações espalhadas pelas turmas, cada uma denunciada por outro usuário
+    async with conn.cursor() as curr:
+        await curr.execute("""
+            WITH Novas AS (
+                INSERT INTO Avaliacoes (user_id, turma_id, comentario, pontuacao)
+                SELECT (SELECT MIN(id) FROM Users), T.id, 'bench moderacao ' || n, 1 + n %% 5
+                FROM generate_series(1, %s) AS n
+                INNER JOIN (
+                    SELECT id, ROW_NUMBER() OVER (ORDER BY id) - 1 AS i, COUNT(*) OVER () AS total FROM Turmas
+                ) T ON T.i = n %% T.total
+                RETURNING id, turma_id
+            ), Denunciadas AS (
+                INSERT INTO Denuncias (user_id, avaliacao_id)
+                SELECT (SELECT MAX(id) FROM Users), id FROM Novas
+            )
+            SELECT id, turma_id FROM Novas ORDER BY id
+        """, (n,))
+        return await curr.fetchall()
+
+
+async def limpar(conn):
+    await conn.execute("""
+        WITH Bench AS (SELECT id FROM Avaliacoes WHERE comentario LIKE 'bench moderacao %'),
+        D AS (DELETE FROM Denuncias WHERE avaliacao_id IN (SELECT id FROM Bench))
+        DELETE FROM Avaliacoes WHERE id IN (SELECT id FROM Bench)
+    """)
+
+
+async def uma_por_vez(cliente, user_id, avaliacoes, args):
+    pendentes = iter(avaliacoes)
+
+    async def moderador():
+        for avaliacao_id, turma_id in pendentes:
+            r = await cliente.delete(f"/api/turma/{turma_id}/{user_id}/comentario/{avaliacao_id}")
+            if r.status_code != 200:
+                raise SystemExit(f"DELETE {avaliacao_id}: status {r.status_code}")
+
+    await asyncio.gather(*(moderador() for _ in range(args.concorrencia)))
+    return len(avaliacoes)
+
+
+async def em_lotes(cliente, user_id, avaliacoes, args):
+    ids = [avaliacao_id for avaliacao_id, _ in avaliacoes]
+    excluidas = 0
+    for i in range(0, len(ids), args.lote):
+        r = await cliente.post("/api/moderacao", json={"acao": "excluir", "avaliacao_ids": ids[i:i + args.lote]})
+        if r.status_code != 200:
+            raise SystemExit(f"POST /api/moderacao: status {r.status_code}")
+        excluidas += r.json()["avaliacoes"]
+    return excluidas
+
+
+async def main_async(args):
+    templates.load_all()
+    await connection.open_pool()
+    try:
+        async with connection.connect() as conn:
+            async with conn.cursor() as curr:
+                await curr.execute("SELECT MIN(id) FROM Users")
+                (user_id,) = await curr.fetchone()
+        if user_id is None:
+            raise SystemExit("Banco sem dados: rode antes python bench/gerar_dados.py --limpar")
+
+        token, _ = auth.emitir(user_id, True)
+        transporte = httpx.ASGITransport(app=index.app)
+        async with httpx.AsyncClient(
+            transport=transporte, base_url="http://bench", headers={"Authorization": f"Bearer {token}"}
+        ) as cliente:
+            print(f"{'modo':>24} {'avaliações':>10} {'s':>8} {'avaliações/s':>13}")
+            for nome, moderar in ((f"uma por vez (x{args.concorrencia})", uma_por_vez), (f"lotes de {args.lote}", em_lotes)):
+                async with connection.connect() as conn:
+                    avaliacoes = await criar(conn, args.avaliacoes)
+                inicio = time.perf_counter()
+                excluidas = await moderar(cliente, user_id, avaliacoes, args)
+                duracao = time.perf_counter() - inicio
+                print(f"{nome:>24} {excluidas:>10} {duracao:>8.2f} {excluidas / duracao:>13,.0f}")
+    finally:
+        async with connection.connect() as conn:
+            await limpar(conn)
+        await connection.close_pool()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python bench/moderacao.py")
+    parser.add_argument("--avaliacoes", type=int, default=5000)
+    parser.add_argument("--concorrencia", type=int, default=20)
+    parser.add_argument("--lote", type=int, default=1000)
+    args = parser.parse_args(argv)
+    asyncio.run(main_async(args))
+
+
+if __name__ == "__main__":
+    main()
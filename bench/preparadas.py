@@ -0,0 +1,88 @@
+# Latência das consultas quentes de models com e sem prepared statements
+# (pysrc/preparadas.py), numa única conexão.
+#
+#   python bench/preparadas.py [--repeticoes 2000]
+#
+# "texto": prepare=False, o Postgres analisa e planeja o SQL a cada execução.
+# "preparada": prepare=True com os ints como int8, como preparadas.executar.
+# Usa ids reais do banco (gere os dados antes com bench/gerar_dados.py).
+import argparse
+import asyncio
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import psycopg
+
+from pysrc import connection
+from pysrc import models
+from pysrc import preparadas
+
+
+async def amostra(conn):
+    async with conn.cursor() as curr:
+        await curr.execute("SELECT id, professor_id, disciplina_id FROM Turmas ORDER BY random() LIMIT 200")
+        turmas = await curr.fetchall()
+        await curr.execute("SELECT id, nome FROM Users ORDER BY random() LIMIT 200")
+        usuarios = await curr.fetchall()
+    if not (turmas and usuarios):
+        raise SystemExit("Banco sem dados: rode antes python bench/gerar_dados.py --limpar")
+    return turmas, usuarios
+
+
+def cenarios(turmas, usuarios):
+    rnd = random.Random(42)
+    turma = lambda: rnd.choice(turmas)
+    usuario = lambda: rnd.choice(usuarios)
+    return [
+        (models._VERSAO["turma"], lambda: (turma()[0],)),
+        (models._TURMA_RESUMO, lambda: (turma()[0],)),
+        (models._TURMA_AVALIACOES, lambda: (turma()[0], models.AVALIACOES_POR_PAGINA + 1)),
+        (models._PROFESSOR_INFO, lambda: (turma()[1],) * 2),
+        (models._DISCIPLINA_INFO, lambda: (turma()[2],)),
+        (models._RANKING, lambda: (0, 20)),
+        (models._USER_POR_ID, lambda: (usuario()[0],)),
+        (models._USER_POR_NOME, lambda: (usuario()[1],)),
+    ]
+
+
+def percentil(valores, p):
+    valores = sorted(valores)
+    return valores[min(len(valores) - 1, int(len(valores) * p / 100))]
+
+
+async def medir(conn, consulta, gerar, repeticoes, preparar):
+    latencias = []
+    async with conn.cursor() as curr:
+        for _ in range(repeticoes):
+            params = [preparadas._param(valor) for valor in gerar()]
+            inicio = time.perf_counter()
+            await curr.execute(consulta.sql, params, prepare=preparar)
+            await curr.fetchall()
+            latencias.append((time.perf_counter() - inicio) * 1e6)
+    return latencias
+
+
+async def main_async(args):
+    # Conexão própria, fora do pool: sem o aquecimento do configure
+    async with await psycopg.AsyncConnection.connect(connection.get_conninfo(), autocommit=True) as conn:
+        turmas, usuarios = await amostra(conn)
+        print(f"{'consulta':>18} {'modo':>10} {'p50 µs':>9} {'p99 µs':>9}")
+        for consulta, gerar in cenarios(turmas, usuarios):
+            for modo, preparar in (("texto", False), ("preparada", True)):
+                latencias = await medir(conn, consulta, gerar, args.repeticoes, preparar)
+                print(f"{consulta.nome:>18} {modo:>10} {percentil(latencias, 50):>9.0f} {percentil(latencias, 99):>9.0f}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python bench/preparadas.py")
+    parser.add_argument("--repeticoes", type=int, default=2000)
+    args = parser.parse_args(argv)
+    asyncio.run(main_async(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+# Réplica de leitura local por streaming replication, para testar
+# POSTGRES_REPLICAS sem infraestrutura extra.
+#
+#   python bench/replica_local.py [--dir /tmp/replica] [--porta 5433] [--atraso 2s]
+#   python bench/replica_local.py --parar
+#
+# Copia o primário (POSTGRES_* como a aplicação) com pg_basebackup -R e sobe o
+# standby na porta indicada. --atraso usa recovery_min_apply_delay: a réplica
+# recebe o WAL na hora mas só aplica depois do atraso, simulando uma réplica
+# atrasada (read-your-writes, POSTGRES_REPLICA_MAX_LAG). O primário precisa de
+# wal_level=replica (padrão) e de uma linha "replication" no pg_hba.conf.
+# Rode com o mesmo usuário do sistema que roda o Postgres.
+import argparse
+import os
+import shutil
+import subprocess
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pysrc import connection
+
+
+def binario(args, nome):
+    if args.bin:
+        return os.path.join(args.bin, nome)
+    return shutil.which(nome) or nome
+
+
+def parar(args):
+    subprocess.run([binario(args, "pg_ctl"), "-D", args.dir, "-m", "fast", "stop"], check=True)
+
+
+def criar(args):
+    if os.path.exists(args.dir):
+        raise SystemExit(f"{args.dir} já existe: use --parar e apague o diretório para recriar")
+
+    subprocess.run([
+        binario(args, "pg_basebackup"), "-d", " ".join(connection.get_conninfo().split()),
+        "-D", args.dir, "-R", "-X", "stream", "-c", "fast",
+    ], check=True)
+
+    with open(os.path.join(args.dir, "postgresql.auto.conf"), "a") as f:
+        f.write(f"port = {args.porta}\n")
+        f.write("hot_standby = on\n")
+        # Sem isso as consultas longas na réplica são canceladas por conflito
+        # com o WAL que chega do primário
+        f.write("hot_standby_feedback = on\n")
+        if args.atraso:
+            f.write(f"recovery_min_apply_delay = '{args.atraso}'\n")
+
+    subprocess.run([
+        binario(args, "pg_ctl"), "-D", args.dir, "-l", os.path.join(args.dir, "replica.log"),
+        "-o", f"-p {args.porta} -k /tmp", "-w", "start",
+    ], check=True)
+    print(f'POSTGRES_REPLICAS="port={args.porta}"')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python bench/replica_local.py")
+    parser.add_argument("--dir", default="/tmp/replica_trabalho_bd")
+    parser.add_argument("--porta", type=int, default=5433)
+    parser.add_argument("--atraso", help="recovery_min_apply_delay, ex.: 2s")
+    parser.add_argument("--bin", help="diretório dos binários do Postgres (pg_config --bindir)")
+    parser.add_argument("--parar", action="store_true")
+    args = parser.parse_args(argv)
+    if args.parar:
+        parar(args)
+    else:
+        criar(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,233 @@
+# Custo de montar e serializar as respostas JSON, sem banco: o caminho antigo
+# (um modelo pydantic por linha, validação do response_model pelo FastAPI,
+# jsonable_encoder e json da stdlib) x o atual (dataclasses com __slots__
+# montadas das tuplas do cursor e ORJSONResponse).
+#
+#   python bench/serializacao.py [--repeticoes 200]
+#
+# Para cada resposta mostra o melhor tempo, o pico de memória alocada
+# (tracemalloc) e o tamanho do corpo.
+import argparse
+import asyncio
+import os
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timezone
+from typing import List, Optional
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fastapi.responses import JSONResponse, ORJSONResponse
+from fastapi.routing import serialize_response
+from fastapi.utils import create_response_field
+from pydantic import BaseModel
+
+from pysrc import models
+
+
+# Modelos de resposta como eram antes (pydantic)
+class AvaliacaoAntiga(BaseModel):
+    id: int
+    user_id: int
+    user_nome: str
+    comentario: str
+    pontuacao: int
+
+
+class AvaliacoesPageAntiga(BaseModel):
+    avaliacoes: List[AvaliacaoAntiga]
+    proximo_before_id: Optional[int]
+
+
+class RankingItemAntigo(BaseModel):
+    posicao: int
+    professor_id: int
+    professor_nome: str
+    departamento_id: Optional[int]
+    departamento_nome: Optional[str]
+    qtd_avaliacoes: int
+    media: float
+    score: float
+
+
+class RankingAntigo(BaseModel):
+    atualizado_em: Optional[datetime]
+    idade_segundos: Optional[float]
+    professores: List[RankingItemAntigo]
+
+
+class BuscaItemAntigo(BaseModel):
+    id: int
+    turma_id: int
+    professor_id: int
+    professor_nome: str
+    disciplina_id: int
+    disciplina_nome: str
+    user_nome: str
+    comentario: str
+    pontuacao: int
+    rank: float
+
+
+class BuscaResultadoAntigo(BaseModel):
+    resultados: List[BuscaItemAntigo]
+    proximo_before_rank: Optional[float]
+    proximo_before_id: Optional[int]
+    limitado: bool
+
+
+class UserInfoAntigo(BaseModel):
+    id: int
+    email: str
+    nome: str
+    matricula: str
+    curso: str
+    is_admin: bool
+
+
+# Linhas como chegam do cursor, na ordem das colunas das consultas de models
+def linhas_avaliacoes(n):
+    return [
+        (1_000_000 - i, i % 97, f"aluno-{i % 97}", f"Comentário número {i} sobre a turma, com acentuação", i % 5 + 1)
+        for i in range(n)
+    ]
+
+
+def linhas_ranking(n):
+    return [
+        (i + 1, i, f"Professor {i}", i % 20, f"Departamento {i % 20}", 100 + i, 4.5 - i / 100, 4.4 - i / 100)
+        for i in range(n)
+    ]
+
+
+def linhas_busca(n):
+    return [
+        (500_000 - i, i, i % 300, f"Professor {i % 300}", i % 80, f"Disciplina {i % 80}",
+         f"aluno-{i}", f"Comentário {i}: professor bom, provas justas", i % 5 + 1, 0.5 - i / 1000)
+        for i in range(n)
+    ]
+
+
+AGORA = datetime.now(timezone.utc)
+USUARIO = (1, "aluno@usp.br", "aluno-1", "12345678", "Computação", False, "senha")
+
+
+# Caminho antigo: o que models e o FastAPI faziam a cada resposta
+def antigo_avaliacoes(rows):
+    page = AvaliacoesPageAntiga(avaliacoes=[
+        AvaliacaoAntiga(id=a_id, user_id=u_id, user_nome=u_nome, pontuacao=pontuacao, comentario=comentario)
+        for a_id, u_id, u_nome, comentario, pontuacao in rows
+    ], proximo_before_id=None)
+    return AvaliacoesPageAntiga, page
+
+
+def antigo_ranking(rows):
+    ranking = RankingAntigo(atualizado_em=AGORA, idade_segundos=12.5, professores=[
+        RankingItemAntigo(
+            posicao=posicao, professor_id=p_id, professor_nome=p_nome,
+            departamento_id=dep_id, departamento_nome=dep_nome,
+            qtd_avaliacoes=qtd_a, media=media, score=score
+        )
+        for posicao, p_id, p_nome, dep_id, dep_nome, qtd_a, media, score in rows
+    ])
+    return RankingAntigo, ranking
+
+
+def antigo_busca(rows):
+    resultado = BuscaResultadoAntigo(resultados=[
+        BuscaItemAntigo(
+            id=a_id, turma_id=t_id, professor_id=p_id, professor_nome=p_nome,
+            disciplina_id=d_id, disciplina_nome=d_nome, user_nome=u_nome,
+            comentario=comentario, pontuacao=pontuacao, rank=rank
+        )
+        for a_id, t_id, p_id, p_nome, d_id, d_nome, u_nome, comentario, pontuacao, rank in rows
+    ], proximo_before_rank=None, proximo_before_id=None, limitado=False)
+    return BuscaResultadoAntigo, resultado
+
+
+def antigo_usuario(row):
+    user_id, email, nome, matricula, curso, is_admin, _ = row
+    user = UserInfoAntigo(id=user_id, email=email, nome=nome, matricula=matricula, curso=curso, is_admin=is_admin)
+    return List[UserInfoAntigo], [user]
+
+
+CAMPOS = {}
+
+
+async def antigo(montar, rows) -> bytes:
+    tipo, conteudo = montar(rows)
+    if tipo not in CAMPOS:
+        CAMPOS[tipo] = create_response_field(name="resposta", type_=tipo)
+    dados = await serialize_response(field=CAMPOS[tipo], response_content=conteudo)
+    return JSONResponse(dados).body
+
+
+# Caminho atual: args_row monta as dataclasses direto das tuplas
+def novo_avaliacoes(rows):
+    return models.AvaliacoesPage(avaliacoes=[models.Avaliacao(*row) for row in rows], proximo_before_id=None)
+
+
+def novo_ranking(rows):
+    return models.Ranking(atualizado_em=AGORA, idade_segundos=12.5, professores=[models.RankingItem(*row) for row in rows])
+
+
+def novo_busca(rows):
+    return models.BuscaResultado(
+        resultados=[models.BuscaItem(*row) for row in rows],
+        proximo_before_rank=None, proximo_before_id=None, limitado=False
+    )
+
+
+def novo_usuario(row):
+    return [models.User(*row).info()]
+
+
+async def novo(montar, rows) -> bytes:
+    return ORJSONResponse(montar(rows)).body
+
+
+CENARIOS = [
+    ("avaliações (50)", antigo_avaliacoes, novo_avaliacoes, linhas_avaliacoes(50)),
+    ("avaliações (200)", antigo_avaliacoes, novo_avaliacoes, linhas_avaliacoes(200)),
+    ("ranking (100)", antigo_ranking, novo_ranking, linhas_ranking(100)),
+    ("busca (20)", antigo_busca, novo_busca, linhas_busca(20)),
+    ("usuário", antigo_usuario, novo_usuario, USUARIO),
+]
+
+
+async def medir(fn, montar, rows, repeticoes):
+    corpo = await fn(montar, rows)
+    melhor = float("inf")
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        await fn(montar, rows)
+        melhor = min(melhor, time.perf_counter() - inicio)
+
+    tracemalloc.start()
+    await fn(montar, rows)
+    _, pico = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return melhor, pico, len(corpo)
+
+
+async def main_async(args):
+    print(f"{'resposta':>18} {'impl':>17} {'µs':>10} {'pico KiB':>10} {'bytes':>8}")
+    for nome, montar_antigo, montar_novo, rows in CENARIOS:
+        for impl, fn, montar in (
+            ("pydantic + json", antigo, montar_antigo),
+            ("dataclass + orjson", novo, montar_novo),
+        ):
+            segundos, pico, tamanho = await medir(fn, montar, rows, args.repeticoes)
+            print(f"{nome:>18} {impl:>17} {segundos * 1e6:>10.1f} {pico / 1024:>10.1f} {tamanho:>8}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python bench/serializacao.py")
+    parser.add_argument("--repeticoes", type=int, default=200)
+    args = parser.parse_args(argv)
+    asyncio.run(main_async(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+# Micro-benchmark do render da página de turma: f-strings montadas à mão
+# (como index.py fazia antes dos templates) vs templates Jinja2 pré-compilados.
+#
+#   python bench/templates.py [qtd_avaliacoes ...]
+#
+# Mede o melhor tempo de render e o tamanho em bytes da página anônima e da
+# página de um admin (que tem o botão de excluir em todas as avaliações).
+import math
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pysrc import auth
+from pysrc import templates
+from pysrc.models import Avaliacao, TurmaInfo, User
+
+
+def _static(name):
+    with open(os.path.join(templates.TEMPLATES_DIR, name), encoding="utf-8") as f:
+        return f.read()
+
+
+STYLE = _static("_turma_estilo.html")
+LOGIN_SCRIPT = _static("_turma_login_script.html")
+
+
+def legacy_render_stars(rating):
+    rating = math.ceil(rating)  # Arredonda para cima
+    filled_stars = '★' * rating
+    empty_stars = '☆' * (5 - rating)
+    return f"<div>{filled_stars}{empty_stars}</div>"
+
+
+def legacy_turma(turma, user=None):
+    turma_html = f"<h2>Professor: {turma.professor_nome}</h2>"
+    turma_html += f"<h3>Disciplina: {turma.disciplina_nome}</h3>"
+    turma_html += f'<form id="usuario-form"><input type="hidden" name="turma_id" value="{turma.id}"></form>'
+
+    for avaliacao in turma.avaliacoes:
+        user_html = f"<p class='user'>Usuário: {avaliacao.user_nome}</p>"
+        comentario_html = f"<p class='comentario'>Comentário: {avaliacao.comentario}</p>"
+        pontuacao_html = f"<p class='pontuacao'> {legacy_render_stars(avaliacao.pontuacao)}</p>"
+        if user and (avaliacao.user_id == user.id or user.is_admin):
+            # Como antes: um <script> deleteComment repetido por comentário
+            delete_button_html = f"""
+            <button type="button" onclick="deleteComment({avaliacao.id})">Excluir</button>
+            <script>
+                function deleteComment(commentId) {{
+                    fetch(`/api/turma/{turma.id}/{user.id}/comentario/${{commentId}}`, {{
+                        method: 'DELETE'
+                    }})
+                    .then(response => {{
+                        if (response.status === 200) {{
+                            console.log('Comentário excluído com sucesso');
+                            // Recarrega a página para atualizar a lista de comentários
+                            location.reload();
+                        }} else {{
+                            console.error('Erro ao excluir comentário:', response.statusText);
+                        }}
+                    }})
+                    .catch(error => {{
+                        console.error('Error:', error);
+                    }});
+                }}
+            </script>
+            """
+            turma_html += f"""
+            <div class='comentario-block'>
+                {user_html}
+                {comentario_html}
+                {pontuacao_html}
+                {delete_button_html}
+            </div>
+            """
+        else:
+            turma_html += f"<div class='comentario-block'>{user_html}{comentario_html}{pontuacao_html}</div>"
+
+    if user is None:
+        return STYLE + turma_html + LOGIN_SCRIPT
+    return STYLE + turma_html
+
+
+def jinja_turma(turma, user=None):
+    return templates.render(
+        "turma.html", turma=turma, avaliacoes=turma.avaliacoes,
+        user_id=user.id if user else None,
+        sessao=auth.Sessao(user.id, user.is_admin, 0) if user else None,
+        url=f"/api/turma/{turma.id}", proximo_before_id=None, limit=len(turma.avaliacoes),
+    )
+
+
+def make_turma(n):
+    avaliacoes = [
+        Avaliacao(id=n - i, user_id=i % 97, user_nome=f"aluno {i % 97}",
+                  comentario=f"Comentário número {i} sobre a turma", pontuacao=i % 5 + 1)
+        for i in range(n)
+    ]
+    return TurmaInfo(
+        id=1, professor_id=1, professor_nome="João Gomes",
+        disciplina_id=1, disciplina_nome="Programação Competitiva",
+        qtd_avaliacoes=n, sum_avaliacoes=sum(a.pontuacao for a in avaliacoes),
+        histograma=[0, 0, 0, 0, 0], avaliacoes=avaliacoes, proximo_before_id=None,
+    )
+
+
+def best_time(fn, *args, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        html = fn(*args)
+        best = min(best, time.perf_counter() - start)
+    return best, len(html.encode("utf-8"))
+
+
+def main(sizes):
+    templates.load_all()
+    admin = User(id=0, email="", nome="admin", matricula="", curso="", senha="", is_admin=True)
+
+    print(f"{'avaliações':>10} {'página':>8} {'impl':>8} {'ms':>10} {'bytes':>12}")
+    for n in sizes:
+        turma = make_turma(n)
+        repeat = max(3, min(200, 200_000 // max(n, 1)))
+        for pagina, user in (("anônima", None), ("admin", admin)):
+            for impl, fn in (("f-string", legacy_turma), ("jinja2", jinja_turma)):
+                seconds, size = best_time(fn, turma, user, repeat=repeat)
+                print(f"{n:>10} {pagina:>8} {impl:>8} {seconds * 1000:>10.3f} {size:>12}")
+
+
+if __name__ == "__main__":
+    main([int(arg) for arg in sys.argv[1:]] or [10, 1_000, 100_000])
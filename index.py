@@ -1,373 +1,565 @@
-from fastapi import FastAPI, Depends, HTTPException, Request
+from fastapi import FastAPI, Depends, HTTPException, Query, Request, Response
 from fastapi.responses import HTMLResponse
-from fastapi.responses import JSONResponse
-from pysrc.connection import get_db
+from fastapi.responses import ORJSONResponse
+from fastapi.responses import RedirectResponse
+from fastapi.responses import StreamingResponse
+from contextlib import asynccontextmanager
+from datetime import datetime, timezone
+from typing import List, Optional
+import psycopg
+from pysrc.connection import get_db, get_db_leitura, get_db_leitura_sob_demanda
+from pysrc import auth
+from pysrc import batching
+from pysrc import bulk
+from pysrc import coalescer
+from pysrc import connection
+from pysrc import eventos
+from pysrc import http_cache
+from pysrc import metrics
+from pysrc import migrations
+from pysrc.cache import cache
 from pysrc import models
-import math
-
-app = FastAPI()
+from pysrc import particoes
+from pysrc import preparadas
+from pysrc import prerender
+from pysrc import ranking
+from pysrc import templates
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    templates.load_all()
+    await connection.open_pool()
+    if migrations.migrations_auto():
+        async with connection.connect() as conn:
+            await migrations.aplicar(conn)
+    ranking.start_scheduler()
+    particoes.start()
+    batching.start()
+    prerender.start()
+    eventos.start()
+    yield
+    await eventos.stop()
+    await prerender.stop()
+    await batching.stop()
+    await particoes.stop()
+    await ranking.stop_scheduler()
+    await connection.close_pool()
+
+
+# Respostas JSON com orjson. Os endpoints que já têm o resultado pronto
+# (dataclasses de models) devolvem ORJSONResponse direto: o response_model
+# fica só na documentação, sem validar e copiar a saída de novo.
+app = FastAPI(lifespan=lifespan, default_response_class=ORJSONResponse)
+# Server-Timing em toda resposta e histogramas em /metrics
+app.add_middleware(metrics.MetricsMiddleware)
+# Sessão assinada (pysrc/auth.py), conferida sem consultar o banco
+app.add_middleware(auth.SessaoMiddleware)
+
+# Os GETs usam get_db_leitura (réplicas, se configuradas, ver
+# pysrc/connection.py); escritas e o login usam get_db (primário).
+
+# GETs condicionais: cada endpoint lê um carimbo de versão barato junto com
+# os dados, numa única ida e volta ao banco (models.get_pagina_*), e, se o ETag
+# bate com If-None-Match, responde 304 sem renderizar a página.
+
+# As páginas mais compartilhadas passam por coalescer.ler: requisições
+# idênticas simultâneas esperam uma única execução de carregar (consultas e
+# render) em vez de cada uma ocupar uma conexão. carregar devolve
+# (headers, conteúdo), com conteúdo None para 304.
+
+# Com PRERENDER_DIR, as mesmas páginas (na versão anônima) são servidas do
+# disco quando já foram pré-renderizadas (pysrc/prerender.py).
 
 @app.get("/", response_class=HTMLResponse)
-async def root():
-    menu_html = """
-        <h1>Bem-vindo!</h1>
-        <ul>
-            <li><a href="/api/professores">Professores</a></li>
-            <li><a href="/api/disciplinas">Disciplinas</a></li>
-        </ul>
-    """
-    return HTMLResponse(content=menu_html, status_code=200)
+async def root(request: Request):
+    headers = http_cache.headers(models.Versao(versao="0", atualizado_em=None), "raiz")
+    if http_cache.not_modified(request, headers):
+        return http_cache.not_modified_response(headers)
+    return HTMLResponse(content=templates.render("raiz.html"), status_code=200, headers=headers)
 
 @app.get("/api/professores", response_class=HTMLResponse)
-async def get_professores(db=Depends(get_db)):
-    professores = await models.get_all_professores(db)
-    professores_html = "<h1>Professores</h1>"
-    for professor in professores:
-        professores_html += f"<h2><a href='/api/professor/{professor.id}'>{professor.nome}</a></h2>"
-        professores_html += "<ul>"
-        for disciplina_id, disciplina_nome in professor.disciplinas:
-            professores_html += f"<li><a href = '/api/turma/{disciplina_id}'> {disciplina_nome}</li>"
-        professores_html += "</ul>"
-    return HTMLResponse(content=professores_html, status_code=200)
+async def get_professores(request: Request, abrir=Depends(get_db_leitura_sob_demanda)):
+    estatica = await prerender.servir(request, "professores")
+    if estatica is not None:
+        return estatica
+
+    async def carregar(db):
+        versao, professores = await models.get_pagina_professores(db)
+        headers = http_cache.headers(versao, "professores")
+        if http_cache.not_modified(request, headers):
+            return headers, None
+
+        return headers, templates.render("professores.html", professores=professores)
+
+    headers, html = await coalescer.ler(request, "professores", (), carregar, abrir)
+    if html is None:
+        return http_cache.not_modified_response(headers)
+    return HTMLResponse(content=html, status_code=200, headers=headers)
 
 
 @app.get("/api/disciplinas", response_class=HTMLResponse)
-async def get_disciplinas(db=Depends(get_db)):
-    disciplinas = await models.get_all_disciplinas(db)
-    disciplinas_html = "<h1>Disciplinas</h1>"
-    for disciplina in disciplinas:
-        disciplinas_html += f"<p><a href = '/api/disciplina/{disciplina.id}'> {disciplina.nome}</p>"
-    return HTMLResponse(content=disciplinas_html, status_code=200)
+async def get_disciplinas(request: Request, abrir=Depends(get_db_leitura_sob_demanda)):
+    estatica = await prerender.servir(request, "disciplinas")
+    if estatica is not None:
+        return estatica
 
-@app.get("/api/disciplina/{disciplina_id}")
-async def get_disciplina(disciplina_id: int, db=Depends(get_db)):
-    disciplina = await models.get_disciplina_info(db, disciplina_id)
-    
-    if disciplina is None:
-        raise HTTPException(status_code=404, detail="Disciplina not found")
-
-    disciplina_html = f"<h1>{disciplina.nome}</h1>"
-    disciplina_html += "<h2>Professores:</h2>"
-    
-    for professor in disciplina.professores:
-        disciplina_html += f"<h3>{professor.nome}</h3>"
-        disciplina_html += "<ul>"
-        if professor.qtd_avaliacoes != 0:
-            disciplina_html += f"<li>{render_stars(professor.sum_avaliacoes/professor.qtd_avaliacoes)}</li>"
-            disciplina_html += "</ul>"
-        else:
-            disciplina_html += f"<li>Sem avaliações</li>"
-            disciplina_html += "</ul>"  
-    
-    return HTMLResponse(content=disciplina_html, status_code=200)
+    versao, disciplinas = await models.get_pagina_disciplinas(await abrir())
+    headers = http_cache.headers(versao, "disciplinas")
+    if http_cache.not_modified(request, headers):
+        return http_cache.not_modified_response(headers)
 
+    return HTMLResponse(content=templates.render("disciplinas.html", disciplinas=disciplinas), status_code=200, headers=headers)
 
-@app.get("/api/professor/{professor_id}")
-async def get_professor(professor_id: int, db=Depends(get_db)):
-    return await models.get_professor_info(db, professor_id)
+@app.get("/api/disciplina/{disciplina_id}")
+async def get_disciplina(disciplina_id: int, request: Request, abrir=Depends(get_db_leitura_sob_demanda)):
+    estatica = await prerender.servir(request, "disciplina", disciplina_id)
+    if estatica is not None:
+        return estatica
+
+    async def carregar(db):
+        versao, disciplina = await models.get_pagina_disciplina(db, disciplina_id)
+        headers = http_cache.headers(versao, "disciplina", disciplina_id)
+        if http_cache.not_modified(request, headers):
+            return headers, None
+
+        if disciplina is None:
+            raise HTTPException(status_code=404, detail="Disciplina not found")
+
+        return headers, templates.render("disciplina.html", disciplina=disciplina)
+
+    headers, html = await coalescer.ler(request, "disciplina", (disciplina_id,), carregar, abrir)
+    if html is None:
+        return http_cache.not_modified_response(headers)
+    return HTMLResponse(content=html, status_code=200, headers=headers)
+
+
+# O JSON vem pronto do Postgres: response_model aqui só documenta o formato
+@app.get("/api/professor/{professor_id}", response_model=models.ProfessorInfo)
+async def get_professor(professor_id: int, request: Request, abrir=Depends(get_db_leitura_sob_demanda)):
+    estatica = await prerender.servir(request, "professor", professor_id)
+    if estatica is not None:
+        return estatica
+
+    async def carregar(db):
+        versao, professor = await models.get_pagina_professor(db, professor_id)
+        headers = http_cache.headers(versao, "professor", professor_id)
+        if http_cache.not_modified(request, headers):
+            return headers, None
+
+        return headers, professor
+
+    headers, professor = await coalescer.ler(request, "professor", (professor_id,), carregar, abrir)
+    if professor is None:
+        return http_cache.not_modified_response(headers)
+    return Response(content=professor, media_type="application/json", headers=headers)
+
+
+# Média e quantidade de avaliações por semestre (partições de Avaliacoes),
+# do semestre atual e dos anteriores
+@app.get("/api/professor/{professor_id}/tendencia", response_model=models.Tendencia)
+async def get_professor_tendencia(
+    professor_id: int, request: Request,
+    semestres: int = Query(models.TENDENCIA_SEMESTRES, ge=1, le=40), db=Depends(get_db_leitura)
+):
+    inicio = models.inicio_tendencia(semestres)
+    versao, tendencia = await models.get_pagina_tendencia(db, "professor", professor_id, inicio)
+    headers = http_cache.headers(versao, "tendencia-professor", professor_id, models.semestre_nome(inicio))
+    if http_cache.not_modified(request, headers):
+        return http_cache.not_modified_response(headers)
+
+    return ORJSONResponse(tendencia, headers=headers)
+
+
+# O ranking só muda a cada refresh da materialized view; o ETag é fraco porque
+# idade_segundos muda a cada segundo sem que o ranking mude
+@app.get("/api/ranking", response_model=models.Ranking)
+async def get_ranking(
+    request: Request,
+    limit: int = Query(10, ge=1, le=100), min_votos: int = Query(0, ge=0), db=Depends(get_db_leitura)
+):
+    versao, ranking = await models.get_pagina_ranking(db, limit, min_votos)
+    headers = http_cache.headers(versao, "ranking", limit, min_votos, fraco=True)
+    if http_cache.not_modified(request, headers):
+        return http_cache.not_modified_response(headers)
+
+    return ORJSONResponse(ranking, headers=headers)
+
+
+@app.get("/api/departamento/{departamento_id}/ranking", response_model=models.Ranking)
+async def get_departamento_ranking(
+    departamento_id: int, request: Request,
+    limit: int = Query(10, ge=1, le=100), min_votos: int = Query(0, ge=0), db=Depends(get_db_leitura)
+):
+    versao, ranking = await models.get_pagina_ranking(db, limit, min_votos, departamento_id)
+    headers = http_cache.headers(versao, "ranking", departamento_id, limit, min_votos, fraco=True)
+    if http_cache.not_modified(request, headers):
+        return http_cache.not_modified_response(headers)
+
+    return ORJSONResponse(ranking, headers=headers)
+
+
+@app.get("/api/busca", response_model=models.BuscaResultado)
+async def busca(
+    request: Request,
+    q: str = Query(..., min_length=1, max_length=200),
+    professor_id: Optional[int] = None, disciplina_id: Optional[int] = None,
+    departamento_id: Optional[int] = None,
+    before_rank: Optional[float] = None, before_id: Optional[int] = None,
+    limit: int = Query(models.RESULTADOS_BUSCA_POR_PAGINA, ge=1, le=100), db=Depends(get_db_leitura)
+):
+    versao, resultado = await models.buscar_avaliacoes(
+        db, q, professor_id, disciplina_id, departamento_id, before_rank, before_id, limit
+    )
+    headers = http_cache.headers(
+        versao, "busca", q, professor_id, disciplina_id, departamento_id, before_rank, before_id, limit
+    )
+    if http_cache.not_modified(request, headers):
+        return http_cache.not_modified_response(headers)
+
+    return ORJSONResponse(resultado, headers=headers)
 
 
 @app.get("/api/turma/{turma_id}", response_class=HTMLResponse)
-async def get_turma(turma_id: int, db=Depends(get_db)):
-    turma = await models.get_turma_info(db, turma_id)
-
-    if turma is None:
-        raise HTTPException(status_code=404, detail="Turma not found")
-
-    professor_html = f"<h2>Professor: {turma.professor_nome}</h2>"
-    disciplina_html = f"<h3>Disciplina: {turma.disciplina_nome}</h3>"
-    turma_html = professor_html + disciplina_html
-
-    # Botão "Adicionar Usuário"
-    adicionar_usuario_html = f'''
-    <form id="usuario-form">
-        <input type="hidden" name="turma_id" value="{turma_id}">
-        <input type="text" name="nome" placeholder="Nome" required><br>
-        <input type="email" name="email" placeholder="Email" required><br>
-        <input type="text" name="matricula" placeholder="Matrícula" required><br>
-        <input type="text" name="curso" placeholder="Curso" required><br>
-        <input type="password" name="senha" placeholder="Senha" required><br>
-        <input type="checkbox" name="is_admin" value="true"> Administrador<br>
-        <button type="button" onclick="submitForm('criar')">Criar Usuário</button>
-    </form>
-    '''
-
-    # Formulário de Login
-    login_html = f'''
-    <form id="login-form">
-        <input type="hidden" name="turma_id" value="{turma_id}">
-        <input type="text" name="login_nome" placeholder="Nome do Usuário" required><br>
-        <input type="password" name="login_senha" placeholder="Senha" required><br>
-        <button type="button" onclick="submitForm('login')">Login</button>
-    </form>
-    '''
-
-    turma_html += adicionar_usuario_html + login_html
-
-    # Ordenar as avaliações pelo ID em ordem decrescente
-    avaliacoes_ordenadas = sorted(turma.avaliacoes, key=lambda x: x.id, reverse=True)
-
-    for avaliacao in avaliacoes_ordenadas:
-        user_html = f"<p class='user'>Usuário: {avaliacao.user_nome}</p>"
-        comentario_html = f"<p class='comentario'>Comentário: {avaliacao.comentario}</p>"
-        pontuacao_html = f"<p class='pontuacao'> {render_stars(avaliacao.pontuacao)}</p>"
-        comentario_block_html = f"<div class='comentario-block'>{user_html}{comentario_html}{pontuacao_html}</div>"
-        turma_html += comentario_block_html
-
-    style = """
-        <style>
-            .user {
-                font-weight: bold;
-            }
-            
-            .comentario {
-                margin-left: 20px;
-            }
-            
-            .pontuacao {
-                margin-left: 20px;
-            }
-            
-            .comentario-block {
-                border: 1px solid #ccc;
-                padding: 10px;
-                margin-bottom: 10px;
-            }
-        </style>
-    """
-
-    script = """
-        <script>
-            function submitForm(action) {
-                if (action === 'criar') {
-                    const form = document.getElementById('usuario-form');
-                    const formData = new FormData(form);
-                    const turma_id = formData.get('turma_id');
-                    const nome = formData.get('nome');
-                    const email = formData.get('email');
-                    const matricula = formData.get('matricula');
-                    const curso = formData.get('curso');
-                    const senha = formData.get('senha');
-                    const is_admin = formData.get('is_admin') === 'true';
-
-                    const data = {
-                        'nome': nome,
-                        'email': email,
-                        'matricula': matricula,
-                        'curso': curso,
-                        'senha': senha,
-                        'is_admin': is_admin
-                    };
-
-                    fetch("/api/usuario", {
-                        method: 'POST',
-                        headers: {
-                            'Content-Type': 'application/json'
-                        },
-                        body: JSON.stringify(data)
-                    })
-                    .then(response => response.json())
-                    .then(result => {
-                        console.log(result);  // Imprime o resultado do submit no console
-                    })
-                    .catch(error => {
-                        console.error('Error:', error);
-                    });
-                } else if (action === 'login') {
-                    const form = document.getElementById('login-form');
-                    const formData = new FormData(form);
-                    const turma_id = formData.get('turma_id');
-                    const login_nome = formData.get('login_nome');
-                    const login_senha = formData.get('login_senha');
-
-                    fetch(`/api/usuarios?username=${login_nome}`)
-                    .then(response => {
-                        if (response.status === 200) {
-                            return response.json();
-                        } else {
-                            throw new Error('Usuário não encontrado');
-                        }
-                    })
-                    .then(users => {
-                        const user = users[0];
-                        if (user && user.senha === login_senha) {
-                            window.location.href = `/api/turma/${turma_id}/${user.id}`;
-                        } else {
-                            alert('Senha incorreta');
-                        }
-                    })
-                    .catch(error => {
-                        alert(error.message);
-                        console.error('Error:', error);
-                    });
-                }
-            }
-        </script>
-    """
-
-    return HTMLResponse(content=style + turma_html + script, status_code=200)
+async def get_turma(
+    turma_id: int, request: Request, before_id: Optional[int] = None,
+    limit: int = Query(models.AVALIACOES_POR_PAGINA, ge=1, le=200),
+    stream: bool = False, abrir=Depends(get_db_leitura_sob_demanda)
+):
+    if not stream and before_id is None and limit == models.AVALIACOES_POR_PAGINA:
+        estatica = await prerender.servir(request, "turma", turma_id)
+        if estatica is not None:
+            return estatica
+
+    # Em modo stream a página não é paginada: o cabeçalho sai imediatamente
+    # e as avaliações seguem conforme chegam do cursor no servidor, que
+    # precisa da conexão desta requisição até o fim da resposta (só vale no
+    # FastAPI < 0.106, ver requirements.txt)
+    if stream:
+        db = await abrir()
+        versao = await models.get_versao(db, "turma", turma_id)
+        headers = http_cache.headers(versao, "turma", turma_id, before_id, "stream")
+        if http_cache.not_modified(request, headers):
+            return http_cache.not_modified_response(headers)
+
+        turma = await models.get_turma_resumo(db, turma_id, versao=versao)
+        if turma is None:
+            raise HTTPException(status_code=404, detail="Turma not found")
+
+        avaliacoes = models.stream_turma_avaliacoes(db, turma_id, before_id)
+        return StreamingResponse(
+            templates.stream_turma(avaliacoes, turma=turma, user_id=None, sessao=None),
+            media_type="text/html", headers=headers
+        )
+
+    async def carregar(db):
+        versao, turma = await models.get_pagina_turma(db, turma_id, before_id, limit)
+        headers = http_cache.headers(versao, "turma", turma_id, before_id, limit)
+        if http_cache.not_modified(request, headers):
+            return headers, None
+
+        if turma is None:
+            raise HTTPException(status_code=404, detail="Turma not found")
+
+        # As avaliações já vêm ordenadas pelo ID em ordem decrescente
+        return headers, templates.render(
+            "turma.html", turma=turma, avaliacoes=turma.avaliacoes,
+            url=f"/api/turma/{turma_id}", proximo_before_id=turma.proximo_before_id, limit=limit,
+            user_id=None, sessao=None
+        )
+
+    headers, html = await coalescer.ler(request, "turma", (turma_id, before_id, limit), carregar, abrir)
+    if html is None:
+        return http_cache.not_modified_response(headers)
+    return HTMLResponse(content=html, status_code=200, headers=headers)
+
+
+@app.get("/api/turma/{turma_id}/avaliacoes", response_model=models.AvaliacoesPage)
+async def get_turma_avaliacoes(
+    turma_id: int, request: Request, before_id: Optional[int] = None,
+    limit: int = Query(models.AVALIACOES_POR_PAGINA, ge=1, le=200), db=Depends(get_db_leitura)
+):
+    versao, page = await models.get_pagina_turma_avaliacoes(db, turma_id, before_id, limit)
+    headers = http_cache.headers(versao, "turma-avaliacoes", turma_id, before_id, limit)
+    if http_cache.not_modified(request, headers):
+        return http_cache.not_modified_response(headers)
+
+    return ORJSONResponse(page, headers=headers)
+
+
+# Antes de /api/turma/{turma_id}/{user_id}, que também casaria com o caminho
+@app.get("/api/turma/{turma_id}/tendencia", response_model=models.Tendencia)
+async def get_turma_tendencia(
+    turma_id: int, request: Request,
+    semestres: int = Query(models.TENDENCIA_SEMESTRES, ge=1, le=40), db=Depends(get_db_leitura)
+):
+    inicio = models.inicio_tendencia(semestres)
+    versao, tendencia = await models.get_pagina_tendencia(db, "turma", turma_id, inicio)
+    headers = http_cache.headers(versao, "tendencia-turma", turma_id, models.semestre_nome(inicio))
+    if http_cache.not_modified(request, headers):
+        return http_cache.not_modified_response(headers)
+
+    return ORJSONResponse(tendencia, headers=headers)
+
+
+# Atualizações ao vivo da página da turma (pysrc/eventos.py). Não usa
+# conexão do banco: as diferenças chegam pelo LISTEN do processo.
+@app.get("/api/turma/{turma_id}/eventos")
+async def get_turma_eventos(turma_id: int):
+    if eventos.ouvinte is None:
+        raise HTTPException(status_code=503, detail="Atualizações ao vivo desligadas")
+    return StreamingResponse(
+        eventos.ouvinte.stream(turma_id), media_type="text/event-stream",
+        # X-Accel-Buffering: o nginx repassa cada evento sem esperar encher o buffer
+        headers={"Cache-Control": http_cache.SEM_CACHE, "X-Accel-Buffering": "no"}
+    )
 
 
 @app.get("/api/turma/{turma_id}/{user_id}", response_class=HTMLResponse)
-async def get_turma(turma_id: int, user_id: int, db=Depends(get_db)):
-    turma = await models.get_turma_info(db, turma_id)
+async def get_turma(
+    turma_id: int, user_id: int, request: Request, before_id: Optional[int] = None,
+    limit: int = Query(models.AVALIACOES_POR_PAGINA, ge=1, le=200),
+    stream: bool = False, db=Depends(get_db_leitura)
+):
+    # Id e is_admin vêm do token da sessão: a página não consulta o usuário.
+    # Sem sessão deste usuário, volta para a página pública (com o login).
+    sessao = auth.get_sessao(request)
+    if sessao is None or sessao.user_id != user_id:
+        return RedirectResponse(f"/api/turma/{turma_id}", status_code=303)
+
+    # Em modo stream as avaliações vêm depois, do cursor: aqui só o resumo
+    if stream:
+        versao = await models.get_versao(db, "turma", turma_id)
+    else:
+        versao, turma = await models.get_pagina_turma(db, turma_id, before_id, limit)
+    headers = http_cache.headers(
+        versao, "turma", turma_id, user_id, int(sessao.is_admin), before_id, "stream" if stream else limit,
+        privado=True
+    )
+    if http_cache.not_modified(request, headers):
+        return http_cache.not_modified_response(headers)
+
+    if stream:
+        turma = await models.get_turma_resumo(db, turma_id, versao=versao)
 
     if turma is None:
         raise HTTPException(status_code=404, detail="Turma não encontrada")
 
-    professor_html = f"<h2>Professor: {turma.professor_nome}</h2>"
-    disciplina_html = f"<h3>Disciplina: {turma.disciplina_nome}</h3>"
-    turma_html = professor_html + disciplina_html
-
-    # Botão "Adicionar Comentário"
-    adicionar_comentario_html = f"""
-    <form id="avaliacao-form">
-        <input type="hidden" name="turma_id" value="{turma_id}">
-        <input type="hidden" name="user_id" value="{user_id}">
-        <input type="text" name="comentario" placeholder="Comentário" required><br>
-        <input type="number" name="pontuacao" placeholder="Pontuação" required><br>
-        <button type="button" onclick="submitForm()">Adicionar Comentário</button>
-    </form>
-    <script>
-        function submitForm() {{
-            const form = document.getElementById('avaliacao-form');
-            const formData = new FormData(form);
-            const user_id = formData.get('user_id');
-            const comentario = formData.get('comentario');
-            const pontuacao = formData.get('pontuacao');
-            const data = {{
-                'user_id': user_id,
-                'comentario': comentario,
-                'pontuacao': pontuacao
-            }};
-            fetch("/api/turma/{turma_id}/{user_id}/comentario", {{
-                method: 'POST',
-                headers: {{
-                    'Content-Type': 'application/json'
-                }},
-                body: JSON.stringify(data)
-            }})
-            .then(response => response.json())
-            .then(result => {{
-                console.log(result);  // Imprime o resultado do submit no console
-            }})
-            .catch(error => {{
-                console.error('Error:', error);
-            }});
-        }}
-    </script>
-    """
-
-    turma_html += adicionar_comentario_html
-
-    # Ordenar as avaliações pelo ID em ordem decrescente
-    avaliacoes_ordenadas = sorted(turma.avaliacoes, key=lambda x: x.id, reverse=True)
-
-    user = await models.find_user_by_id(db, user_id)  # Obter informações do usuário
-
-    for avaliacao in avaliacoes_ordenadas:
-        user_html = f"<p class='user'>Usuário: {avaliacao.user_nome}</p>"
-        comentario_html = f"<p class='comentario'>Comentário: {avaliacao.comentario}</p>"
-        pontuacao_html = f"<p class='pontuacao'> {render_stars(avaliacao.pontuacao)}</p>"
-        
-        # Verifica se o usuário atual é o autor do comentário ou um administrador
-        if user and (avaliacao.user_id == user.id or user.is_admin):
-            # Adiciona o botão de exclusão
-            delete_button_html = f"""
-            <button type="button" onclick="deleteComment({avaliacao.id})">Excluir</button>
-            <script>
-                function deleteComment(commentId) {{
-                    fetch(`/api/turma/{turma_id}/{user_id}/comentario/${{commentId}}`, {{
-                        method: 'DELETE'
-                    }})
-                    .then(response => {{
-                        if (response.status === 200) {{
-                            console.log('Comentário excluído com sucesso');
-                            // Recarrega a página para atualizar a lista de comentários
-                            location.reload();
-                        }} else {{
-                            console.error('Erro ao excluir comentário:', response.statusText);
-                        }}
-                    }})
-                    .catch(error => {{
-                        console.error('Error:', error);
-                    }});
-                }}
-            </script>
-            """
-            comentario_block_html = f"""
-            <div class='comentario-block'>
-                {user_html}
-                {comentario_html}
-                {pontuacao_html}
-                {delete_button_html}
-            </div>
-            """
-        else:
-            comentario_block_html = f"<div class='comentario-block'>{user_html}{comentario_html}{pontuacao_html}</div>"
-
-        turma_html += comentario_block_html
-
-    style = """
-        <style>
-            .user {
-                font-weight: bold;
-            }
-            
-            .comentario {
-                margin-left: 20px;
-            }
-            
-            .pontuacao {
-                margin-left: 20px;
-            }
-            
-            .comentario-block {
-                border: 1px solid #ccc;
-                padding: 10px;
-                margin-bottom: 10px;
-            }
-        </style>
-    """
-
-    return HTMLResponse(content=style + turma_html, status_code=200)
-
-
-@app.delete("/api/turma/{turma_id}/{user_id}/comentario/{comment_id}", response_class=JSONResponse)
-async def delete_comment(turma_id: int, user_id: int, comment_id: int, db=Depends(get_db)):
-    comment = await models.delete_comment(db, comment_id)
+    context = dict(turma=turma, user_id=user_id, sessao=sessao)
+
+    if stream:
+        avaliacoes = models.stream_turma_avaliacoes(db, turma_id, before_id)
+        return StreamingResponse(templates.stream_turma(avaliacoes, **context), media_type="text/html", headers=headers)
+
+    # As avaliações já vêm ordenadas pelo ID em ordem decrescente
+    html = templates.render(
+        "turma.html", avaliacoes=turma.avaliacoes,
+        url=f"/api/turma/{turma_id}/{user_id}", proximo_before_id=turma.proximo_before_id, limit=limit,
+        **context
+    )
+    return HTMLResponse(content=html, status_code=200, headers=headers)
+
+
+@app.delete("/api/turma/{turma_id}/{user_id}/comentario/{comment_id}")
+async def delete_comment(
+    turma_id: int, user_id: int, comment_id: int,
+    sessao: auth.Sessao = Depends(auth.exigir_usuario), db=Depends(get_db)
+):
+    # Admin exclui qualquer comentário; os demais só os próprios
+    comment = await models.delete_comment(db, comment_id, None if sessao.is_admin else sessao.user_id)
     if comment is None:
         raise HTTPException(status_code=404, detail="Comentário não encontrado")
-    return comment
+    resposta = ORJSONResponse(comment)
+    connection.marcar_escrita(resposta)
+    return resposta
+
+
+# Moderação em lote: a fila das avaliações denunciadas e, para uma seleção
+# delas, excluir as avaliações (com as denúncias) ou descartar as denúncias
+@app.get("/api/moderacao/denuncias", response_model=models.FilaModeracao)
+async def get_fila_moderacao(
+    before_qtd: Optional[int] = None, before_id: Optional[int] = None,
+    limit: int = Query(models.DENUNCIAS_POR_PAGINA, ge=1, le=500),
+    _: auth.Sessao = Depends(auth.exigir_admin), db=Depends(get_db)
+):
+    # Primário: a fila tem que refletir a moderação que acabou de ser feita
+    fila = await models.get_fila_moderacao(db, before_qtd, before_id, limit)
+    return ORJSONResponse(fila, headers={"Cache-Control": http_cache.SEM_CACHE})
 
 
+@app.post("/api/moderacao", response_model=models.ModeracaoResultado)
+async def moderar(
+    moderacao: models.ModeracaoIn,
+    _: auth.Sessao = Depends(auth.exigir_admin), db=Depends(get_db)
+):
+    resultado = await models.moderar(db, moderacao.acao, moderacao.avaliacao_ids)
+    resposta = ORJSONResponse(resultado)
+    connection.marcar_escrita(resposta)
+    return resposta
 
-@app.post("/api/turma/{turma_id}/{user_id}/comentario", response_model=models.AvaliacaoIn)
+
+
+@app.post("/api/turma/{turma_id}/{user_id}/comentario", response_model=models.Avaliacao)
 async def add_avaliacao_to_turma(
-    turma_id: int, user_id: int, avaliacao: models.AvaliacaoIn, db=Depends(get_db)
-) -> models.AvaliacaoIn:
-    new_avaliacao = await models.add_avaliacao_to_turma(db, turma_id, avaliacao)
-    return new_avaliacao
+    turma_id: int, user_id: int, avaliacao: models.AvaliacaoIn,
+    sessao: auth.Sessao = Depends(auth.exigir_usuario)
+):
+    if avaliacao.user_id != sessao.user_id:
+        raise HTTPException(status_code=403, detail="Comentário em nome de outro usuário")
+
+    # Com BATCH_AVALIACOES=1 o INSERT vai num lote junto com as avaliações de
+    # outras requisições, sem ocupar uma conexão por requisição
+    try:
+        if batching.lotes is not None:
+            nova = await batching.lotes.add_avaliacao(turma_id, avaliacao)
+        else:
+            async with connection.connect() as db:
+                nova = await models.add_avaliacao_to_turma(db, turma_id, avaliacao)
+    except batching.FilaCheia:
+        raise HTTPException(status_code=503, detail="Muitas avaliações na fila", headers={"Retry-After": "1"})
+    except psycopg.errors.ForeignKeyViolation:
+        raise HTTPException(status_code=404, detail="Turma ou usuário não encontrado")
+    except (psycopg.IntegrityError, psycopg.DataError) as e:
+        # Outras restrições do banco (CHECK, NOT NULL, tipos): o pedido é
+        # inválido, não uma falha do servidor
+        raise HTTPException(status_code=422, detail=f"Avaliação recusada pelo banco: {e.diag.message_primary or e}")
+    resposta = ORJSONResponse(nova)
+    # As próximas leituras deste cliente vão ao primário e já veem a avaliação
+    connection.marcar_escrita(resposta)
+    return resposta
+
+
+@app.post("/api/login", response_model=models.LoginResultado)
+async def login(dados: models.Login, db=Depends(get_db)):
+    user = await models.autenticar(db, dados.nome, dados.senha)
+    if user is None:
+        raise HTTPException(status_code=401, detail="Usuário ou senha incorretos")
+
+    token, sessao = auth.emitir(user.id, user.is_admin)
+    response = ORJSONResponse(models.LoginResultado(
+        user=user.info(), token=token,
+        expira_em=datetime.fromtimestamp(sessao.expira_em, timezone.utc)
+    ))
+    response.set_cookie(
+        auth.COOKIE, token, max_age=auth.TTL, path="/",
+        httponly=True, samesite="lax", secure=auth.COOKIE_SECURE
+    )
+    response.headers["Cache-Control"] = http_cache.SEM_CACHE
+    return response
+
 
+@app.post("/api/logout")
+async def logout(response: Response):
+    response.delete_cookie(auth.COOKIE, path="/")
+    return {}
 
-@app.post("/api/usuario", response_model=models.User)
+
+@app.post("/api/usuario", response_model=models.UserInfo)
 async def add_user(user: models.UserIn, db=Depends(get_db)):
     new_user = await models.add_user(db, user)
-    return new_user
+    if new_user is None:
+        raise HTTPException(status_code=409, detail="Nome de usuário já cadastrado")
+    resposta = ORJSONResponse(new_user.info())
+    connection.marcar_escrita(resposta)
+    return resposta
 
 
-@app.get("/api/usuarios")
-async def get_user(username: str, db=Depends(get_db)):
-    user = await models.get_user(db, username)
-    if user is None:
-        raise HTTPException(status_code=404, detail="Usuário não encontrado")
-    return [user]
+def _importacao_recusada(e: bulk.ArquivoInvalido) -> ORJSONResponse:
+    # Mesmo formato dos erros por linha, mas nada foi importado
+    return ORJSONResponse(models.ImportResultado(erros=[e.erro]).dict(), status_code=422)
+
+
+async def _spool_importacao(request: Request):
+    # Recusa pelo Content-Length antes de ler o corpo; sem ele (chunked),
+    # bulk.spool para de ler ao passar do limite
+    tamanho = request.headers.get("content-length")
+    try:
+        if tamanho is not None and int(tamanho) > bulk.IMPORTACAO_MAX_BYTES:
+            raise bulk.ArquivoGrandeDemais(bulk.IMPORTACAO_MAX_BYTES)
+        return await bulk.spool(request.stream())
+    except bulk.ArquivoGrandeDemais as e:
+        raise HTTPException(status_code=413, detail=str(e))
+
+
+@app.post("/api/importacao/usuarios", response_model=models.ImportResultado)
+async def import_users(
+    request: Request, formato: str = Query("csv", pattern="^(csv|ndjson)$"),
+    _: auth.Sessao = Depends(auth.exigir_admin), db=Depends(get_db)
+):
+    try:
+        f = await _spool_importacao(request)
+    except bulk.ArquivoInvalido as e:
+        return _importacao_recusada(e)
+    with f:
+        return await bulk.import_users(db, f, formato)
+
+
+@app.post("/api/importacao/avaliacoes", response_model=models.ImportResultado)
+async def import_avaliacoes(
+    request: Request, formato: str = Query("csv", pattern="^(csv|ndjson)$"),
+    _: auth.Sessao = Depends(auth.exigir_admin), db=Depends(get_db)
+):
+    try:
+        f = await _spool_importacao(request)
+    except bulk.ArquivoInvalido as e:
+        return _importacao_recusada(e)
+    with f:
+        return await bulk.import_avaliacoes(db, f, formato)
+
+
+@app.get("/api/pool")
+async def get_pool_stats(response: Response):
+    response.headers["Cache-Control"] = http_cache.SEM_CACHE
+    return connection.pool_stats()
+
+
+@app.get("/api/cache")
+async def get_cache_stats(response: Response):
+    response.headers["Cache-Control"] = http_cache.SEM_CACHE
+    return cache.stats()
+
 
+@app.get("/api/lotes")
+async def get_batching_stats(response: Response):
+    response.headers["Cache-Control"] = http_cache.SEM_CACHE
+    return batching.stats()
 
-def render_stars(rating):
-    rating = math.ceil(rating)  # Arredonda para cima
-    filled_stars = '★' * rating
-    empty_stars = '☆' * (5 - rating)
-    return f"<div>{filled_stars}{empty_stars}</div>"
 
+@app.get("/api/coalescer")
+async def get_coalescer_stats(response: Response):
+    response.headers["Cache-Control"] = http_cache.SEM_CACHE
+    return coalescer.stats()
 
+
+@app.get("/api/prerender")
+async def get_prerender_stats(response: Response):
+    response.headers["Cache-Control"] = http_cache.SEM_CACHE
+    return prerender.stats()
+
+
+@app.get("/api/eventos")
+async def get_eventos_stats(response: Response):
+    response.headers["Cache-Control"] = http_cache.SEM_CACHE
+    return eventos.stats()
+
+
+@app.get("/api/preparadas")
+async def get_prepared_stats(response: Response, db=Depends(get_db)):
+    # Execuções por consulta neste processo e os statements preparados na
+    # conexão que atendeu a requisição
+    response.headers["Cache-Control"] = http_cache.SEM_CACHE
+    return {**preparadas.stats(), "conexao": await preparadas.stats_conexao(db)}
+
+
+@app.get("/metrics")
+async def get_metrics():
+    content, media_type = metrics.exposicao()
+    return Response(content=content, media_type=media_type, headers={"Cache-Control": http_cache.SEM_CACHE})
+
+
+@app.get("/api/usuarios", response_model=List[models.UserInfo])
+async def get_user(username: str, db=Depends(get_db_leitura)):
+    user = await models.get_user(db, username)
+    if user is None:
+        raise HTTPException(status_code=404, detail="Usuário não encontrado")
+    return ORJSONResponse([user.info()], headers={"Cache-Control": http_cache.SEM_CACHE})
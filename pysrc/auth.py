@@ -0,0 +1,118 @@
+import base64
+import hashlib
+import hmac
+import logging
+import os
+import secrets
+import time
+from http.cookies import CookieError, SimpleCookie
+from typing import NamedTuple, Optional
+
+from fastapi import HTTPException, Request
+
+logger = logging.getLogger(__name__)
+
+COOKIE = "sessao"
+# Validade do token em segundos (padrão 8 horas)
+TTL = int(os.getenv("SESSION_TTL", str(8 * 3600)))
+COOKIE_SECURE = os.getenv("SESSION_COOKIE_SECURE", "0").lower() not in ("0", "false", "no")
+
+
+def _chave() -> bytes:
+    chave = os.getenv("SESSION_SECRET")
+    if chave:
+        return chave.encode("utf-8")
+    # Sem chave configurada os tokens só valem neste processo e até ele reiniciar
+    logger.warning("SESSION_SECRET não definido: usando uma chave aleatória")
+    return secrets.token_bytes(32)
+
+
+_CHAVE = _chave()
+
+
+class Sessao(NamedTuple):
+    user_id: int
+    is_admin: bool
+    expira_em: int
+
+
+def _assinatura(dados: str) -> str:
+    digest = hmac.new(_CHAVE, dados.encode("ascii"), hashlib.sha256).digest()
+    return base64.urlsafe_b64encode(digest).rstrip(b"=").decode("ascii")
+
+
+def emitir(user_id: int, is_admin: bool) -> tuple[str, Sessao]:
+    # Token "user_id.is_admin.expira_em.assinatura": os dados não são secretos,
+    # só não podem ser alterados sem a chave
+    sessao = Sessao(user_id, is_admin, int(time.time()) + TTL)
+    dados = f"{sessao.user_id}.{int(sessao.is_admin)}.{sessao.expira_em}"
+    return f"{dados}.{_assinatura(dados)}", sessao
+
+
+def verificar(token: str) -> Optional[Sessao]:
+    dados, _, assinatura = token.rpartition(".")
+    try:
+        if not hmac.compare_digest(assinatura, _assinatura(dados)):
+            return None
+        user_id, is_admin, expira_em = map(int, dados.split("."))
+    except (TypeError, ValueError):
+        return None
+    if expira_em < time.time():
+        return None
+    return Sessao(user_id, bool(is_admin), expira_em)
+
+
+def _token(headers) -> Optional[str]:
+    # Authorization: Bearer <token> tem prioridade sobre o cookie
+    cookie = None
+    for nome, valor in headers:
+        if nome == b"authorization":
+            tipo, _, token = valor.decode("latin-1").partition(" ")
+            if tipo.lower() == "bearer":
+                return token.strip()
+        elif nome == b"cookie":
+            try:
+                cookies = SimpleCookie(valor.decode("latin-1"))
+            except CookieError:
+                continue
+            if COOKIE in cookies:
+                cookie = cookies[COOKIE].value
+    return cookie
+
+
+class SessaoMiddleware:
+    # Confere o token de cada requisição sem ir ao banco e deixa o resultado
+    # (Sessao ou None) em scope["sessao"]
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http":
+            token = _token(scope["headers"])
+            scope["sessao"] = verificar(token) if token else None
+        await self.app(scope, receive, send)
+
+
+def get_sessao(request: Request) -> Optional[Sessao]:
+    return request.scope.get("sessao")
+
+
+def exigir_usuario(user_id: int, request: Request) -> Sessao:
+    # Dependência das rotas /api/turma/{turma_id}/{user_id}/...: a sessão tem
+    # que ser do usuário da URL
+    sessao = get_sessao(request)
+    if sessao is None:
+        raise HTTPException(status_code=401, detail="Login necessário")
+    if sessao.user_id != user_id:
+        raise HTTPException(status_code=403, detail="Sessão de outro usuário")
+    return sessao
+
+
+def exigir_admin(request: Request) -> Sessao:
+    # Dependência das rotas de moderação e de importação
+    sessao = get_sessao(request)
+    if sessao is None:
+        raise HTTPException(status_code=401, detail="Login necessário")
+    if not sessao.is_admin:
+        raise HTTPException(status_code=403, detail="Apenas administradores")
+    return sessao
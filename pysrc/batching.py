@@ -0,0 +1,176 @@
+import asyncio
+import logging
+import os
+from typing import Optional
+
+import psycopg
+
+from pysrc import connection
+from pysrc import models
+
+logger = logging.getLogger(__name__)
+
+# Modo opcional para picos de avaliações (fim de semestre): em vez de um
+# INSERT por requisição, as avaliações entram numa fila e uma única tarefa as
+# grava em lotes (models.add_avaliacoes). Cada requisição espera o lote dela
+# ser confirmado e recebe o id atribuído.
+
+
+class FilaCheia(Exception):
+    pass
+
+
+def enabled() -> bool:
+    return os.getenv("BATCH_AVALIACOES", "0").lower() not in ("0", "false", "no")
+
+
+def _config():
+    return dict(
+        # Grava quando o lote chega a max_itens ou max_espera segundos depois
+        # do primeiro item, o que vier antes
+        max_itens=int(os.getenv("BATCH_MAX_ITENS", "200")),
+        max_espera=float(os.getenv("BATCH_MAX_ESPERA_MS", "5")) / 1000,
+        # Backpressure: com a fila cheia a requisição espera até
+        # timeout_fila segundos por uma vaga e então recebe FilaCheia (503)
+        tamanho_fila=int(os.getenv("BATCH_FILA_MAX", "5000")),
+        timeout_fila=float(os.getenv("BATCH_FILA_TIMEOUT", "1")),
+        # "sincrona": confirma depois do COMMIT gravado no disco (como sem
+        # lotes). "assincrona": synchronous_commit = off, o COMMIT volta antes
+        # do fsync do WAL; uma queda do Postgres pode perder os últimos lotes
+        # já confirmados, sem corromper nada.
+        synchronous_commit=os.getenv("BATCH_DURABILIDADE", "sincrona") != "assincrona",
+    )
+
+
+class Lotes:
+    def __init__(self, max_itens: int, max_espera: float, tamanho_fila: int,
+                 timeout_fila: float, synchronous_commit: bool):
+        self.max_itens = max_itens
+        self.max_espera = max_espera
+        self.timeout_fila = timeout_fila
+        self.synchronous_commit = synchronous_commit
+        # (turma_id, avaliacao, future)
+        self.fila: asyncio.Queue = asyncio.Queue(tamanho_fila)
+        self.lotes = 0
+        self.itens = 0
+        self.rejeitados = 0
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        self._task = asyncio.create_task(self._loop())
+
+    async def stop(self):
+        # Grava o que já está na fila antes de parar
+        await self.fila.join()
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+
+    async def add_avaliacao(self, turma_id: int, avaliacao: models.AvaliacaoIn) -> models.Avaliacao:
+        future = asyncio.get_running_loop().create_future()
+        try:
+            await asyncio.wait_for(self.fila.put((turma_id, avaliacao, future)), self.timeout_fila)
+        except asyncio.TimeoutError:
+            self.rejeitados += 1
+            raise FilaCheia()
+        return await future
+
+    async def _proximo_lote(self) -> list:
+        lote = [await self.fila.get()]
+        prazo = asyncio.get_running_loop().time() + self.max_espera
+        while len(lote) < self.max_itens:
+            if not self.fila.empty():
+                lote.append(self.fila.get_nowait())
+                continue
+            espera = prazo - asyncio.get_running_loop().time()
+            if espera <= 0:
+                break
+            try:
+                lote.append(await asyncio.wait_for(self.fila.get(), espera))
+            except asyncio.TimeoutError:
+                break
+        return lote
+
+    async def _loop(self):
+        while True:
+            lote = await self._proximo_lote()
+            try:
+                await self._gravar(lote)
+            finally:
+                for _ in lote:
+                    self.fila.task_done()
+
+    async def _gravar(self, lote: list):
+        try:
+            async with connection.connect() as conn:
+                avaliacoes = await models.add_avaliacoes(
+                    conn, [(turma_id, avaliacao) for turma_id, avaliacao, _ in lote], self.synchronous_commit
+                )
+        except (psycopg.IntegrityError, psycopg.DataError) as e:
+            if len(lote) == 1:
+                self._falhar(lote, e)
+                return
+            # Um item inválido (ex.: turma inexistente) derruba o lote
+            # inteiro: grava as duas metades e só divide de novo a que falhar,
+            # até isolar os inválidos. Os itens bons entram em poucos INSERTs
+            # (uns 2*log2(n) com um item inválido), não um por item.
+            meio = len(lote) // 2
+            await self._gravar(lote[:meio])
+            await self._gravar(lote[meio:])
+            return
+        except Exception as e:
+            logger.exception("Falha ao gravar lote de %d avaliações", len(lote))
+            self._falhar(lote, e)
+            return
+
+        self.lotes += 1
+        self.itens += len(lote)
+        for (_, _, future), avaliacao in zip(lote, avaliacoes):
+            # A requisição pode ter sido cancelada (cliente desconectou)
+            if not future.done():
+                future.set_result(avaliacao)
+
+    def _falhar(self, lote: list, e: Exception):
+        for _, _, future in lote:
+            if not future.done():
+                future.set_exception(e)
+
+    def stats(self) -> dict:
+        return {
+            "enabled": True,
+            "fila": self.fila.qsize(),
+            "max_itens": self.max_itens,
+            "max_espera": self.max_espera,
+            "synchronous_commit": self.synchronous_commit,
+            "lotes": self.lotes,
+            "itens": self.itens,
+            "media_por_lote": self.itens / self.lotes if self.lotes else 0,
+            "rejeitados": self.rejeitados,
+        }
+
+
+lotes: Optional[Lotes] = None
+
+
+def start():
+    global lotes
+    if lotes is not None or not enabled():
+        return
+    lotes = Lotes(**_config())
+    lotes.start()
+
+
+async def stop():
+    global lotes
+    if lotes is None:
+        return
+    await lotes.stop()
+    lotes = None
+
+
+def stats() -> dict:
+    if lotes is None:
+        return {"enabled": False}
+    return lotes.stats()
@@ -0,0 +1,230 @@
+import asyncio
+import codecs
+import csv
+import io
+import itertools
+import json
+import os
+import tempfile
+from typing import IO, AsyncIterator, Iterator
+
+import psycopg
+from pydantic import ValidationError
+
+from pysrc import models
+
+CHUNK_SIZE = 5000
+# Corpo de requisição acima disso vai para um arquivo temporário em disco
+SPOOL_MAX_MEMORY = 16 * 1024 * 1024
+# O corpo é conferido e gravado em blocos deste tamanho, numa thread
+SPOOL_BLOCO = 1024 * 1024
+# Maior arquivo de importação aceito (corpo da requisição)
+IMPORTACAO_MAX_BYTES = int(os.getenv("IMPORTACAO_MAX_MB", "512")) * 1024 * 1024
+
+FORMATOS = ("csv", "ndjson")
+
+
+def formato_do_arquivo(path: str) -> str:
+    if path.endswith((".ndjson", ".jsonl")):
+        return "ndjson"
+    return "csv"
+
+
+class ArquivoInvalido(Exception):
+    # O arquivo inteiro é recusado, antes de importar qualquer linha
+    def __init__(self, linha: int, erro: str):
+        super().__init__(f"linha {linha}: {erro}")
+        self.erro = models.ImportErro(linha=linha, erro=erro)
+
+
+class ArquivoGrandeDemais(Exception):
+    def __init__(self, limite: int):
+        super().__init__(f"arquivo maior que {limite // (1024 * 1024)} MB")
+
+
+class ConferirUtf8:
+    # Confere a codificação antes da importação: o erro só apareceria no meio
+    # dela, com os chunks anteriores já gravados. Incremental, em pedaços de
+    # qualquer tamanho (um caractere pode ficar dividido entre dois), contando
+    # as linhas para dizer onde está o erro.
+    def __init__(self):
+        self._decoder = codecs.getincrementaldecoder("utf-8")()
+        self.linha = 1
+        # Bytes da linha atual já conferidos
+        self.coluna = 0
+
+    def conferir(self, pedaco: bytes, final: bool = False):
+        pendentes, _ = self._decoder.getstate()
+        try:
+            self._decoder.decode(pedaco, final)
+        except UnicodeDecodeError as e:
+            # e.start conta a partir dos bytes pendentes do pedaço anterior
+            # (um caractere incompleto, sem \n); posicao, a partir de pedaco
+            posicao = e.start - len(pendentes)
+            antes = max(posicao, 0)
+            fim_de_linha = pedaco.rfind(b"\n", 0, antes)
+            coluna = posicao - fim_de_linha - 1 if fim_de_linha >= 0 else self.coluna + posicao
+            byte = (pendentes + pedaco)[e.start]
+            raise ArquivoInvalido(
+                self.linha + pedaco.count(b"\n", 0, antes),
+                f"texto não está em UTF-8 (byte {byte:#04x} na posição {coluna + 1})"
+            )
+        fim_de_linha = pedaco.rfind(b"\n")
+        self.linha += pedaco.count(b"\n")
+        self.coluna = len(pedaco) - fim_de_linha - 1 if fim_de_linha >= 0 else self.coluna + len(pedaco)
+
+
+def conferir_utf8(raw: IO[bytes]):
+    # O arquivo inteiro (CLI), do início; volta ao início no final
+    conferir = ConferirUtf8()
+    while pedaco := raw.read(SPOOL_BLOCO):
+        conferir.conferir(pedaco)
+    conferir.conferir(b"", final=True)
+    raw.seek(0)
+
+
+async def spool(chunks: AsyncIterator[bytes], max_bytes: int = IMPORTACAO_MAX_BYTES) -> IO[str]:
+    # Grava o corpo num arquivo temporário conferindo o UTF-8 no caminho, em
+    # blocos de SPOOL_BLOCO numa thread: um arquivo grande não trava o event
+    # loop nem é lido duas vezes. Levanta ArquivoInvalido se o corpo não for
+    # UTF-8 e ArquivoGrandeDemais acima de max_bytes (sem ler o resto).
+    raw = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_MEMORY)
+    conferir = ConferirUtf8()
+
+    def gravar(bloco: bytes, final: bool = False):
+        conferir.conferir(bloco, final)
+        raw.write(bloco)
+
+    try:
+        bloco, total = bytearray(), 0
+        async for chunk in chunks:
+            total += len(chunk)
+            if total > max_bytes:
+                raise ArquivoGrandeDemais(max_bytes)
+            bloco += chunk
+            if len(bloco) >= SPOOL_BLOCO:
+                await asyncio.to_thread(gravar, bytes(bloco))
+                bloco.clear()
+        await asyncio.to_thread(gravar, bytes(bloco), True)
+        raw.seek(0)
+    except BaseException:
+        raw.close()
+        raise
+    return io.TextIOWrapper(raw, encoding="utf-8", newline="")
+
+
+def iter_records(f: IO[str], formato: str) -> Iterator[tuple[int, dict]]:
+    # Gera (número da linha no arquivo, registro). No CSV a linha 1 é o cabeçalho
+    # e campos vazios viram None; no NDJSON linhas em branco são ignoradas.
+    if formato == "csv":
+        reader = csv.DictReader(f)
+        for record in reader:
+            yield reader.line_num, {k: (v if v != "" else None) for k, v in record.items()}
+        return
+
+    for linha, texto in enumerate(f, start=1):
+        if not texto.strip():
+            continue
+        try:
+            record = json.loads(texto)
+        except ValueError as e:
+            record = e
+        yield linha, record
+
+
+def _chunks(records: Iterator[tuple[int, dict]]):
+    while True:
+        chunk = list(itertools.islice(records, CHUNK_SIZE))
+        if not chunk:
+            return
+        yield chunk
+
+
+def _erro_validacao(e: Exception) -> str:
+    if isinstance(e, ValidationError):
+        return "; ".join(f"{'.'.join(map(str, err['loc']))}: {err['msg']}" for err in e.errors())
+    return str(e)
+
+
+def _parse(chunk, model, resultado: models.ImportResultado):
+    validos = []
+    for linha, record in chunk:
+        try:
+            if not isinstance(record, dict):
+                raise ValueError(f"registro inválido: {record}")
+            validos.append((linha, model.parse_obj(record)))
+        except (ValidationError, ValueError) as e:
+            resultado.erros.append(models.ImportErro(linha=linha, erro=_erro_validacao(e)))
+    return validos
+
+
+async def _copy_chunk(conn, copy, rows, linhas, resultado: models.ImportResultado) -> bool:
+    # Cada chunk é uma transação: um erro no COPY descarta só este chunk
+    if not rows:
+        return False
+    try:
+        async with conn.transaction():
+            await copy(conn, rows)
+    except psycopg.Error as e:
+        erro = f"chunk rejeitado pelo banco: {e}"
+        resultado.erros.extend(models.ImportErro(linha=linha, erro=erro) for linha in linhas)
+        return False
+
+    resultado.inseridos += len(rows)
+    return True
+
+
+async def import_users(conn, f: IO[str], formato: str) -> models.ImportResultado:
+    resultado = models.ImportResultado()
+    for chunk in _chunks(iter_records(f, formato)):
+        validos = _parse(chunk, models.UserImport, resultado)
+
+        # O login é pelo nome: rejeita nomes repetidos no arquivo ou já cadastrados
+        existentes = await models.get_user_ids_by_nome(conn, {user.nome for _, user in validos})
+        rows, linhas, vistos = [], [], set()
+        for linha, user in validos:
+            if user.nome in existentes or user.nome in vistos:
+                resultado.erros.append(models.ImportErro(linha=linha, erro=f"nome já cadastrado: {user.nome}"))
+                continue
+            vistos.add(user.nome)
+            rows.append(user)
+            linhas.append(linha)
+
+        await _copy_chunk(conn, models.copy_users, rows, linhas, resultado)
+
+    resultado.erros.sort(key=lambda e: e.linha)
+    return resultado
+
+
+async def import_avaliacoes(conn, f: IO[str], formato: str) -> models.ImportResultado:
+    resultado = models.ImportResultado()
+    for chunk in _chunks(iter_records(f, formato)):
+        validos = _parse(chunk, models.AvaliacaoImport, resultado)
+
+        # Resolve as referências do chunk inteiro com uma consulta por tipo
+        user_ids_por_nome = await models.get_user_ids_by_nome(
+            conn, {a.user_nome for _, a in validos if a.user_id is None}
+        )
+        user_ids = await models.get_existing_user_ids(
+            conn, {a.user_id for _, a in validos if a.user_id is not None}
+        )
+        turmas = await models.get_turmas_refs(conn, {a.turma_id for _, a in validos})
+
+        rows, linhas = [], []
+        for linha, a in validos:
+            user_id = a.user_id if a.user_id is not None else user_ids_por_nome.get(a.user_nome)
+            if user_id is None or (a.user_id is not None and a.user_id not in user_ids):
+                erro = f"usuário não encontrado: {a.user_id if a.user_id is not None else a.user_nome}"
+                resultado.erros.append(models.ImportErro(linha=linha, erro=erro))
+            elif a.turma_id not in turmas:
+                resultado.erros.append(models.ImportErro(linha=linha, erro=f"turma não encontrada: {a.turma_id}"))
+            else:
+                rows.append((a.pontuacao, a.comentario, user_id, a.turma_id))
+                linhas.append(linha)
+
+        if await _copy_chunk(conn, models.copy_avaliacoes, rows, linhas, resultado):
+            for turma_id in {row[3] for row in rows}:
+                models.invalidate_turma(turma_id, *turmas[turma_id])
+
+    resultado.erros.sort(key=lambda e: e.linha)
+    return resultado
@@ -0,0 +1,184 @@
+import os
+import time
+from collections import OrderedDict
+from functools import update_wrapper
+from typing import Any, Hashable, Optional
+
+
+class LRUCache:
+    # Cache LRU com TTL. Cada chave pertence a uma "tag" (nome da função, id da
+    # entidade), para que uma escrita invalide exatamente as chaves afetadas.
+    def __init__(self, max_size: int, ttl: float):
+        self.max_size = max_size
+        self.ttl = ttl
+        # chave -> (expira em, versão dos dados, valor)
+        self._data: OrderedDict[Hashable, tuple[float, Any, Any]] = OrderedDict()
+        self._tags: dict[Hashable, set] = {}
+        self._key_tag: dict[Hashable, Hashable] = {}
+        # Incrementado a cada invalidação da tag; impede que uma leitura que
+        # começou antes da escrita grave no cache um valor já desatualizado
+        self._generations: dict[Hashable, int] = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+        self.stale = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_size > 0 and self.ttl > 0
+
+    def _entry(self, key: Hashable) -> Optional[tuple[float, Any, Any]]:
+        entry = self._data.get(key)
+        if entry is not None and entry[0] < time.monotonic():
+            self._remove(key)
+            self.expirations += 1
+            return None
+        return entry
+
+    def get(self, key: Hashable, versao: Any = None) -> tuple[bool, Any]:
+        # versao: se informada, uma entrada gravada com outra versão é descartada
+        entry = self._entry(key)
+        if entry is None:
+            self.misses += 1
+            return False, None
+
+        _, entry_versao, value = entry
+        if versao is not None and entry_versao != versao:
+            self._remove(key)
+            self.stale += 1
+            self.misses += 1
+            return False, None
+
+        self._data.move_to_end(key)
+        self.hits += 1
+        return True, value
+
+    def peek(self, key: Hashable) -> tuple[bool, Any, Any]:
+        # (encontrada, versão com que foi gravada, valor), sem conferir a versão
+        # nem contar hit/miss: quem chama registra o resultado com count
+        entry = self._entry(key)
+        if entry is None:
+            return False, None, None
+        self._data.move_to_end(key)
+        return True, entry[1], entry[2]
+
+    def count(self, hit: bool, stale: bool = False):
+        if hit:
+            self.hits += 1
+        else:
+            self.misses += 1
+            self.stale += stale
+
+    def generation(self, tag: Hashable) -> int:
+        return self._generations.get(tag, 0)
+
+    def set(self, key: Hashable, tag: Hashable, value: Any, generation: Optional[int] = None, versao: Any = None):
+        if generation is not None and generation != self.generation(tag):
+            return
+
+        if key in self._data:
+            self._remove(key)
+        self._data[key] = (time.monotonic() + self.ttl, versao, value)
+        self._tags.setdefault(tag, set()).add(key)
+        self._key_tag[key] = tag
+
+        while len(self._data) > self.max_size:
+            oldest = next(iter(self._data))
+            self._remove(oldest)
+            self.evictions += 1
+
+    def invalidate(self, *tags: Hashable):
+        for tag in tags:
+            self._generations[tag] = self.generation(tag) + 1
+            for key in self._tags.pop(tag, ()):
+                self._data.pop(key, None)
+                self._key_tag.pop(key, None)
+                self.invalidations += 1
+
+    def clear(self):
+        self._data.clear()
+        self._tags.clear()
+        self._key_tag.clear()
+
+    def _remove(self, key: Hashable):
+        self._data.pop(key, None)
+        tag = self._key_tag.pop(key, None)
+        keys = self._tags.get(tag)
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._tags[tag]
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "size": len(self._data),
+            "max_size": self.max_size,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "invalidations": self.invalidations,
+            "stale": self.stale,
+        }
+
+
+cache = LRUCache(
+    max_size=int(os.getenv("CACHE_MAX_SIZE", "1024")),
+    ttl=float(os.getenv("CACHE_TTL", "60")),
+)
+
+
+class CachedFunction:
+    # Cacheia uma função de models (conn, *args). A tag é (name, args[0]), ou
+    # seja, o id da entidade; funções sem argumentos ficam na tag (name, None).
+    # lookup/store permitem que outra função preencha o mesmo cache (ex.: quando
+    # o valor é buscado num pipeline junto com outras consultas).
+    #
+    # Se a chamada informa a versão atual dos dados (models.get_versao), uma
+    # entrada gravada com outra versão é ignorada: assim uma escrita feita por
+    # outro processo não fica escondida pelo cache até o TTL expirar.
+    def __init__(self, name: str, fn):
+        self.name = name
+        self.fn = fn
+        update_wrapper(self, fn)
+
+    def _tag(self, args) -> Hashable:
+        return (self.name, args[0] if args else None)
+
+    def lookup(self, *args, versao: Any = None) -> tuple[bool, Any, Optional[int]]:
+        if not cache.enabled:
+            return False, None, None
+        found, value = cache.get((self.name, *args), versao)
+        return found, value, cache.generation(self._tag(args))
+
+    def peek(self, *args) -> tuple[bool, Any, Any, Optional[int]]:
+        # Como lookup, para quem precisa da versão com que a entrada foi
+        # gravada (ex.: models._ler_cache, que a usa no ETag)
+        if not cache.enabled:
+            return False, None, None, None
+        found, versao, value = cache.peek((self.name, *args))
+        return found, value, versao, cache.generation(self._tag(args))
+
+    def store(self, args: tuple, value: Any, generation: Optional[int], versao: Any = None):
+        if cache.enabled and value is not None:
+            cache.set((self.name, *args), self._tag(args), value, generation, versao)
+
+    async def __call__(self, conn, *args, versao: Any = None):
+        found, value, generation = self.lookup(*args, versao=versao)
+        if found:
+            return value
+
+        value = await self.fn(conn, *args)
+        self.store(args, value, generation, versao)
+        return value
+
+
+def cached(name: str):
+    def decorator(fn):
+        return CachedFunction(name, fn)
+
+    return decorator
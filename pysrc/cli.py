@@ -0,0 +1,185 @@
+import argparse
+import asyncio
+import io
+import re
+import sys
+import time
+from datetime import datetime, timezone
+
+from pysrc import bulk
+from pysrc import connection
+from pysrc import migrations
+from pysrc import models
+from pysrc import particoes
+from pysrc import prerender
+from pysrc import templates
+
+
+async def stats(args) -> int:
+    async with connection.connect() as conn:
+        if args.acao == "rebuild":
+            await models.rebuild_turma_stats(conn)
+            print("Agregados de Turmas_Avaliacoes_Stats recalculados")
+            return 0
+
+        divergentes = await models.verify_turma_stats(conn)
+
+    for turma_id, armazenado, recontado in divergentes:
+        print(f"turma {turma_id}: armazenado={armazenado} recontado={recontado}")
+    print(f"{len(divergentes)} turma(s) divergente(s)")
+    return 1 if divergentes else 0
+
+
+async def importar(args) -> int:
+    formato = args.formato or bulk.formato_do_arquivo(args.arquivo)
+    with open(args.arquivo, "rb") as raw:
+        try:
+            bulk.conferir_utf8(raw)
+        except bulk.ArquivoInvalido as e:
+            print(e)
+            return 1
+        f = io.TextIOWrapper(raw, encoding="utf-8", newline="")
+        async with connection.connect() as conn:
+            if args.tipo == "usuarios":
+                resultado = await bulk.import_users(conn, f, formato)
+            else:
+                resultado = await bulk.import_avaliacoes(conn, f, formato)
+
+    for erro in resultado.erros:
+        print(f"linha {erro.linha}: {erro.erro}")
+    print(f"{resultado.inseridos} inserido(s), {len(resultado.erros)} erro(s)")
+    return 1 if resultado.erros else 0
+
+
+async def migracoes(args) -> int:
+    async with connection.connect() as conn:
+        if args.acao == "aplicar":
+            aplicadas = await migrations.aplicar(conn)
+            for nome in aplicadas:
+                print(f"aplicada: {nome}")
+            print(f"{len(aplicadas)} migration(s) aplicada(s)")
+            return 0
+
+        if args.acao == "status":
+            for versao, nome, aplicada in await migrations.status(conn):
+                print(f"{versao:04d} {nome}: {'aplicada' if aplicada else 'pendente'}")
+            return 0
+
+        resultado = await migrations.explain(conn, args.escala)
+
+    falhas = 0
+    for arquivo, indice, ok, plano in resultado:
+        buffers = plano["Plan"]
+        print(
+            f"{'ok   ' if ok else 'FALHA'} {arquivo}: {indice} "
+            f"({plano['Execution Time']:.3f} ms, "
+            f"shared hit={buffers.get('Shared Hit Blocks', 0)} read={buffers.get('Shared Read Blocks', 0)})"
+        )
+        falhas += not ok
+    print(f"{len(resultado) - falhas} de {len(resultado)} check(s) usam o índice esperado")
+    return 1 if falhas else 0
+
+
+async def prerenderizar(args) -> int:
+    if args.dir:
+        prerender.DIR = args.dir
+    if not prerender.enabled():
+        print("Defina PRERENDER_DIR ou use --dir")
+        return 1
+    templates.load_all()
+    base = prerender.diretorio()
+    inicio = time.perf_counter()
+    async with connection.connect() as conn:
+        gravadas = await prerender.reconstruir(conn, base)
+    print(f"{gravadas} página(s) em {base} ({time.perf_counter() - inicio:.1f} s)")
+    return 0
+
+
+def semestre(valor: str) -> datetime:
+    # "2024.2" -> início do semestre
+    m = re.fullmatch(r"(\d{4})\.([12])", valor)
+    if m is None:
+        raise argparse.ArgumentTypeError(f"semestre inválido: {valor} (use AAAA.1 ou AAAA.2)")
+    return datetime(int(m.group(1)), 1 if m.group(2) == "1" else 7, 1, tzinfo=timezone.utc)
+
+
+async def particionar(args) -> int:
+    async with connection.connect() as conn:
+        if args.acao == "criar":
+            criadas = await particoes.criar_futuras(conn, args.semestres)
+            if args.desde is not None:
+                criadas = await particoes.criar(conn, args.desde, datetime.now(timezone.utc)) + criadas
+            for nome in criadas:
+                print(f"criada: {nome}")
+            print(f"{len(criadas)} partição(ões) criada(s)")
+            return 0
+
+        if args.acao == "arquivar":
+            if args.ate is None:
+                print("Informe o último semestre a arquivar com --ate AAAA.S")
+                return 1
+            atual = models.semestre_inicio(datetime.now(timezone.utc))
+            if args.ate >= atual:
+                print(f"O semestre atual ({models.semestre_nome(atual)}) não pode ser arquivado")
+                return 1
+            arquivadas = await particoes.arquivar(conn, models.semestre_seguinte(args.ate))
+            for nome, qtd in arquivadas:
+                print(f"arquivada: {nome} ({qtd} avaliações) -> Arquivo.{nome}")
+            print(f"{len(arquivadas)} partição(ões) arquivada(s)")
+            return 0
+
+        lista = await particoes.listar(conn)
+
+    for particao in lista:
+        if particao.fim is None:
+            print(f"{particao.nome}: padrão (semestres sem partição), ~{particao.linhas} avaliações")
+            continue
+        if particao.inicio is None:
+            print(f"{particao.nome}: legado (sem data, fora das tendências), ~{particao.linhas} avaliações")
+            continue
+        print(
+            f"{particao.nome}: {models.semestre_nome(particao.inicio)} "
+            f"({particao.inicio:%Y-%m-%d} a {particao.fim:%Y-%m-%d}), ~{particao.linhas} avaliações"
+        )
+    return 0
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m pysrc.cli")
+    comandos = parser.add_subparsers(dest="comando", required=True)
+
+    p = comandos.add_parser("stats", help="recalcula (rebuild) ou confere (verify) os agregados de avaliações")
+    p.add_argument("acao", choices=["rebuild", "verify"])
+    p.set_defaults(func=stats)
+
+    p = comandos.add_parser("importar", help="importa usuários ou avaliações em massa (CSV ou NDJSON) via COPY")
+    p.add_argument("tipo", choices=["usuarios", "avaliacoes"])
+    p.add_argument("arquivo")
+    p.add_argument("--formato", choices=bulk.FORMATOS, help="padrão: pela extensão (.ndjson/.jsonl, senão csv)")
+    p.set_defaults(func=importar)
+
+    p = comandos.add_parser(
+        "migracoes",
+        help="aplica as migrations pendentes, lista o status ou confere os planos (EXPLAIN) com dados gerados"
+    )
+    p.add_argument("acao", choices=["aplicar", "status", "explain"])
+    p.add_argument("--escala", type=int, default=1, help="multiplicador do volume de dados do explain (padrão 1: 200 mil avaliações)")
+    p.set_defaults(func=migracoes)
+
+    p = comandos.add_parser("prerender", help="gera de novo todas as páginas pré-renderizadas do catálogo")
+    p.add_argument("--dir", help="padrão: PRERENDER_DIR")
+    p.set_defaults(func=prerenderizar)
+
+    p = comandos.add_parser("particoes", help="lista, cria ou arquiva as partições semestrais de Avaliacoes")
+    p.add_argument("acao", choices=["listar", "criar", "arquivar"])
+    p.add_argument("--semestres", type=int, default=None, help="criar: semestres futuros (padrão PARTICOES_SEMESTRES_FUTUROS)")
+    p.add_argument("--desde", type=semestre, help="criar: também os semestres desde este (AAAA.S), para importar avaliações antigas")
+    p.add_argument("--ate", type=semestre, help="arquivar: último semestre arquivado (AAAA.S)")
+    p.set_defaults(func=particionar)
+
+    args = parser.parse_args(argv)
+    return asyncio.run(args.func(args))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,100 @@
+import asyncio
+import os
+from typing import Any, Awaitable, Callable, Hashable
+
+import psycopg
+from fastapi import Request
+
+from pysrc import connection
+from pysrc import metrics
+
+# Leituras quentes idênticas e simultâneas (ex.: o link de um professor
+# compartilhado): a primeira requisição de cada chave (rota + parâmetros) abre
+# a conexão, faz as consultas e monta o conteúdo; as que chegam enquanto ela
+# está em andamento esperam e recebem o mesmo resultado, sem ocupar conexões
+# do pool nem repetir as consultas.
+#
+# Não entram na coalescência:
+# - GETs condicionais (If-None-Match), que normalmente terminam em 304 depois
+#   de consultar só a versão
+# - requisições na janela de read-your-writes (connection.ler_primario), que
+#   não podem receber um resultado começado antes da escrita delas
+#
+# COALESCER_ROTAS: rotas com coalescência, separadas por vírgula ("" desliga).
+
+ROTAS_PADRAO = "professores,disciplina,professor,turma"
+
+
+def _rotas() -> frozenset:
+    return frozenset(rota.strip() for rota in os.getenv("COALESCER_ROTAS", ROTAS_PADRAO).split(",") if rota.strip())
+
+
+class Coalescer:
+    def __init__(self, rotas: frozenset):
+        self.rotas = rotas
+        self._em_andamento: dict[Hashable, asyncio.Task] = {}
+        # rota -> [líderes, seguidores]
+        self._contagem: dict[str, list] = {}
+
+    def ativo(self, rota: str) -> bool:
+        return rota in self.rotas
+
+    async def executar(self, rota: str, chave: tuple, fn: Callable[[], Awaitable]) -> Any:
+        chave = (rota, *chave)
+        contagem = self._contagem.setdefault(rota, [0, 0])
+        task = self._em_andamento.get(chave)
+        seguidor = task is not None
+        if not seguidor:
+            task = asyncio.create_task(fn())
+            self._em_andamento[chave] = task
+            task.add_done_callback(lambda t: self._terminou(chave, t))
+        contagem[seguidor] += 1
+        metrics.registrar_coalescencia(rota, seguidor)
+        # shield: se o cliente que iniciou a consulta desconecta, ela continua
+        # para os que estão esperando
+        return await asyncio.shield(task)
+
+    def _terminou(self, chave: Hashable, task: asyncio.Task):
+        if self._em_andamento.get(chave) is task:
+            del self._em_andamento[chave]
+        # Marca a exceção como lida caso ninguém mais esteja esperando
+        if not task.cancelled():
+            task.exception()
+
+    def stats(self) -> dict:
+        return {
+            "rotas": sorted(self.rotas),
+            "em_andamento": len(self._em_andamento),
+            "por_rota": {
+                rota: {"lideres": lideres, "seguidores": seguidores}
+                for rota, (lideres, seguidores) in self._contagem.items()
+            },
+        }
+
+
+coalescer = Coalescer(_rotas())
+
+
+async def _ler_replica(carregar: Callable[[psycopg.AsyncConnection], Awaitable]) -> Any:
+    async with connection.connect(leitura=True) as db:
+        return await carregar(db)
+
+
+async def ler(
+        request: Request, rota: str, chave: tuple,
+        carregar: Callable[[psycopg.AsyncConnection], Awaitable],
+        abrir: Callable[[], Awaitable[psycopg.AsyncConnection]],
+) -> Any:
+    # carregar(db): consultas da rota; abrir: connection.get_db_leitura_sob_demanda,
+    # usada quando a requisição não entra na coalescência
+    if (
+        not coalescer.ativo(rota)
+        or "if-none-match" in request.headers
+        or connection.ler_primario(request)
+    ):
+        return await carregar(await abrir())
+    return await coalescer.executar(rota, chave, lambda: _ler_replica(carregar))
+
+
+def stats() -> dict:
+    return coalescer.stats()
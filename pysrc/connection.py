@@ -1,6 +1,21 @@
 import psycopg
+from psycopg.conninfo import conninfo_to_dict, make_conninfo
+from psycopg_pool import AsyncConnectionPool, PoolTimeout
+from fastapi import Request, Response
 
+import asyncio
+import logging
+import math
 import os
+import time
+from contextlib import AsyncExitStack, asynccontextmanager
+from time import perf_counter
+from typing import Optional
+
+from pysrc import metrics
+from pysrc import preparadas
+
+logger = logging.getLogger(__name__)
 
 class Database:
     host: str
@@ -9,7 +24,18 @@ class Database:
     password: str
     user: str
 
-async def get_db():
+
+# Pool compartilhado, aberto no lifespan da aplicação (ver open_pool).
+# Enquanto for None, cada requisição abre a sua própria conexão.
+pool: Optional[AsyncConnectionPool] = None
+_health_check_task: Optional[asyncio.Task] = None
+# Réplicas de leitura (ver abrir_replicas), vazia sem POSTGRES_REPLICAS
+replicas: list["Replica"] = []
+_replicas_check_task: Optional[asyncio.Task] = None
+_proxima_replica = 0
+
+
+def get_conninfo() -> str:
     host = os.getenv("POSTGRES_HOST")
     if host is None:
         host = "localhost"
@@ -30,19 +56,317 @@ async def get_db():
     if password is None:
         password = "Felipehbs1"
 
-    async with await psycopg.AsyncConnection.connect(
-            f"""
+    return f"""
             host={host}
             port={port}
             dbname={db_name}
             password={password}
             user={user}
             """
-    ) as aconn:
+
+
+def get_replicas_conninfo() -> list[str]:
+    # POSTGRES_REPLICAS: réplicas separadas por ";", cada uma com os parâmetros
+    # que mudam em relação ao primário (ex.: "port=5433;host=10.0.0.2") ou uma
+    # URL postgresql:// completa
+    replicas = os.getenv("POSTGRES_REPLICAS", "")
+    primario = get_conninfo()
+    return [
+        make_conninfo(primario, **conninfo_to_dict(replica.strip()))
+        for replica in replicas.split(";") if replica.strip()
+    ]
+
+
+def _env_number(name: str, default: float) -> float:
+    value = os.getenv(name)
+    if value is None:
+        return default
+    return float(value)
+
+
+def pool_enabled() -> bool:
+    return os.getenv("POSTGRES_POOL", "1").lower() not in ("0", "false", "no")
+
+
+def _novo_pool(conninfo: str, name: str, timeout: float) -> AsyncConnectionPool:
+    return AsyncConnectionPool(
+        conninfo,
+        min_size=int(_env_number("POSTGRES_POOL_MIN", 2)),
+        max_size=int(_env_number("POSTGRES_POOL_MAX", 10)),
+        # Tempo máximo esperando uma conexão livre antes de PoolTimeout
+        timeout=timeout,
+        # Conexões ociosas além de min_size são fechadas depois de max_idle
+        max_idle=_env_number("POSTGRES_POOL_MAX_IDLE", 600),
+        # Toda conexão é reciclada depois de max_lifetime
+        max_lifetime=_env_number("POSTGRES_POOL_MAX_LIFETIME", 3600),
+        name=name,
+        # Sem BEGIN/COMMIT implícitos: cada comando é confirmado sozinho e quem
+        # precisa de transação usa conn.transaction()
+        kwargs={"autocommit": True},
+        # Prepara as consultas registradas em cada conexão nova (pysrc/preparadas.py)
+        configure=preparadas.aquecer,
+        # Cursores cronometrados (pysrc/metrics.py)
+        connection_class=metrics.ConexaoMedida,
+        open=False,
+    )
+
+
+async def open_pool():
+    global pool, _health_check_task
+    await abrir_replicas()
+    if pool is not None or not pool_enabled():
+        return
+
+    pool = _novo_pool(get_conninfo(), "trabalho_bd", _env_number("POSTGRES_POOL_TIMEOUT", 30))
+    await pool.open(wait=True)
+
+    interval = _env_number("POSTGRES_POOL_CHECK_INTERVAL", 60)
+    if interval > 0:
+        _health_check_task = asyncio.create_task(_health_check(pool, interval))
+
+
+async def close_pool():
+    global pool, _health_check_task
+    await fechar_replicas()
+    if _health_check_task is not None:
+        _health_check_task.cancel()
+        _health_check_task = None
+
+    if pool is not None:
+        await pool.close()
+        pool = None
+
+
+async def _health_check(p: AsyncConnectionPool, interval: float):
+    # Testa as conexões ociosas e descarta as quebradas (ex.: após restart do Postgres)
+    while True:
+        await asyncio.sleep(interval)
+        await p.check()
+
+
+def pool_stats() -> dict:
+    if pool is None:
+        stats = {"enabled": False}
+    else:
+        stats = pool.get_stats()
+        stats["enabled"] = True
+    stats["replicas"] = [replica.stats() for replica in replicas]
+    return stats
+
+
+# Réplicas de leitura. Os GETs (get_db_leitura) usam a réplica disponível
+# menos ocupada (empates em round-robin); se nenhuma responde, o primário.
+# Uma réplica que falha ao conectar ou fica mais atrasada que
+# POSTGRES_REPLICA_MAX_LAG sai da rotação até a próxima verificação boa.
+
+# Segundos esperando conexão de uma réplica antes de tentar a próxima
+REPLICA_TIMEOUT = _env_number("POSTGRES_REPLICA_TIMEOUT", 2)
+# Intervalo da verificação de atraso/saúde das réplicas
+REPLICA_CHECK_INTERVAL = _env_number("POSTGRES_REPLICA_CHECK_INTERVAL", 5)
+# Atraso máximo aceito (segundos, 0 = sem limite)
+REPLICA_MAX_LAG = _env_number("POSTGRES_REPLICA_MAX_LAG", 10)
+# Depois de uma escrita, o mesmo cliente lê do primário por esse tempo
+# (segundos, 0 desliga), para ver a própria escrita mesmo com réplica atrasada
+READ_YOUR_WRITES = _env_number("POSTGRES_READ_YOUR_WRITES", 5)
+COOKIE_LER_PRIMARIO = "ler_primario"
+
+
+class Replica:
+    def __init__(self, nome: str, conninfo: str):
+        self.nome = nome
+        self.conninfo = conninfo
+        self.pool: Optional[AsyncConnectionPool] = None
+        self.em_uso = 0
+        self.usos = 0
+        self.falhas = 0
+        # Atraso medido em segundos (None enquanto não medido)
+        self.lag: Optional[float] = None
+        self.fora = False
+
+    def disponivel(self) -> bool:
+        if self.fora:
+            return False
+        return REPLICA_MAX_LAG <= 0 or self.lag is None or self.lag <= REPLICA_MAX_LAG
+
+    def falhou(self, e: Exception):
+        self.falhas += 1
+        if not self.fora:
+            logger.warning("Réplica %s fora de rotação: %s", self.nome, e)
+        self.fora = True
+
+    def stats(self) -> dict:
+        stats = {
+            "nome": self.nome,
+            "disponivel": self.disponivel(),
+            "em_uso": self.em_uso,
+            "usos": self.usos,
+            "falhas": self.falhas,
+            "lag": self.lag,
+        }
+        if self.pool is not None:
+            stats["pool"] = self.pool.get_stats()
+        return stats
+
+
+async def abrir_replicas():
+    global _replicas_check_task
+    if replicas:
+        return
+
+    for i, conninfo in enumerate(get_replicas_conninfo()):
+        replica = Replica(f"replica{i}", conninfo)
+        if pool_enabled():
+            # Sem esperar: a aplicação sobe mesmo com uma réplica fora do ar
+            replica.pool = _novo_pool(conninfo, replica.nome, REPLICA_TIMEOUT)
+            await replica.pool.open(wait=False)
+        replicas.append(replica)
+
+    if replicas and REPLICA_CHECK_INTERVAL > 0:
+        _replicas_check_task = asyncio.create_task(_replicas_check(REPLICA_CHECK_INTERVAL))
+
+
+async def fechar_replicas():
+    global _replicas_check_task
+    if _replicas_check_task is not None:
+        _replicas_check_task.cancel()
+        _replicas_check_task = None
+
+    for replica in replicas:
+        if replica.pool is not None:
+            await replica.pool.close()
+    replicas.clear()
+
+
+async def _medir_lag(replica: Replica):
+    # Em dia quando tudo o que foi recebido já foi aplicado; senão, o tempo
+    # desde a última transação aplicada. Fora de recovery (ex.: apontando para
+    # o próprio primário) as funções retornam NULL e o atraso é 0.
+    async with _conexao_replica(replica) as aconn:
+        cursor = await aconn.execute("""
+                                     SELECT CASE
+                                         WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+                                         ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp())::float8
+                                     END
+        """)
+        (lag,) = await cursor.fetchone()
+    replica.lag = lag or 0.0
+
+
+async def _replicas_check(interval: float):
+    while True:
+        await asyncio.sleep(interval)
+        for replica in replicas:
+            try:
+                if replica.pool is not None:
+                    await replica.pool.check()
+                await _medir_lag(replica)
+            except (PoolTimeout, psycopg.Error) as e:
+                replica.falhou(e)
+                continue
+            if replica.fora:
+                logger.warning("Réplica %s de volta à rotação", replica.nome)
+            replica.fora = False
+
+
+def _ordem_replicas() -> list[Replica]:
+    # Round-robin e depois a menos ocupada: a ordenação é estável, então
+    # réplicas igualmente ocupadas se revezam
+    global _proxima_replica
+    disponiveis = [replica for replica in replicas if replica.disponivel()]
+    if not disponiveis:
+        return []
+    _proxima_replica = (_proxima_replica + 1) % len(disponiveis)
+    disponiveis = disponiveis[_proxima_replica:] + disponiveis[:_proxima_replica]
+    return sorted(disponiveis, key=lambda replica: replica.em_uso)
+
+
+@asynccontextmanager
+async def _conexao(p: Optional[AsyncConnectionPool], conninfo: str, **kwargs):
+    inicio = perf_counter()
+    if p is not None:
+        async with p.connection() as aconn:
+            metrics.registrar_conexao(perf_counter() - inicio)
+            yield aconn
+        return
+
+    async with await metrics.ConexaoMedida.connect(conninfo, autocommit=True, **kwargs) as aconn:
+        metrics.registrar_conexao(perf_counter() - inicio)
+        yield aconn
+
+
+def _conexao_replica(replica: Replica):
+    # Sem pool, connect_timeout faz o papel do timeout do pool da réplica
+    return _conexao(replica.pool, replica.conninfo, connect_timeout=max(1, math.ceil(REPLICA_TIMEOUT)))
+
+
+@asynccontextmanager
+async def connect(leitura: bool = False):
+    # leitura=True: só consultas, pode ir para uma réplica
+    if leitura:
+        for replica in _ordem_replicas():
+            async with AsyncExitStack() as stack:
+                try:
+                    aconn = await stack.enter_async_context(_conexao_replica(replica))
+                except (PoolTimeout, psycopg.OperationalError) as e:
+                    replica.falhou(e)
+                    continue
+                replica.em_uso += 1
+                replica.usos += 1
+                try:
+                    yield aconn
+                except psycopg.Error as e:
+                    # Conexão perdida no meio da requisição (réplica caiu):
+                    # esta requisição falha, as próximas vão para outra
+                    if aconn.broken:
+                        replica.falhou(e)
+                    raise
+                finally:
+                    replica.em_uso -= 1
+                return
+
+    async with _conexao(pool, get_conninfo()) as aconn:
+        yield aconn
+
+
+def ler_primario(request: Request) -> bool:
+    try:
+        return float(request.cookies.get(COOKIE_LER_PRIMARIO, 0)) > time.time()
+    except ValueError:
+        return False
+
+
+def marcar_escrita(response: Response):
+    # Cookie com o fim da janela de read-your-writes: vale em qualquer worker
+    if READ_YOUR_WRITES <= 0 or not replicas:
+        return
+    response.set_cookie(
+        COOKIE_LER_PRIMARIO, str(time.time() + READ_YOUR_WRITES),
+        max_age=math.ceil(READ_YOUR_WRITES), path="/", httponly=True, samesite="lax"
+    )
+
+
+async def get_db():
+    async with connect() as aconn:
         yield aconn
 
     return
 
+
+async def get_db_leitura(request: Request):
+    async with connect(leitura=not ler_primario(request)) as aconn:
+        yield aconn
+
+
+async def get_db_leitura_sob_demanda(request: Request):
+    # Entrega uma função que abre a conexão de leitura só se a rota precisar
+    # dela (ver pysrc/coalescer.py); aberta, fica até o fim da resposta, como
+    # em get_db_leitura
+    async with AsyncExitStack() as stack:
+        async def abrir() -> psycopg.AsyncConnection:
+            return await stack.enter_async_context(connect(leitura=not ler_primario(request)))
+
+        yield abrir
+
 async def config_db():
     host = os.getenv("POSTGRES_HOST")
     if host is None:
@@ -64,10 +388,10 @@ async def config_db():
     if password is None:
         password = "Felipehbs1"
 
-    Database.host = host 
-    Database.db_name = db_name 
-    Database.user = user 
-    Database.port = port 
-    Database.password = password 
+    Database.host = host
+    Database.db_name = db_name
+    Database.user = user
+    Database.port = port
+    Database.password = password
 
 
@@ -0,0 +1,215 @@
+import asyncio
+import logging
+import os
+from typing import Optional
+
+import orjson
+import psycopg
+
+from pysrc import connection
+from pysrc import models
+from pysrc.cache import cache
+
+logger = logging.getLogger(__name__)
+
+# Atualizações ao vivo das páginas de turma (Server-Sent Events). Um trigger
+# em Avaliacoes (migration 0010) manda, a cada comando confirmado, um NOTIFY
+# no canal "avaliacoes" por turma afetada com os ids inseridos, alterados ou
+# removidos. Cada processo mantém uma única conexão dedicada com LISTEN e
+# repassa às páginas abertas da turma só a diferença: as avaliações novas
+# (lidas uma vez por notificação, não por visitante) ou os ids removidos.
+# Quem só está olhando a página não ocupa conexão do pool.
+# Cada notificação também invalida o cache de leitura da turma
+# (models.invalidate_turma_cache): é assim que escritas de outros processos
+# chegam ao cache deste.
+#
+# EVENTOS=0 desliga (o endpoint responde 503 e as páginas ficam estáticas).
+
+CANAL = "avaliacoes"
+# Eventos pendentes por página aberta; um cliente que não acompanha recebe
+# "recarregar" e é desligado
+FILA = int(os.getenv("EVENTOS_FILA", "100"))
+# Comentário enviado nas conexões paradas, para proxies não as fecharem
+HEARTBEAT = float(os.getenv("EVENTOS_HEARTBEAT", "15"))
+# Espera máxima entre tentativas de refazer o LISTEN
+RECONEXAO_MAX = 30
+
+
+def enabled() -> bool:
+    return os.getenv("EVENTOS", "1") != "0"
+
+
+def _evento(tipo: str, dados) -> bytes:
+    return b"event: " + tipo.encode() + b"\ndata: " + orjson.dumps(dados) + b"\n\n"
+
+
+# A página recarrega inteira: o que aconteceu não cabe numa diferença ou pode
+# ter se perdido
+_RECARREGAR = _evento("recarregar", {})
+_HEARTBEAT = b": heartbeat\n\n"
+# Espera do EventSource antes de reconectar (ms)
+_INICIO = b"retry: 5000\n\n"
+
+
+def _trocar(fila: asyncio.Queue, item):
+    # Descarta o que está pendente e deixa só item
+    while not fila.empty():
+        fila.get_nowait()
+    fila.put_nowait(item)
+
+
+class Ouvinte:
+    def __init__(self, conninfo: str, fila: int):
+        self.conninfo = conninfo
+        self.fila = fila
+        # turma_id -> filas das páginas abertas neste processo
+        self._assinantes: dict[int, set[asyncio.Queue]] = {}
+        self._task: Optional[asyncio.Task] = None
+        self.conectado = False
+        self.notificacoes = 0
+        self.eventos = 0
+        self.atrasados = 0
+        self.reconexoes = 0
+
+    def start(self):
+        self._task = asyncio.create_task(self._loop())
+
+    async def stop(self):
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        # Encerra os streams abertos; o navegador reconecta sozinho
+        for filas in self._assinantes.values():
+            for fila in filas:
+                _trocar(fila, None)
+        self._assinantes.clear()
+
+    def _cancelar(self, turma_id: int, fila: asyncio.Queue):
+        filas = self._assinantes.get(turma_id)
+        if filas is None:
+            return
+        filas.discard(fila)
+        if not filas:
+            del self._assinantes[turma_id]
+
+    async def stream(self, turma_id: int):
+        # Corpo da resposta text/event-stream de uma página aberta
+        fila = asyncio.Queue(self.fila)
+        self._assinantes.setdefault(turma_id, set()).add(fila)
+        try:
+            yield _INICIO
+            while True:
+                try:
+                    evento = await asyncio.wait_for(fila.get(), HEARTBEAT)
+                except asyncio.TimeoutError:
+                    yield _HEARTBEAT
+                    continue
+                if evento is None:
+                    return
+                yield evento
+                if evento is _RECARREGAR:
+                    return
+        finally:
+            self._cancelar(turma_id, fila)
+
+    def _publicar(self, turma_id: int, evento: bytes):
+        for fila in list(self._assinantes.get(turma_id, ())):
+            try:
+                fila.put_nowait(evento)
+                self.eventos += 1
+            except asyncio.QueueFull:
+                self.atrasados += 1
+                _trocar(fila, _RECARREGAR)
+                self._cancelar(turma_id, fila)
+
+    async def _montar(self, op: str, ids: Optional[list]) -> bytes:
+        if ids is None:
+            # Comando grande demais para listar os ids no NOTIFY
+            return _RECARREGAR
+        if op == "removidas":
+            return _evento(op, {"ids": ids})
+        # Primário: as réplicas podem ainda não ter a escrita
+        async with connection.connect() as conn:
+            avaliacoes = await models.get_avaliacoes_por_ids(conn, ids)
+        return _evento(op, {"avaliacoes": avaliacoes})
+
+    async def _notificado(self, payload: str):
+        dados = orjson.loads(payload)
+        turma_id = dados["turma_id"]
+        models.invalidate_turma_cache(turma_id, dados["professor_id"], dados["disciplina_id"])
+        if turma_id not in self._assinantes:
+            return
+        try:
+            evento = await self._montar(dados["op"], dados["ids"])
+        except Exception:
+            logger.exception("Falha ao montar o evento da turma %s", turma_id)
+            evento = _RECARREGAR
+        self._publicar(turma_id, evento)
+
+    async def _loop(self):
+        espera = 1
+        while True:
+            try:
+                # Fora do pool: a conexão fica presa ao LISTEN. Keepalives para
+                # perceber uma conexão morta sem tráfego.
+                async with await psycopg.AsyncConnection.connect(
+                    self.conninfo, autocommit=True,
+                    keepalives=1, keepalives_idle=30, keepalives_interval=10, keepalives_count=3
+                ) as conn:
+                    await conn.execute(f"LISTEN {CANAL}")
+                    if self.reconexoes:
+                        # As notificações enviadas enquanto estava
+                        # desconectado se perderam
+                        cache.clear()
+                        for turma_id in list(self._assinantes):
+                            self._publicar(turma_id, _RECARREGAR)
+                    self.conectado = True
+                    espera = 1
+                    async for notificacao in conn.notifies():
+                        self.notificacoes += 1
+                        await self._notificado(notificacao.payload)
+            except Exception:
+                logger.exception("Falha no LISTEN %s", CANAL)
+            self.conectado = False
+            self.reconexoes += 1
+            await asyncio.sleep(espera)
+            espera = min(espera * 2, RECONEXAO_MAX)
+
+    def stats(self) -> dict:
+        return {
+            "enabled": True,
+            "conectado": self.conectado,
+            "turmas": len(self._assinantes),
+            "paginas": sum(len(filas) for filas in self._assinantes.values()),
+            "notificacoes": self.notificacoes,
+            "eventos": self.eventos,
+            "atrasados": self.atrasados,
+            "reconexoes": self.reconexoes,
+        }
+
+
+ouvinte: Optional[Ouvinte] = None
+
+
+def start():
+    global ouvinte
+    if ouvinte is not None or not enabled():
+        return
+    ouvinte = Ouvinte(connection.get_conninfo(), FILA)
+    ouvinte.start()
+
+
+async def stop():
+    global ouvinte
+    if ouvinte is None:
+        return
+    await ouvinte.stop()
+    ouvinte = None
+
+
+def stats() -> dict:
+    if ouvinte is None:
+        return {"enabled": False}
+    return ouvinte.stats()
@@ -0,0 +1,57 @@
+import hashlib
+import re
+from datetime import timezone
+from email.utils import format_datetime
+
+from fastapi import Request, Response
+
+from pysrc import templates
+from pysrc.models import Versao
+
+# As respostas podem ser guardadas, mas sempre revalidadas com If-None-Match
+PUBLICO = "no-cache"
+PRIVADO = "private, no-cache"
+SEM_CACHE = "no-store"
+
+# Partes da chave que entram como estão no ETag; as outras (texto livre, como
+# a consulta da busca) entram como hash
+_PARTE_SEGURA = re.compile(r"[\w.+-]*", re.ASCII)
+
+
+def _parte(valor) -> str:
+    valor = "" if valor is None else str(valor)
+    if _PARTE_SEGURA.fullmatch(valor):
+        return valor
+    return hashlib.blake2b(valor.encode("utf-8"), digest_size=8).hexdigest()
+
+
+def headers(versao: Versao, *chave, privado: bool = False, fraco: bool = False) -> dict:
+    # ETag = entidade + parâmetros que mudam a resposta + versão dos dados +
+    # versão dos templates. Cada parâmetro de query que muda o corpo tem que
+    # estar na chave, senão uma página responde 304 com o ETag de outra.
+    # fraco=True para respostas equivalentes mas não idênticas byte a byte
+    # (ex.: idade_segundos)
+    etag = f'"{"-".join(map(_parte, chave))}-{versao.versao}-{templates.fingerprint}"'
+    h = {
+        "ETag": "W/" + etag if fraco else etag,
+        "Cache-Control": PRIVADO if privado else PUBLICO,
+    }
+    if versao.atualizado_em is not None:
+        h["Last-Modified"] = format_datetime(versao.atualizado_em.astimezone(timezone.utc), usegmt=True)
+    return h
+
+
+def not_modified(request: Request, h: dict) -> bool:
+    # Comparação fraca, como manda a RFC 9110 para If-None-Match
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is None:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+
+    etag = h["ETag"].removeprefix("W/")
+    return any(tag.strip().removeprefix("W/") == etag for tag in if_none_match.split(","))
+
+
+def not_modified_response(h: dict) -> Response:
+    return Response(status_code=304, headers=h)
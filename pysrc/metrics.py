@@ -0,0 +1,304 @@
+import logging
+import os
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
+from time import perf_counter
+from typing import Any, Optional
+
+import psycopg
+from psycopg import sql
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Histogram, generate_latest
+from prometheus_client import multiprocess
+from starlette.datastructures import MutableHeaders
+
+logger = logging.getLogger(__name__)
+
+# Consultas (ou idas ao banco) acima disso vão para o log com SQL e parâmetros.
+# SLOW_QUERY_MS negativo desliga o log.
+LIMITE_CONSULTA_LENTA = float(os.getenv("SLOW_QUERY_MS", "200")) / 1000
+
+HTTP_DURACAO = Histogram(
+    "http_request_duration_seconds", "Duração das requisições", ["handler", "method", "status"]
+)
+CONEXAO_DURACAO = Histogram(
+    "db_connection_acquire_seconds", "Tempo para obter uma conexão (pool ou conexão nova)"
+)
+CONSULTA_DURACAO = Histogram(
+    "db_query_duration_seconds", "Duração de cada ida ao banco, por consulta (nome em preparadas)", ["function"]
+)
+CONSULTAS_POR_REQUISICAO = Histogram(
+    "db_queries_per_request", "Consultas executadas por requisição", ["handler"],
+    buckets=(0, 1, 2, 3, 4, 5, 8, 13, 21, 50, 100, float("inf")),
+)
+IDAS_POR_REQUISICAO = Histogram(
+    "db_round_trips_per_request", "Idas e voltas ao banco por requisição (um pipeline conta uma)", ["handler"],
+    buckets=(0, 1, 2, 3, 4, 5, 8, 13, 21, 50, 100, float("inf")),
+)
+RENDER_DURACAO = Histogram(
+    "template_render_seconds", "Tempo de renderização de cada template", ["template"]
+)
+COALESCIDAS = Counter(
+    "coalesced_requests_total",
+    "Leituras por rota que fizeram as consultas (leader) ou esperaram uma igual em andamento (follower)",
+    ["route", "role"],
+)
+
+
+class Medicao:
+    # Tudo que uma requisição gastou, para o cabeçalho Server-Timing
+    def __init__(self):
+        self.inicio = perf_counter()
+        self.conexao = 0.0
+        self.render = 0.0
+        # nome da consulta -> [consultas, segundos]
+        self.consultas: dict[str, list] = {}
+        # Idas e voltas ao banco: consultas fora de pipeline, cada pipeline e
+        # cada fetch de cursor nomeado
+        self.idas = 0
+
+    def total_consultas(self) -> int:
+        return sum(qtd for qtd, _ in self.consultas.values())
+
+    def server_timing(self) -> str:
+        db = sum(segundos for _, segundos in self.consultas.values())
+        partes = [
+            f"total;dur={(perf_counter() - self.inicio) * 1000:.2f}",
+            f"conn;dur={self.conexao * 1000:.2f}",
+            f'db;dur={db * 1000:.2f};desc="{self.total_consultas()} consultas, {self.idas} idas"',
+            f"render;dur={self.render * 1000:.2f}",
+        ]
+        for funcao, (qtd, segundos) in self.consultas.items():
+            partes.append(f'db.{funcao};dur={segundos * 1000:.2f};desc="{qtd} consultas"')
+        return ", ".join(partes)
+
+
+_atual: ContextVar[Optional[Medicao]] = ContextVar("medicao", default=None)
+
+
+def registrar_conexao(segundos: float):
+    CONEXAO_DURACAO.observe(segundos)
+    medicao = _atual.get()
+    if medicao is not None:
+        medicao.conexao += segundos
+
+
+def registrar_render(template: str, segundos: float):
+    RENDER_DURACAO.labels(template).observe(segundos)
+    medicao = _atual.get()
+    if medicao is not None:
+        medicao.render += segundos
+
+
+def registrar_coalescencia(rota: str, seguidor: bool):
+    COALESCIDAS.labels(rota, "follower" if seguidor else "leader").inc()
+
+
+# Rótulo das consultas executadas neste contexto: o nome da Consulta em
+# preparadas.executar, ou o de rotulo() para SQL fora do registro
+_rotulo: ContextVar[str] = ContextVar("rotulo", default="sql")
+
+
+@contextmanager
+def rotulo(nome: str):
+    token = _rotulo.set(nome)
+    try:
+        yield
+    finally:
+        _rotulo.reset(token)
+
+
+def _texto(conn, query) -> str:
+    if isinstance(query, sql.Composable):
+        return query.as_string(conn)
+    if isinstance(query, bytes):
+        return query.decode("utf-8", "replace")
+    return str(query)
+
+
+def _registrar_consulta(
+        conn, funcao: str, segundos: float, consultas: list[tuple[Any, Any]], qtd: int = 1, idas: int = 1
+):
+    CONSULTA_DURACAO.labels(funcao).observe(segundos)
+    medicao = _atual.get()
+    if medicao is not None:
+        total = medicao.consultas.setdefault(funcao, [0, 0.0])
+        total[0] += qtd
+        total[1] += segundos
+        medicao.idas += idas
+
+    if 0 <= LIMITE_CONSULTA_LENTA <= segundos:
+        for query, params in consultas:
+            texto = _texto(conn, query)
+            # Não grava senhas no log
+            if params is not None and "senha" in texto.lower():
+                params = "<omitidos>"
+            logger.warning(
+                "Consulta lenta (%.1f ms) em %s: %s; parâmetros: %.500r",
+                segundos * 1000, funcao, " ".join(texto.split()), params
+            )
+
+
+class CursorMedido(psycopg.AsyncCursor):
+    # Fora do modo pipeline o execute já traz o resultado inteiro, então só ele
+    # é cronometrado; no pipeline a espera é medida em ConexaoMedida.pipeline
+    async def execute(self, query, params=None, **kwargs):
+        inicio = perf_counter()
+        try:
+            return await super().execute(query, params, **kwargs)
+        finally:
+            self._medir(inicio, query, params)
+
+    async def executemany(self, query, params_seq, **kwargs):
+        inicio = perf_counter()
+        try:
+            return await super().executemany(query, params_seq, **kwargs)
+        finally:
+            self._medir(inicio, query, None)
+
+    @asynccontextmanager
+    async def copy(self, statement, params=None, **kwargs):
+        inicio = perf_counter()
+        try:
+            async with super().copy(statement, params, **kwargs) as copy:
+                yield copy
+        finally:
+            self._medir(inicio, statement, params)
+
+    def _medir(self, inicio: float, query, params):
+        segundos = perf_counter() - inicio
+        funcao = _rotulo.get()
+        pendentes = getattr(self._conn, "_consultas_pipeline", None)
+        if pendentes is not None:
+            pendentes.append((funcao, query, params))
+        # No pipeline a consulta só é enfileirada: a ida conta no fim do bloco
+        idas = 0 if pendentes is not None else 1
+        _registrar_consulta(self._conn, funcao, segundos, [(query, params)], idas=idas)
+
+
+class ServerCursorMedido(psycopg.AsyncServerCursor):
+    # Cursor nomeado: o execute (DECLARE) e cada fetch são idas ao banco; os
+    # fetches somam tempo à mesma consulta sem contar como consultas novas
+    _consulta: tuple[Any, Any] = (None, None)
+    # Rótulo do execute: os fetches podem vir depois, fora do rotulo()
+    _funcao = "sql"
+
+    async def execute(self, query, params=None, **kwargs):
+        self._consulta = (query, params)
+        self._funcao = _rotulo.get()
+        inicio = perf_counter()
+        try:
+            return await super().execute(query, params, **kwargs)
+        finally:
+            self._medir(inicio, 1)
+
+    async def fetchone(self):
+        inicio = perf_counter()
+        try:
+            return await super().fetchone()
+        finally:
+            self._medir(inicio)
+
+    async def fetchmany(self, size: int = 0):
+        inicio = perf_counter()
+        try:
+            return await super().fetchmany(size)
+        finally:
+            self._medir(inicio)
+
+    async def fetchall(self):
+        inicio = perf_counter()
+        try:
+            return await super().fetchall()
+        finally:
+            self._medir(inicio)
+
+    async def __aiter__(self):
+        while True:
+            linhas = await self.fetchmany(self.itersize)
+            for linha in linhas:
+                yield linha
+            if len(linhas) < self.itersize:
+                return
+
+    def _medir(self, inicio: float, qtd: int = 0):
+        _registrar_consulta(self._conn, self._funcao, perf_counter() - inicio, [self._consulta], qtd)
+
+
+class ConexaoMedida(psycopg.AsyncConnection):
+    # Conexão com os cursores acima. Usada pelo pool (connection_class) e pelas
+    # conexões diretas de connection.connect.
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.cursor_factory = CursorMedido
+        self.server_cursor_factory = ServerCursorMedido
+        self._consultas_pipeline: Optional[list] = None
+
+    @asynccontextmanager
+    async def pipeline(self):
+        # As consultas do pipeline voltam todas juntas ao sair do bloco: essa
+        # espera é registrada como uma ida ao banco, rotulada pelas consultas
+        # do pipeline (ex.: "versao_turma+pagina_turma")
+        externo = self._consultas_pipeline is None
+        if externo:
+            self._consultas_pipeline = []
+        inicio = None
+        try:
+            async with super().pipeline() as p:
+                yield p
+                inicio = perf_counter()
+        finally:
+            consultas = self._consultas_pipeline
+            if externo:
+                self._consultas_pipeline = None
+            if externo and inicio is not None:
+                funcao = "+".join(dict.fromkeys(funcao for funcao, _, _ in consultas)) or _rotulo.get()
+                _registrar_consulta(
+                    self, funcao, perf_counter() - inicio, [(query, params) for _, query, params in consultas], qtd=0
+                )
+
+
+class MetricsMiddleware:
+    # Middleware ASGI: abre a Medicao da requisição, acrescenta o Server-Timing
+    # na resposta e alimenta os histogramas quando a requisição termina. Em
+    # respostas em stream o cabeçalho só cobre o que aconteceu antes do início.
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        medicao = Medicao()
+        token = _atual.set(medicao)
+        status = 500
+
+        async def send_medido(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                MutableHeaders(scope=message).append("Server-Timing", medicao.server_timing())
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_medido)
+        finally:
+            _atual.reset(token)
+            # Rótulo pelo padrão da rota ("/api/turma/{turma_id}"), não pela URL,
+            # para não criar uma série por id; o nome da função não serve, há
+            # endpoints diferentes com o mesmo nome
+            route = scope.get("route")
+            handler = getattr(route, "path", "nao_encontrado")
+            HTTP_DURACAO.labels(handler, scope["method"], str(status)).observe(perf_counter() - medicao.inicio)
+            CONSULTAS_POR_REQUISICAO.labels(handler).observe(medicao.total_consultas())
+            IDAS_POR_REQUISICAO.labels(handler).observe(medicao.idas)
+
+
+def exposicao() -> tuple[bytes, str]:
+    # Com vários workers (PROMETHEUS_MULTIPROC_DIR definido) junta as métricas
+    # gravadas por todos os processos
+    if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
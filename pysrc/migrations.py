@@ -0,0 +1,187 @@
+import json
+import os
+import re
+from typing import List
+
+import psycopg
+from psycopg import sql
+
+SQL_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "sql")
+MIGRATIONS_DIR = os.path.join(SQL_DIR, "migrations")
+# Schema inicial, congelado: mudanças novas entram como migrations numeradas
+BASELINE = os.path.join(SQL_DIR, "create_tables.sql")
+
+# sql/migrations/0001_nome.sql (e o check opcional 0001_nome.explain.sql)
+_ARQUIVO = re.compile(r"^(\d+)_(\w+)\.sql$")
+
+
+def migrations_auto() -> bool:
+    return os.getenv("MIGRATIONS_AUTO", "1").lower() not in ("0", "false", "no")
+
+
+def listar() -> List[tuple[int, str, str]]:
+    # (versão, nome, caminho) em ordem de versão
+    migracoes = []
+    for arquivo in os.listdir(MIGRATIONS_DIR):
+        m = _ARQUIVO.match(arquivo)
+        if m:
+            migracoes.append((int(m.group(1)), m.group(2), os.path.join(MIGRATIONS_DIR, arquivo)))
+    migracoes.sort()
+
+    versoes = [versao for versao, _, _ in migracoes]
+    if len(versoes) != len(set(versoes)):
+        raise RuntimeError(f"Versões de migration repetidas em {MIGRATIONS_DIR}")
+    return migracoes
+
+
+def _ler(path: str) -> str:
+    with open(path, encoding="utf-8") as f:
+        return f.read()
+
+
+async def _aplicadas(conn: psycopg.AsyncConnection) -> dict[int, str]:
+    async with conn.cursor() as curr:
+        await curr.execute("SELECT versao, nome FROM Schema_Migrations")
+        return dict(await curr.fetchall())
+
+
+async def aplicar(conn: psycopg.AsyncConnection) -> List[str]:
+    # Idempotente: aplica o baseline se o banco está vazio e depois só as
+    # migrations ainda não registradas em Schema_Migrations, cada uma na sua
+    # transação. O advisory lock serializa vários processos subindo juntos.
+    aplicadas_agora = []
+    async with conn.cursor() as curr:
+        await curr.execute("SELECT pg_advisory_lock(hashtext('Schema_Migrations'))")
+        try:
+            async with conn.transaction():
+                await curr.execute("SELECT to_regclass('avaliacoes') IS NOT NULL")
+                (tem_schema,) = await curr.fetchone()
+                if not tem_schema:
+                    await curr.execute(_ler(BASELINE))
+                    aplicadas_agora.append(os.path.basename(BASELINE))
+
+                await curr.execute("""
+                                   CREATE TABLE IF NOT EXISTS Schema_Migrations (
+                                       versao INT,
+                                       nome VARCHAR NOT NULL,
+                                       aplicada_em TIMESTAMPTZ NOT NULL DEFAULT now(),
+
+                                       PRIMARY KEY(versao)
+                                   )
+                """)
+
+            aplicadas = await _aplicadas(conn)
+            for versao, nome, path in listar():
+                if versao in aplicadas:
+                    continue
+                async with conn.transaction():
+                    await curr.execute(_ler(path))
+                    await curr.execute(
+                        "INSERT INTO Schema_Migrations (versao, nome) VALUES (%s, %s)", (versao, nome)
+                    )
+                aplicadas_agora.append(os.path.basename(path))
+        finally:
+            await curr.execute("SELECT pg_advisory_unlock(hashtext('Schema_Migrations'))")
+
+    return aplicadas_agora
+
+
+async def status(conn: psycopg.AsyncConnection) -> List[tuple[int, str, bool]]:
+    async with conn.cursor() as curr:
+        await curr.execute("SELECT to_regclass('schema_migrations') IS NOT NULL")
+        (existe,) = await curr.fetchone()
+    aplicadas = await _aplicadas(conn) if existe else {}
+    return [(versao, nome, versao in aplicadas) for versao, nome, _ in listar()]
+
+
+# Dados gerados para os checks de EXPLAIN: volume suficiente para o planner
+# preferir os índices. Tudo roda numa transação que é desfeita no final.
+DADOS_EXPLAIN = sql.SQL("""
+INSERT INTO Departamentos (id, nome)
+SELECT base.id + g, 'explain-' || g
+FROM (SELECT COALESCE(MAX(id), 0) as id FROM Departamentos) as base, generate_series(1, 20) g;
+
+INSERT INTO Professores (nome, departamento_id)
+SELECT 'explain-' || g, (SELECT MAX(id) FROM Departamentos) - g % 20
+FROM generate_series(1, 1000 * {escala}) g;
+
+INSERT INTO Disciplinas (nome, departamento_id)
+SELECT 'explain-' || g, (SELECT MAX(id) FROM Departamentos) - g % 20
+FROM generate_series(1, 1000 * {escala}) g;
+
+INSERT INTO Turmas (numero, professor_id, disciplina_id)
+SELECT g::text,
+(SELECT MAX(id) FROM Professores) - g % (1000 * {escala}),
+(SELECT MAX(id) FROM Disciplinas) - g % (1000 * {escala})
+FROM generate_series(1, 10000 * {escala}) g;
+
+INSERT INTO Users (email, nome, matricula, curso, senha, is_admin)
+SELECT 'explain-' || g || '@example.com', 'explain-' || g, g::text, 'explain', 'explain', false
+FROM generate_series(1, 50000 * {escala}) g;
+
+INSERT INTO Avaliacoes (pontuacao, comentario, user_id, turma_id)
+SELECT g % 5 + 1, 'explain ' || g,
+(SELECT MAX(id) FROM Users) - g % (50000 * {escala}),
+(SELECT MAX(id) FROM Turmas) - g % (10000 * {escala})
+FROM generate_series(1, 200000 * {escala}) g;
+
+INSERT INTO Denuncias (user_id, avaliacao_id)
+SELECT (SELECT MAX(id) FROM Users) - g % (50000 * {escala}), (SELECT MAX(id) FROM Avaliacoes) - (g - 1) * 10
+FROM generate_series(1, 20000 * {escala}) g;
+
+ANALYZE Departamentos, Professores, Disciplinas, Turmas, Users, Avaliacoes, Denuncias, Turmas_Avaliacoes_Stats;
+""")
+
+
+def checks() -> List[tuple[str, str, str]]:
+    # (arquivo, índice esperado, consulta) de cada migration. O baseline só tem
+    # chaves primárias; os índices vêm das migrations. Nos arquivos
+    # .explain.sql cada consulta vem depois de um "-- usa: <índice>".
+    arquivos = [path[:-len(".sql")] + ".explain.sql" for _, _, path in listar()]
+
+    resultado = []
+    for path in arquivos:
+        if not os.path.exists(path):
+            continue
+        for bloco in re.split(r"^-- usa:", _ler(path), flags=re.MULTILINE)[1:]:
+            indice, _, consulta = bloco.partition("\n")
+            resultado.append((os.path.basename(path), indice.strip(), consulta.strip().rstrip(";")))
+    return resultado
+
+
+def _indices_do_plano(plano: dict) -> set[str]:
+    indices = {plano["Index Name"].lower()} if "Index Name" in plano else set()
+    for filho in plano.get("Plans", []):
+        indices |= _indices_do_plano(filho)
+    return indices
+
+
+async def _indice_e_particoes(curr, indice: str) -> set[str]:
+    # Num índice de tabela particionada (ex.: Avaliacoes, migration 0009) o
+    # plano mostra os índices de cada partição
+    await curr.execute("""
+                       SELECT Filho.relname
+                       FROM pg_inherits
+                       INNER JOIN pg_class as Pai ON Pai.oid = pg_inherits.inhparent
+                       INNER JOIN pg_class as Filho ON Filho.oid = pg_inherits.inhrelid
+                       WHERE Pai.relname = %s AND Pai.relkind = 'I'
+    """, (indice.lower(),))
+    return {indice.lower()} | {nome.lower() for (nome,) in await curr.fetchall()}
+
+
+async def explain(conn: psycopg.AsyncConnection, escala: int = 1) -> List[tuple[str, str, bool, dict]]:
+    # Gera os dados, roda EXPLAIN (ANALYZE, BUFFERS) em cada check e confere se
+    # o plano usa o índice esperado. Retorna (arquivo, índice, ok, plano).
+    resultado = []
+    async with conn.transaction(force_rollback=True):
+        async with conn.cursor() as curr:
+            await curr.execute(DADOS_EXPLAIN.format(escala=sql.Literal(escala)))
+            for arquivo, indice, consulta in checks():
+                await curr.execute("EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) " + consulta)
+                (plano,) = await curr.fetchone()
+                if isinstance(plano, str):
+                    plano = json.loads(plano)
+                plano = plano[0]
+                ok = bool(await _indice_e_particoes(curr, indice) & _indices_do_plano(plano["Plan"]))
+                resultado.append((arquivo, indice, ok, plano))
+    return resultado
@@ -1,15 +1,78 @@
-from typing import List, Optional
-from pydantic import BaseModel
+import hmac
+import os
+from contextlib import nullcontext
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Any, Awaitable, Callable, Iterable, List, Literal, Optional
+from pydantic import BaseModel, conint, conlist, root_validator, validator
+import orjson
 import psycopg
+from psycopg.adapt import Loader
+from psycopg.rows import args_row
+from psycopg.types.json import set_json_loads
 
+from pysrc import metrics
+from pysrc import preparadas
+from pysrc.cache import CachedFunction, cache, cached
+
+
+AVALIACOES_POR_PAGINA = 50
+RESULTADOS_BUSCA_POR_PAGINA = 20
+DENUNCIAS_POR_PAGINA = 50
+# Avaliações por ação de moderação em lote
+MODERACAO_MAX_AVALIACOES = 10_000
+# Semestres mostrados por padrão nas tendências (o atual e os anteriores)
+TENDENCIA_SEMESTRES = 8
+# Limites opcionais da busca; por padrão (0) ela é exata: todas as ocorrências,
+# ordenadas por ts_rank. Termos muito comuns casam com centenas de milhares de
+# comentários e ordenar todos custa centenas de ms; quem preferir latência a
+# resultados completos liga os limites, e a resposta diz quando eles cortaram
+# ocorrências (BuscaResultado.limitado).
+# Máximo de ocorrências ordenadas por ts_rank (as N mais recentes).
+BUSCA_MAX_CANDIDATOS = int(os.getenv("BUSCA_MAX_CANDIDATOS", "0"))
+# A busca só olha as BUSCA_JANELA avaliações mais recentes (faixa de ids). Sem
+# a faixa, pegar as N mais recentes de um termo comum ainda lê e ordena todas
+# as ocorrências dele; com ela o trabalho não passa da janela.
+BUSCA_JANELA = int(os.getenv("BUSCA_JANELA", "0"))
+
+# Colunas json/jsonb decodificadas com orjson
+set_json_loads(orjson.loads)
+
+# Modelos pydantic só para o que chega do cliente (validação). O que sai do
+# banco vira dataclasses com __slots__, montadas direto pelo row factory do
+# cursor (args_row: colunas na ordem dos campos) e serializadas pelo orjson.
 
 class AvaliacaoIn(BaseModel):
-    user_id: int
+    # Validada antes de entrar num lote (pysrc/batching.py): o que o Postgres
+    # recusaria (id fora do INT, NUL no texto) é 422 aqui, sem derrubar o lote
+    user_id: conint(ge=1, le=2**31 - 1)
     comentario: str
-    pontuacao: int
+    pontuacao: conint(ge=1, le=5)
+
+    @validator("comentario")
+    def check_comentario(cls, comentario):
+        if "\x00" in comentario:
+            raise ValueError("comentário com caractere NUL")
+        return comentario
+
+
+class AvaliacaoImport(BaseModel):
+    # Linha de importação em massa: o autor pode vir pelo id ou pelo nome de login
+    turma_id: int
+    user_id: Optional[int]
+    user_nome: Optional[str]
+    comentario: str
+    pontuacao: conint(ge=1, le=5)
+
+    @root_validator(skip_on_failure=True)
+    def check_user(cls, values):
+        if values.get("user_id") is None and not values.get("user_nome"):
+            raise ValueError("informe user_id ou user_nome")
+        return values
 
 
-class Avaliacao(BaseModel):
+@dataclass(slots=True)
+class Avaliacao:
     id: int
     user_id: int
     user_nome: str
@@ -17,24 +80,59 @@ class Avaliacao(BaseModel):
     pontuacao: int
 
 class UserIn(BaseModel):
+    # Cadastro público: sem is_admin (se vier no corpo é ignorado), então todo
+    # usuário criado por /api/usuario é comum
     email: str
     nome: str
     matricula: str
     curso: str
     senha: str
-    is_admin: bool
 
-class User(BaseModel):
+
+class UserImport(UserIn):
+    # Linha de importação em massa, que só um admin faz: pode criar admins
+    is_admin: bool = False
+
+@dataclass(slots=True)
+class UserInfo:
     id: int
     email: str
     nome: str
     matricula: str
     curso: str
-    senha: str
     is_admin: bool
 
+@dataclass(slots=True)
+class User(UserInfo):
+    senha: str
+
+    def info(self) -> UserInfo:
+        # Sem a senha, para as respostas
+        return UserInfo(self.id, self.email, self.nome, self.matricula, self.curso, self.is_admin)
+
+class Login(BaseModel):
+    nome: str
+    senha: str
+
+@dataclass(slots=True)
+class LoginResultado:
+    user: UserInfo
+    token: str
+    expira_em: datetime
+
+
+class ImportErro(BaseModel):
+    linha: int
+    erro: str
 
-class TurmaInfo(BaseModel):
+
+class ImportResultado(BaseModel):
+    inseridos: int = 0
+    erros: List[ImportErro] = []
+
+
+@dataclass(slots=True)
+class TurmaResumo:
     id: int
     professor_id: int
     professor_nome: str
@@ -42,264 +140,1243 @@ class TurmaInfo(BaseModel):
     disciplina_nome: str
     qtd_avaliacoes: int
     sum_avaliacoes: int
+    histograma: List[int]
+
+
+@dataclass(slots=True)
+class TurmaInfo(TurmaResumo):
     avaliacoes: List[Avaliacao]
+    # id a passar como before_id para buscar a próxima página (None se não houver)
+    proximo_before_id: Optional[int]
+
 
+@dataclass(slots=True)
+class AvaliacoesPage:
+    avaliacoes: List[Avaliacao]
+    proximo_before_id: Optional[int]
 
-class ProfessorItem(BaseModel):
+
+@dataclass(slots=True)
+class ProfessorInfo:
     id: int
     nome: str
-    disciplinas: List[tuple[int, str]]
+    turmas: List[tuple[int, str]]
     qtd_avaliacoes: int
     sum_avaliacoes: int
 
 
-class ProfessorInfo(BaseModel):
+@dataclass(slots=True)
+class DisciplinaItem:
     id: int
     nome: str
-    turmas: List[tuple[int, str]]
+
+
+@dataclass(slots=True)
+class RankingItem:
+    posicao: int
+    professor_id: int
+    professor_nome: str
+    departamento_id: Optional[int]
+    departamento_nome: Optional[str]
     qtd_avaliacoes: int
-    sum_avaliacoes: int
+    media: float
+    score: float
+
 
+@dataclass(slots=True)
+class Ranking:
+    atualizado_em: Optional[datetime]
+    idade_segundos: Optional[float]
+    professores: List[RankingItem]
 
-class DisciplinaItem(BaseModel):
+
+@dataclass(slots=True)
+class BuscaItem:
     id: int
-    nome: str
+    turma_id: int
+    professor_id: int
+    professor_nome: str
+    disciplina_id: int
+    disciplina_nome: str
+    user_nome: str
+    comentario: str
+    pontuacao: int
+    rank: float
+
+
+@dataclass(slots=True)
+class BuscaResultado:
+    resultados: List[BuscaItem]
+    # par a passar como before_rank/before_id para a próxima página
+    proximo_before_rank: Optional[float]
+    proximo_before_id: Optional[int]
+    # True se a busca não cobriu todas as avaliações: houve mais de
+    # BUSCA_MAX_CANDIDATOS ocorrências e só as mais recentes foram ordenadas, ou
+    # há avaliações mais antigas que a BUSCA_JANELA (inclusive numa página vazia)
+    limitado: bool
+
+
+class ModeracaoIn(BaseModel):
+    # "excluir": apaga as avaliações e as denúncias delas; "descartar": só as
+    # denúncias, a avaliação fica
+    acao: Literal["excluir", "descartar"]
+    avaliacao_ids: conlist(conint(ge=1, le=2**31 - 1), min_items=1, max_items=MODERACAO_MAX_AVALIACOES)
+
+
+@dataclass(slots=True)
+class ModeracaoResultado:
+    acao: str
+    avaliacoes: int
+    denuncias: int
 
 
-class DisciplinaInfo(BaseModel):
+@dataclass(slots=True)
+class DenunciaItem:
+    avaliacao_id: int
+    turma_id: Optional[int]
+    user_id: Optional[int]
+    user_nome: Optional[str]
+    comentario: Optional[str]
+    pontuacao: Optional[int]
+    qtd_denuncias: int
+
+
+@dataclass(slots=True)
+class FilaModeracao:
+    itens: List[DenunciaItem]
+    # par a passar como before_qtd/before_id para a próxima página
+    proximo_before_qtd: Optional[int]
+    proximo_before_id: Optional[int]
+
+
+@dataclass(slots=True)
+class SemestreTendencia:
+    semestre: str
+    qtd_avaliacoes: int
+    media: Optional[float]
+
+
+@dataclass(slots=True)
+class Tendencia:
     id: int
-    nome: str
-    professores: List[ProfessorInfo]
+    # Do mais antigo ao atual, inclusive os sem avaliações
+    semestres: List[SemestreTendencia]
+
 
+@dataclass(slots=True)
+class Versao:
+    # Carimbo barato do estado de uma página, usado no ETag/Last-Modified
+    versao: str
+    atualizado_em: Optional[datetime]
 
-async def get_professor_info(conn: psycopg.AsyncConnection, professor_id: int) -> ProfessorInfo:
-    def merge_professor(p: ProfessorInfo, row: tuple) -> ProfessorInfo:
-        if p.nome == "":
-            p.nome = row[1]
 
-        p.qtd_avaliacoes += row[3]
-        p.sum_avaliacoes += row[4]
-        p.turmas.append((row[0], row[2]))
-        return p
+# Uma consulta por escopo: None (todas as turmas), uma turma ou as de um
+# professor/disciplina. O SQL também entra nas consultas das páginas
+# (_registrar_pagina), que leem a versão junto com os dados.
+_VERSAO_SQL = {
+    escopo: """
+                           SELECT Catalogo.versao || '.' || COALESCE(Stats.versao, 0) as versao,
+                           GREATEST(Catalogo.atualizado_em, Stats.atualizado_em) as atualizado_em
+                           FROM Versoes as Catalogo,
+                           LATERAL (
+                               SELECT MAX(Turmas_Avaliacoes_Stats.versao) as versao,
+                               MAX(Turmas_Avaliacoes_Stats.atualizado_em) as atualizado_em
+                               FROM Turmas_Avaliacoes_Stats
+                               INNER JOIN Turmas
+                               ON Turmas.id=Turmas_Avaliacoes_Stats.turma_id
+                               """ + filtro + """
+                           ) as Stats
+                           WHERE Catalogo.nome='catalogo'
+    """
+    for escopo, filtro in (
+        (None, ""),
+        ("turma", "WHERE Turmas.id=%s"),
+        ("professor", "WHERE Turmas.professor_id=%s"),
+        ("disciplina", "WHERE Turmas.disciplina_id=%s"),
+    )
+}
 
+_VERSAO = {
+    escopo: preparadas.registrar(nome, _VERSAO_SQL[escopo], aquecer=() if escopo is None else (0,))
+    for escopo, nome in (
+        (None, "versao"),
+        ("turma", "versao_turma"),
+        ("professor", "versao_professor"),
+        ("disciplina", "versao_disciplina"),
+    )
+}
+
+
+async def get_versao(conn: psycopg.AsyncConnection, escopo: Optional[str] = None, id: Optional[int] = None) -> Versao:
+    # Versão do catálogo + maior versão das avaliações das turmas do escopo
+    # (uma turma, as de um professor/disciplina ou todas, se escopo for None)
+    params = () if escopo is None else (id,)
     async with conn.cursor() as curr:
-        await curr.execute("""
-                           SELECT turma_id,
-                           professor_nome, disciplina_nome,  
-                           qtd_avaliacoes, sum_avaliacoes
+        await preparadas.executar(curr, _VERSAO[escopo], params)
+        versao, atualizado_em = await curr.fetchone()
+        return Versao(versao=versao, atualizado_em=atualizado_em)
+
+
+_VERSAO_CATALOGO = preparadas.registrar(
+    "versao_catalogo", "SELECT versao::text, atualizado_em FROM Versoes WHERE nome='catalogo'", aquecer=()
+)
+
+
+async def get_versao_catalogo(conn: psycopg.AsyncConnection) -> Versao:
+    async with conn.cursor() as curr:
+        await preparadas.executar(curr, _VERSAO_CATALOGO)
+        versao, atualizado_em = await curr.fetchone()
+        return Versao(versao=versao, atualizado_em=atualizado_em)
+
+
+_VERSAO_RANKING = preparadas.registrar("versao_ranking", """
+                           SELECT (EXTRACT(EPOCH FROM atualizado_em) * 1000000)::bigint::text, atualizado_em
+                           FROM Materialized_Views_Refresh
+                           WHERE nome='Professores_Ranking'
+""", aquecer=())
+
+
+async def get_versao_ranking(conn: psycopg.AsyncConnection) -> Versao:
+    # O ranking só muda quando a materialized view é atualizada
+    async with conn.cursor() as curr:
+        await preparadas.executar(curr, _VERSAO_RANKING)
+        versao, atualizado_em = await curr.fetchone() or ("0", None)
+        return Versao(versao=versao, atualizado_em=atualizado_em)
+
+
+class _JsonBrutoLoader(Loader):
+    # Entrega o json como veio do servidor (bytes UTF-8), sem decodificar
+    def load(self, data) -> bytes:
+        return bytes(data)
+
+
+# Páginas numa única ida e volta ao banco: as funções get_pagina_* devolvem a
+# versão (para o ETag) junto com os dados, num pipeline, em vez de ler a
+# versão e depois os dados.
+#
+# Uma página no cache de leitura (dentro do CACHE_TTL) é servida sem ir ao
+# banco, com a versão gravada junto com ela. As escritas deste processo
+# invalidam as entradas afetadas (invalidate_turma); as de outros processos
+# chegam pelo NOTIFY de Avaliacoes (pysrc/eventos.py, invalidate_turma_cache).
+# Mudanças no catálogo feitas por outro processo aparecem em até CACHE_TTL.
+
+async def _ler_cache(
+        fn: CachedFunction, args: tuple, carregar: Callable[[], Awaitable[tuple[Versao, Any]]]
+) -> tuple[Versao, Any]:
+    # (versão, valor de fn(conn, *args)): do cache ou de carregar(), que lê os
+    # dois do banco e cujo resultado é gravado no cache com a versão
+    encontrado, valor, versao, geracao = fn.peek(*args)
+    if encontrado and versao is not None:
+        cache.count(hit=True)
+        return versao, valor
+
+    cache.count(hit=False)
+    versao, valor = await carregar()
+    fn.store(args, valor, geracao, versao)
+    return versao, valor
+
+
+def _registrar_pagina(nome: str, escopo: Optional[str], dados: str, aquecer: Optional[tuple]) -> preparadas.Consulta:
+    # Versão e dados numa consulta só. Parâmetros: os de "dados" e o id do
+    # escopo (nenhum para None)
+    return preparadas.registrar(nome, """
+                           SELECT Versao.versao, Versao.atualizado_em, (""" + dados + """)
+                           FROM (""" + _VERSAO_SQL[escopo] + """) as Versao
+    """, aquecer=aquecer)
+
+
+async def _ler_pagina(
+        conn: psycopg.AsyncConnection, consulta: preparadas.Consulta, fn: CachedFunction, args: tuple,
+        params: tuple, bruto: bool = False, montar: Optional[Callable[[Any], Any]] = None
+) -> tuple[Versao, Any]:
+    # Versão e valor de fn(conn, *args). montar converte o json da consulta no
+    # valor de fn.
+    async def carregar():
+        async with conn.cursor() as curr:
+            if bruto:
+                curr.adapters.register_loader("json", _JsonBrutoLoader)
+            await preparadas.executar(curr, consulta, params)
+            v, atualizado_em, dados = await curr.fetchone()
+        if montar is not None and dados is not None:
+            dados = montar(dados)
+        return Versao(versao=v, atualizado_em=atualizado_em), dados
+
+    return await _ler_cache(fn, args, carregar)
+
+
+_PROFESSOR_INFO_SQL = """
+                           SELECT json_build_object(
+                               'id', %s::int,
+                               'nome', COALESCE(MIN(professor_nome), ''),
+                               'turmas', COALESCE(
+                                   json_agg(json_build_array(turma_id, disciplina_nome) ORDER BY turma_id), '[]'
+                               ),
+                               'qtd_avaliacoes', COALESCE(SUM(qtd_avaliacoes), 0),
+                               'sum_avaliacoes', COALESCE(SUM(sum_avaliacoes), 0)
+                           )
                            FROM Turmas_Avaliacoes_View
                            WHERE professor_id=%s
-        """, (professor_id,))
-        professor = ProfessorInfo(
-            id=professor_id, nome="", 
-            qtd_avaliacoes=0, 
-            sum_avaliacoes=0, turmas=[]
-        )
-        for row in await curr.fetchall():
-            professor = merge_professor(professor, row)
+"""
+_PROFESSOR_INFO = preparadas.registrar("professor_info", _PROFESSOR_INFO_SQL, aquecer=(0, 0))
+_PAGINA_PROFESSOR = _registrar_pagina("pagina_professor", "professor", _PROFESSOR_INFO_SQL, aquecer=(0, 0, 0))
+
 
+@cached("professor")
+async def get_professor_info(conn: psycopg.AsyncConnection, professor_id: int) -> bytes:
+    # Documento JSON (formato de ProfessorInfo) montado pelo Postgres e
+    # repassado como bytes para a resposta. Sem turmas, nome "" e zeros.
+    async with conn.cursor() as curr:
+        curr.adapters.register_loader("json", _JsonBrutoLoader)
+        await preparadas.executar(curr, _PROFESSOR_INFO, (professor_id, professor_id))
+        (professor,) = await curr.fetchone()
         return professor
 
-async def get_disciplina_info(conn: psycopg.AsyncConnection, disciplina_id: int) -> DisciplinaInfo:
-    professores: dict[int, ProfessorInfo] = {}
-    def add_professor(
-            professor_id: int, professor_nome: str,
-            qtd_avaliacoes: int, sum_avaliacoes: int
-    ):
-        if professor_id in professores:
-            p = professores[professor_id]
-            p.sum_avaliacoes += sum_avaliacoes
-            p.qtd_avaliacoes += qtd_avaliacoes
-            return
-
-        professores[professor_id] = ProfessorInfo(
-                id=professor_id, nome=professor_nome,
-                sum_avaliacoes=sum_avaliacoes, qtd_avaliacoes=qtd_avaliacoes,
-                turmas=[]
-        )
 
+async def get_pagina_professor(conn: psycopg.AsyncConnection, professor_id: int) -> tuple[Versao, bytes]:
+    return await _ler_pagina(
+        conn, _PAGINA_PROFESSOR, get_professor_info, (professor_id,),
+        (professor_id, professor_id, professor_id), bruto=True
+    )
+
+
+_DISCIPLINA_INFO_SQL = """
+                           SELECT json_build_object(
+                               'id', Disciplinas.id,
+                               'nome', Disciplinas.nome,
+                               'professores', COALESCE(Professores.lista, '[]')
+                           )
+                           FROM Disciplinas, LATERAL (
+                               SELECT json_agg(p ORDER BY p.id) as lista
+                               FROM (
+                                   SELECT professor_id as id, professor_nome as nome,
+                                   SUM(qtd_avaliacoes) as qtd_avaliacoes, SUM(sum_avaliacoes) as sum_avaliacoes
+                                   FROM Turmas_Avaliacoes_View
+                                   WHERE disciplina_id=Disciplinas.id
+                                   GROUP BY professor_id, professor_nome
+                               ) as p
+                           ) as Professores
+                           WHERE Disciplinas.id=%s
+"""
+_DISCIPLINA_INFO = preparadas.registrar("disciplina_info", _DISCIPLINA_INFO_SQL, aquecer=(0,))
+_PAGINA_DISCIPLINA = _registrar_pagina("pagina_disciplina", "disciplina", _DISCIPLINA_INFO_SQL, aquecer=(0, 0))
+
+
+@cached("disciplina")
+async def get_disciplina_info(conn: psycopg.AsyncConnection, disciplina_id: int) -> Optional[dict]:
+    # Agrupado por professor no próprio Postgres; um único valor json por
+    # disciplina, decodificado uma vez (None se a disciplina não existe)
     async with conn.cursor() as curr:
-        await curr.execute(
-                """SELECT turma_id, professor_nome, qtd_avaliacoes, sum_avaliacoes, disciplina_nome
-                FROM Turmas_Avaliacoes_View
-                WHERE disciplina_id=%s""", (disciplina_id,)
-        )
-        nome_disciplina = ""
-        for t_id, p_nome, qtd_a, sum_a, d_nome in await curr.fetchall():
-            nome_disciplina = d_nome
-            add_professor(t_id, p_nome, qtd_a, sum_a)
+        await preparadas.executar(curr, _DISCIPLINA_INFO, (disciplina_id,))
+        row = await curr.fetchone()
+        return row[0] if row else None
 
-        return DisciplinaInfo(id=disciplina_id, nome=nome_disciplina, professores=list(professores.values()))
+
+async def get_pagina_disciplina(conn: psycopg.AsyncConnection, disciplina_id: int) -> tuple[Versao, Optional[dict]]:
+    return await _ler_pagina(conn, _PAGINA_DISCIPLINA, get_disciplina_info, (disciplina_id,), (disciplina_id, disciplina_id))
+
+
+_DISCIPLINAS = preparadas.registrar("disciplinas", "SELECT id, nome FROM Disciplinas", aquecer=None)
 
 
 async def get_all_disciplinas(conn: psycopg.AsyncConnection) -> List[DisciplinaItem]:
-    async with conn.cursor() as curr:
-        await curr.execute("SELECT id, nome FROM Disciplinas")
-        return [DisciplinaItem(id=id, nome=nome) for id, nome in await curr.fetchall()]
-
-async def get_all_professores(conn: psycopg.AsyncConnection) -> List[ProfessorItem]:
-    professores: dict[int, ProfessorItem] = {}
-    def add_professor(
-            professor_id: int, disciplina_id: int, 
-            professor_nome: str, disciplina_nome: str, 
-            qtd_avaliacoes: int, sum_avaliacoes: int
-    ):
-        if professor_id in professores:
-            p = professores[professor_id]
-            p.sum_avaliacoes += sum_avaliacoes
-            p.qtd_avaliacoes += qtd_avaliacoes
-            p.disciplinas.append((disciplina_id, disciplina_nome))
-            return
-
-        professores[professor_id] = ProfessorItem(
-                id=professor_id, nome=professor_nome,
-                sum_avaliacoes=sum_avaliacoes, qtd_avaliacoes=qtd_avaliacoes,
-                disciplinas=[(disciplina_id, disciplina_nome)]
-        )
+    async with conn.cursor(row_factory=args_row(DisciplinaItem)) as curr:
+        await preparadas.executar(curr, _DISCIPLINAS)
+        return await curr.fetchall()
+
+
+async def get_pagina_disciplinas(conn: psycopg.AsyncConnection) -> tuple[Versao, List[DisciplinaItem]]:
+    # Sem cache: a versão do catálogo e a lista (uma leitura de Disciplinas) no
+    # mesmo pipeline
+    async with conn.cursor() as c_versao, conn.cursor(row_factory=args_row(DisciplinaItem)) as c_disciplinas:
+        async with conn.pipeline():
+            await preparadas.executar(c_versao, _VERSAO_CATALOGO)
+            await preparadas.executar(c_disciplinas, _DISCIPLINAS)
+        versao, atualizado_em = await c_versao.fetchone()
+        return Versao(versao=versao, atualizado_em=atualizado_em), await c_disciplinas.fetchall()
+
+
+_PROFESSORES_SQL = """
+                           SELECT COALESCE(json_agg(p ORDER BY p.id), '[]')
+                           FROM (
+                               SELECT professor_id as id, professor_nome as nome,
+                               json_agg(json_build_array(disciplina_id, disciplina_nome) ORDER BY turma_id) as disciplinas,
+                               SUM(qtd_avaliacoes) as qtd_avaliacoes, SUM(sum_avaliacoes) as sum_avaliacoes
+                               FROM Turmas_Avaliacoes_View
+                               GROUP BY professor_id, professor_nome
+                           ) as p
+"""
+_PROFESSORES = preparadas.registrar("professores", _PROFESSORES_SQL, aquecer=None)
+_PAGINA_PROFESSORES = _registrar_pagina("pagina_professores", None, _PROFESSORES_SQL, aquecer=None)
 
+
+@cached("professores")
+async def get_all_professores(conn: psycopg.AsyncConnection) -> List[dict]:
+    # Um item por professor, com as disciplinas das suas turmas, agrupado no
+    # Postgres e recebido como um único valor json
     async with conn.cursor() as curr:
-        await curr.execute("""
-                           SELECT professor_id, disciplina_id, 
-                           professor_nome, disciplina_nome,  
-                           qtd_avaliacoes, sum_avaliacoes
-                           FROM Turmas_Avaliacoes_View
-        """)
-        for p_id, d_id, p_nome, d_nome, qtd_a, sum_a in await curr.fetchall():
-            add_professor(p_id, d_id, p_nome, d_nome, qtd_a, sum_a)
+        await preparadas.executar(curr, _PROFESSORES)
+        (professores,) = await curr.fetchone()
+        return professores
+
+
+async def get_pagina_professores(conn: psycopg.AsyncConnection) -> tuple[Versao, List[dict]]:
+    return await _ler_pagina(conn, _PAGINA_PROFESSORES, get_all_professores, (), ())
+
+
+_RANKING = preparadas.registrar("ranking", """
+                               SELECT row_number() OVER (ORDER BY score DESC, professor_id),
+                               professor_id, professor_nome,
+                               departamento_id, departamento_nome,
+                               qtd_avaliacoes, media::float8, score::float8
+                               FROM Professores_Ranking
+                               WHERE qtd_avaliacoes >= %s
+                               ORDER BY score DESC, professor_id
+                               LIMIT %s
+""", aquecer=(0, 0))
+
+
+_RANKING_DEPARTAMENTO = preparadas.registrar("ranking_departamento", """
+                               SELECT row_number() OVER (ORDER BY score DESC, professor_id),
+                               professor_id, professor_nome,
+                               departamento_id, departamento_nome,
+                               qtd_avaliacoes, media::float8, score::float8
+                               FROM Professores_Ranking
+                               WHERE departamento_id=%s AND qtd_avaliacoes >= %s
+                               ORDER BY score DESC, professor_id
+                               LIMIT %s
+""", aquecer=(0, 0, 0))
+
+
+_RANKING_ATUALIZADO = preparadas.registrar("ranking_atualizado", """
+                           SELECT atualizado_em, EXTRACT(EPOCH FROM now() - atualizado_em)::float8
+                           FROM Materialized_Views_Refresh
+                           WHERE nome='Professores_Ranking'
+""", aquecer=())
+
+
+async def get_pagina_ranking(
+        conn: psycopg.AsyncConnection, limit: int,
+        min_votos: int = 0, departamento_id: Optional[int] = None
+) -> tuple[Versao, Ranking]:
+    # Versão (horário do refresh), ranking e idade no mesmo pipeline
+    async with conn.cursor() as c_versao, conn.cursor(row_factory=args_row(RankingItem)) as c_ranking, \
+            conn.cursor() as c_atualizado:
+        async with conn.pipeline():
+            await preparadas.executar(c_versao, _VERSAO_RANKING)
+            # Percorre o índice (score DESC) / (departamento_id, score DESC) e para em `limit`
+            if departamento_id is None:
+                await preparadas.executar(c_ranking, _RANKING, (min_votos, limit))
+            else:
+                await preparadas.executar(c_ranking, _RANKING_DEPARTAMENTO, (departamento_id, min_votos, limit))
+            await preparadas.executar(c_atualizado, _RANKING_ATUALIZADO)
+
+        versao, versao_em = await c_versao.fetchone() or ("0", None)
+        professores = await c_ranking.fetchall()
+        atualizado_em, idade = await c_atualizado.fetchone() or (None, None)
+
+    ranking = Ranking(atualizado_em=atualizado_em, idade_segundos=idade, professores=professores)
+    return Versao(versao=versao, atualizado_em=versao_em), ranking
+
 
-        return list(professores.values())
+async def buscar_avaliacoes(
+        conn: psycopg.AsyncConnection, texto: str,
+        professor_id: Optional[int] = None, disciplina_id: Optional[int] = None,
+        departamento_id: Optional[int] = None,
+        before_rank: Optional[float] = None, before_id: Optional[int] = None,
+        limit: int = RESULTADOS_BUSCA_POR_PAGINA
+) -> tuple[Versao, BuscaResultado]:
+    # Devolve a versão de todas as turmas (o ETag da busca), lida no mesmo
+    # pipeline que a busca.
+    # Busca textual (sintaxe do websearch_to_tsquery: "frase", -excluir, or) no
+    # índice GIN de comentario_tsv. As ocorrências são ordenadas por ts_rank e
+    # paginadas por keyset em (rank, id); os dados de exibição só são buscados
+    # para as linhas da página. Com BUSCA_JANELA as ocorrências ficam
+    # limitadas à faixa de ids das avaliações mais recentes (MAX(id) pelo
+    # índice da chave primária), e com BUSCA_MAX_CANDIDATOS às N mais recentes.
+    # A primeira linha sempre existe (LEFT JOIN a partir de Resumo), para
+    # limitado sair certo mesmo sem resultados.
+    joins, filtros = "", ""
+    if professor_id is not None or disciplina_id is not None or departamento_id is not None:
+        joins += " INNER JOIN Turmas ON Turmas.id=Avaliacoes.turma_id"
+    if departamento_id is not None:
+        joins += " INNER JOIN Professores ON Professores.id=Turmas.professor_id"
+        filtros += " AND Professores.departamento_id=%(departamento_id)s"
+    if professor_id is not None:
+        filtros += " AND Turmas.professor_id=%(professor_id)s"
+    if disciplina_id is not None:
+        filtros += " AND Turmas.disciplina_id=%(disciplina_id)s"
 
-async def get_turma_info(conn: psycopg.AsyncConnection, turma_id: int) -> Optional[TurmaInfo]:
+    # Sem os limites, sem as ordenações por id e as contagens que eles pedem
+    recentes, ordenadas, cortadas = "", "", ["false"]
+    if BUSCA_MAX_CANDIDATOS > 0:
+        # Uma ocorrência a mais para saber se houve mais que o limite
+        recentes = "ORDER BY Avaliacoes.id DESC LIMIT %(max_candidatos_e_um)s"
+        ordenadas = "ORDER BY id DESC LIMIT %(max_candidatos)s"
+        cortadas.append("(SELECT COUNT(*) FROM Candidatos) > %(max_candidatos)s")
+    if BUSCA_JANELA > 0:
+        filtros += " AND Avaliacoes.id > (SELECT id_minimo FROM Janela)"
+        cortadas.append("(SELECT primeiro_id <= id_minimo FROM Janela)")
+
+    keyset = ""
+    if before_rank is not None and before_id is not None:
+        keyset = "WHERE (rank, id) < (%(before_rank)s::real, %(before_id)s)"
+
+    params = dict(
+        texto=texto, professor_id=professor_id, disciplina_id=disciplina_id,
+        departamento_id=departamento_id, before_rank=before_rank, before_id=before_id,
+        janela=BUSCA_JANELA, max_candidatos=BUSCA_MAX_CANDIDATOS,
+        max_candidatos_e_um=BUSCA_MAX_CANDIDATOS + 1, limit=limit + 1,
+    )
+    async with conn.cursor() as c_versao, conn.cursor() as curr:
+        async with conn.pipeline():
+            await preparadas.executar(c_versao, _VERSAO[None])
+            with metrics.rotulo("busca"):
+                await curr.execute("""
+                               WITH Janela AS (
+                                   SELECT MAX(id) - %(janela)s as id_minimo, MIN(id) as primeiro_id
+                                   FROM Avaliacoes
+                               ), Candidatos AS (
+                                   SELECT Avaliacoes.id, ts_rank(Avaliacoes.comentario_tsv, consulta) as rank
+                                   FROM websearch_to_tsquery('portuguese', %(texto)s) as consulta,
+                                   Avaliacoes""" + joins + """
+                                   WHERE Avaliacoes.comentario_tsv @@ consulta""" + filtros + """
+                                   """ + recentes + """
+                               ), Ordenadas AS (
+                                   SELECT id, rank
+                                   FROM Candidatos
+                                   """ + ordenadas + """
+                               ), Pagina AS (
+                                   SELECT id, rank
+                                   FROM Ordenadas
+                                   """ + keyset + """
+                                   ORDER BY rank DESC, id DESC
+                                   LIMIT %(limit)s
+                               ), Linhas AS (
+                                   SELECT Pagina.id, Avaliacoes.turma_id,
+                                   Turmas.professor_id, Professores.nome as professor_nome,
+                                   Turmas.disciplina_id, Disciplinas.nome as disciplina_nome,
+                                   Users.nome as user_nome, Avaliacoes.comentario, Avaliacoes.pontuacao, Pagina.rank
+                                   FROM Pagina
+                                   INNER JOIN Avaliacoes ON Avaliacoes.id=Pagina.id
+                                   INNER JOIN Turmas ON Turmas.id=Avaliacoes.turma_id
+                                   INNER JOIN Professores ON Professores.id=Turmas.professor_id
+                                   INNER JOIN Disciplinas ON Disciplinas.id=Turmas.disciplina_id
+                                   INNER JOIN Users ON Users.id=Avaliacoes.user_id
+                               )
+                               SELECT Resumo.limitado, Linhas.*
+                               FROM (
+                                   SELECT """ + " OR ".join(cortadas) + """ as limitado
+                               ) as Resumo
+                               LEFT JOIN Linhas ON true
+                               ORDER BY Linhas.rank DESC, Linhas.id DESC
+                """, params)
+        versao, atualizado_em = await c_versao.fetchone()
+        rows = await curr.fetchall()
+
+    resultados = [
+            BuscaItem(
+                id=a_id, turma_id=t_id, professor_id=p_id, professor_nome=p_nome,
+                disciplina_id=d_id, disciplina_nome=d_nome, user_nome=u_nome,
+                comentario=comentario, pontuacao=pontuacao, rank=rank
+            )
+            for _, a_id, t_id, p_id, p_nome, d_id, d_nome, u_nome, comentario, pontuacao, rank in rows
+            if a_id is not None
+    ]
+    limitado = bool(rows[0][0])
+
+    proximo_before_rank, proximo_before_id = None, None
+    if len(resultados) > limit:
+        resultados = resultados[:limit]
+        proximo_before_rank, proximo_before_id = resultados[-1].rank, resultados[-1].id
+
+    return Versao(versao=versao, atualizado_em=atualizado_em), BuscaResultado(
+            resultados=resultados, proximo_before_rank=proximo_before_rank,
+            proximo_before_id=proximo_before_id, limitado=limitado
+    )
+
+
+async def refresh_ranking(conn: psycopg.AsyncConnection):
     async with conn.cursor() as curr:
-        await curr.execute("""
-                           SELECT professor_id, professor_nome, 
-                           disciplina_id, disciplina_nome, 
-                           qtd_avaliacoes, sum_avaliacoes
-                           FROM Turmas_Avaliacoes_View
-                           WHERE turma_id=%s
-        """, (turma_id,))
-        res = await curr.fetchone()
-        if (res is None):
-            return res
+        await curr.execute("CALL Atualizar_Professores_Ranking()")
 
-        p_id, p_nome, d_id, d_nome, qtd_a, sum_a = res
 
-        await curr.execute("""
-                           SELECT Avaliacoes.id as avaliacao_id ,
-                           Users.nome as user_nome, Avaliacoes.user_id, 
-                           Avaliacoes.pontuacao, Avaliacoes.comentario
+# As consultas das páginas de turma são separadas em "executar" e "montar o
+# resultado" para que get_pagina_turma possa enviá-las juntas, com a versão,
+# num pipeline.
+
+_TURMA_RESUMO = preparadas.registrar("turma_resumo", """
+                       SELECT turma_id, professor_id, professor_nome, 
+                       disciplina_id, disciplina_nome, 
+                       qtd_avaliacoes, sum_avaliacoes, histograma
+                       FROM Turmas_Avaliacoes_View
+                       WHERE turma_id=%s
+""", aquecer=(0,))
+
+
+async def _execute_turma_resumo(curr, turma_id: int):
+    # Colunas na ordem dos campos de TurmaResumo
+    await preparadas.executar(curr, _TURMA_RESUMO, (turma_id,))
+
+
+_TURMA_AVALIACOES = preparadas.registrar("turma_avaliacoes", """
+                           SELECT Avaliacoes.id, Avaliacoes.user_id,
+                           Users.nome as user_nome,
+                           Avaliacoes.comentario, Avaliacoes.pontuacao
                            FROM Avaliacoes
                            INNER JOIN Users
                            ON Avaliacoes.user_id=Users.id
                            WHERE Avaliacoes.turma_id=%s
-        """, (turma_id,))
-        avaliacoes = [
-                Avaliacao(id=a_id, user_id=u_id, user_nome=u_nome, pontuacao=pontuacao, comentario=comentario)
-                for a_id, u_nome, u_id, pontuacao, comentario in await curr.fetchall()
-        ]
-
-        return TurmaInfo(
-                id=turma_id,
-                professor_id=p_id, professor_nome=p_nome, 
-                disciplina_id=d_id, disciplina_nome=d_nome,
-                qtd_avaliacoes=qtd_a, sum_avaliacoes=sum_a,
-                avaliacoes=avaliacoes
+                           ORDER BY Avaliacoes.id DESC
+                           LIMIT %s
+""", aquecer=(0, 0))
+
+
+_TURMA_AVALIACOES_ANTES = preparadas.registrar("turma_avaliacoes_antes", """
+                           SELECT Avaliacoes.id, Avaliacoes.user_id,
+                           Users.nome as user_nome,
+                           Avaliacoes.comentario, Avaliacoes.pontuacao
+                           FROM Avaliacoes
+                           INNER JOIN Users
+                           ON Avaliacoes.user_id=Users.id
+                           WHERE Avaliacoes.turma_id=%s AND Avaliacoes.id < %s
+                           ORDER BY Avaliacoes.id DESC
+                           LIMIT %s
+""", aquecer=(0, 0, 0))
+
+
+async def _execute_turma_avaliacoes(curr, turma_id: int, before_id: Optional[int], limit: int):
+    # Paginação por keyset sobre o índice (turma_id, id): qualquer página
+    # custa o mesmo que a primeira. Busca limit+1 linhas para saber se há mais.
+    # Colunas na ordem dos campos de Avaliacao.
+    if before_id is None:
+        await preparadas.executar(curr, _TURMA_AVALIACOES, (turma_id, limit + 1))
+    else:
+        await preparadas.executar(curr, _TURMA_AVALIACOES_ANTES, (turma_id, before_id, limit + 1))
+
+
+def _avaliacoes_page(avaliacoes: List[Avaliacao], limit: int) -> AvaliacoesPage:
+    proximo_before_id = None
+    if len(avaliacoes) > limit:
+        avaliacoes = avaliacoes[:limit]
+        proximo_before_id = avaliacoes[-1].id
+
+    return AvaliacoesPage(avaliacoes=avaliacoes, proximo_before_id=proximo_before_id)
+
+
+async def get_pagina_turma_avaliacoes(
+        conn: psycopg.AsyncConnection, turma_id: int,
+        before_id: Optional[int] = None, limit: int = AVALIACOES_POR_PAGINA
+) -> tuple[Versao, AvaliacoesPage]:
+    async with conn.cursor() as c_versao, conn.cursor(row_factory=args_row(Avaliacao)) as c_avaliacoes:
+        async with conn.pipeline():
+            await preparadas.executar(c_versao, _VERSAO["turma"], (turma_id,))
+            await _execute_turma_avaliacoes(c_avaliacoes, turma_id, before_id, limit)
+        versao, atualizado_em = await c_versao.fetchone()
+        page = _avaliacoes_page(await c_avaliacoes.fetchall(), limit)
+    return Versao(versao=versao, atualizado_em=atualizado_em), page
+
+
+_AVALIACOES_POR_IDS = preparadas.registrar("avaliacoes_por_ids", """
+                           SELECT Avaliacoes.id, Avaliacoes.user_id,
+                           Users.nome as user_nome,
+                           Avaliacoes.comentario, Avaliacoes.pontuacao
+                           FROM Avaliacoes
+                           INNER JOIN Users
+                           ON Avaliacoes.user_id=Users.id
+                           WHERE Avaliacoes.id = ANY(%s)
+                           ORDER BY Avaliacoes.id
+""", aquecer=None)
+
+
+async def get_avaliacoes_por_ids(conn: psycopg.AsyncConnection, ids: List[int]) -> List[Avaliacao]:
+    # Avaliações avisadas pelo NOTIFY de Avaliacoes (pysrc/eventos.py)
+    async with conn.cursor(row_factory=args_row(Avaliacao)) as curr:
+        await preparadas.executar(curr, _AVALIACOES_POR_IDS, (ids,))
+        return await curr.fetchall()
+
+
+async def stream_turma_avaliacoes(
+        conn: psycopg.AsyncConnection, turma_id: int, before_id: Optional[int] = None
+):
+    # Cursor nomeado (no servidor): as linhas chegam em lotes de itersize,
+    # sem carregar todas as avaliações da turma na memória.
+    # Gera objetos Avaliacao.
+    # Cursores nomeados precisam de uma transação (a conexão está em autocommit).
+    async with conn.transaction(), \
+            conn.cursor(name=f"turma_{turma_id}_avaliacoes", row_factory=args_row(Avaliacao)) as curr:
+        curr.itersize = 500
+        with metrics.rotulo("stream_turma_avaliacoes"):
+            if before_id is None:
+                await curr.execute("""
+                                   SELECT Avaliacoes.id, Avaliacoes.user_id,
+                                   Users.nome as user_nome,
+                                   Avaliacoes.comentario, Avaliacoes.pontuacao
+                                   FROM Avaliacoes
+                                   INNER JOIN Users
+                                   ON Avaliacoes.user_id=Users.id
+                                   WHERE Avaliacoes.turma_id=%s
+                                   ORDER BY Avaliacoes.id DESC
+                """, (turma_id,))
+            else:
+                await curr.execute("""
+                                   SELECT Avaliacoes.id, Avaliacoes.user_id,
+                                   Users.nome as user_nome,
+                                   Avaliacoes.comentario, Avaliacoes.pontuacao
+                                   FROM Avaliacoes
+                                   INNER JOIN Users
+                                   ON Avaliacoes.user_id=Users.id
+                                   WHERE Avaliacoes.turma_id=%s AND Avaliacoes.id < %s
+                                   ORDER BY Avaliacoes.id DESC
+                """, (turma_id, before_id))
+        async for row in curr:
+            yield row
+
+
+@cached("turma_resumo")
+async def get_turma_resumo(conn: psycopg.AsyncConnection, turma_id: int) -> Optional[TurmaResumo]:
+    async with conn.cursor(row_factory=args_row(TurmaResumo)) as curr:
+        await _execute_turma_resumo(curr, turma_id)
+        return await curr.fetchone()
+
+
+# Uma entrada por (turma_id, before_id, limit), todas na tag da turma. O
+# valor é o mesmo de get_pagina_turma, que o grava com a versão.
+@cached("turma")
+async def get_turma_info(
+        conn: psycopg.AsyncConnection, turma_id: int,
+        before_id: Optional[int] = None, limit: int = AVALIACOES_POR_PAGINA
+) -> Optional[TurmaInfo]:
+    _, turma = await _ler_pagina_turma(conn, turma_id, before_id, limit)
+    return turma
+
+
+async def get_pagina_turma(
+        conn: psycopg.AsyncConnection, turma_id: int,
+        before_id: Optional[int] = None, limit: int = AVALIACOES_POR_PAGINA
+) -> tuple[Versao, Optional[TurmaInfo]]:
+    return await _ler_cache(
+        get_turma_info, (turma_id, before_id, limit), lambda: _ler_pagina_turma(conn, turma_id, before_id, limit)
+    )
+
+
+async def _ler_pagina_turma(
+        conn: psycopg.AsyncConnection, turma_id: int, before_id: Optional[int], limit: int
+) -> tuple[Versao, Optional[TurmaInfo]]:
+    # Modo pipeline: as três consultas são enviadas de uma vez e os resultados
+    # lidos juntos, numa única ida e volta ao servidor
+    async with conn.cursor() as c_versao, conn.cursor() as c_resumo, \
+            conn.cursor(row_factory=args_row(Avaliacao)) as c_avaliacoes:
+        # Ao sair do bloco do pipeline os resultados já estão nos cursores
+        async with conn.pipeline():
+            await preparadas.executar(c_versao, _VERSAO["turma"], (turma_id,))
+            await _execute_turma_resumo(c_resumo, turma_id)
+            await _execute_turma_avaliacoes(c_avaliacoes, turma_id, before_id, limit)
+
+        versao, atualizado_em = await c_versao.fetchone()
+        resumo = await c_resumo.fetchone()
+        page = _avaliacoes_page(await c_avaliacoes.fetchall(), limit)
+
+    versao = Versao(versao=versao, atualizado_em=atualizado_em)
+    if resumo is None:
+        return versao, None
+
+    # resumo vem como tupla na ordem dos campos de TurmaResumo
+    return versao, TurmaInfo(*resumo, page.avaliacoes, page.proximo_before_id)
+
+
+# Semestres como as partições de Avaliacoes (Semestre_Inicio, migration 0009):
+# janeiro a junho e julho a dezembro, em UTC
+def semestre_inicio(t: datetime) -> datetime:
+    t = t.astimezone(timezone.utc)
+    return datetime(t.year, 1 if t.month < 7 else 7, 1, tzinfo=timezone.utc)
+
+
+def semestre_nome(inicio: datetime) -> str:
+    return f"{inicio.year}.{1 if inicio.month < 7 else 2}"
+
+
+def inicio_tendencia(semestres: int, agora: Optional[datetime] = None) -> datetime:
+    # Início do primeiro semestre de uma série de "semestres" que termina no atual
+    atual = semestre_inicio(agora or datetime.now(timezone.utc))
+    meses = atual.year * 12 + atual.month - 1 - 6 * (semestres - 1)
+    return datetime(meses // 12, meses % 12 + 1, 1, tzinfo=timezone.utc)
+
+
+def semestre_seguinte(inicio: datetime) -> datetime:
+    return datetime(inicio.year + (inicio.month == 7), 1 if inicio.month == 7 else 7, 1, tzinfo=timezone.utc)
+
+
+# O filtro em criado_em deixa de fora as partições anteriores ao período,
+# já no início da execução (o plano genérico do prepared statement também),
+# inclusive Avaliacoes_Legado: as avaliações sem data não entram em semestre nenhum.
+# Um valor json [[ano, mês de início, quantidade, média], ...] por consulta,
+# para também entrar nas consultas de página (_registrar_pagina).
+_TENDENCIA_SQL = {
+    escopo: """
+                           SELECT COALESCE(json_agg(json_build_array(
+                               EXTRACT(YEAR FROM semestre AT TIME ZONE 'UTC')::int,
+                               EXTRACT(MONTH FROM semestre AT TIME ZONE 'UTC')::int,
+                               qtd, media
+                           )), '[]')
+                           FROM (
+                               SELECT Semestre_Inicio(criado_em) as semestre,
+                               COUNT(pontuacao) as qtd, AVG(pontuacao)::float8 as media
+                               FROM Avaliacoes
+                               WHERE """ + filtro + """ AND criado_em >= %s
+                               GROUP BY 1
+                           ) as Por_Semestre
+    """
+    for escopo, filtro in (
+        ("turma", "turma_id=%s"),
+        ("professor", "turma_id IN (SELECT id FROM Turmas WHERE professor_id=%s)"),
+    )
+}
+_TENDENCIA_AQUECER = (0, datetime(2000, 1, 1, tzinfo=timezone.utc))
+_TENDENCIA = {
+    escopo: preparadas.registrar(f"tendencia_{escopo}", _TENDENCIA_SQL[escopo], aquecer=_TENDENCIA_AQUECER)
+    for escopo in _TENDENCIA_SQL
+}
+_PAGINA_TENDENCIA = {
+    escopo: _registrar_pagina(
+        f"pagina_tendencia_{escopo}", escopo, _TENDENCIA_SQL[escopo], aquecer=(*_TENDENCIA_AQUECER, 0)
+    )
+    for escopo in _TENDENCIA_SQL
+}
+
+
+async def _get_tendencia(conn: psycopg.AsyncConnection, escopo: str, id: int, inicio: datetime) -> Tendencia:
+    async with conn.cursor() as curr:
+        await preparadas.executar(curr, _TENDENCIA[escopo], (id, inicio))
+        (linhas,) = await curr.fetchone()
+    return _montar_tendencia(id, inicio, linhas)
+
+
+def _montar_tendencia(id: int, inicio: datetime, linhas: list) -> Tendencia:
+    por_semestre = {
+        datetime(ano, mes, 1, tzinfo=timezone.utc): (qtd, media) for ano, mes, qtd, media in linhas
+    }
+    semestres = []
+    semestre, atual = inicio, semestre_inicio(datetime.now(timezone.utc))
+    while semestre <= atual:
+        qtd, media = por_semestre.get(semestre, (0, None))
+        semestres.append(SemestreTendencia(semestre=semestre_nome(semestre), qtd_avaliacoes=qtd, media=media))
+        semestre = semestre_seguinte(semestre)
+    return Tendencia(id=id, semestres=semestres)
+
+
+# inicio (primeiro semestre da série) faz parte da chave do cache: a série
+# muda de janela na virada do semestre
+@cached("tendencia_turma")
+async def get_tendencia_turma(conn: psycopg.AsyncConnection, turma_id: int, inicio: datetime) -> Tendencia:
+    return await _get_tendencia(conn, "turma", turma_id, inicio)
+
+
+@cached("tendencia_professor")
+async def get_tendencia_professor(conn: psycopg.AsyncConnection, professor_id: int, inicio: datetime) -> Tendencia:
+    return await _get_tendencia(conn, "professor", professor_id, inicio)
+
+
+async def get_pagina_tendencia(
+        conn: psycopg.AsyncConnection, escopo: str, id: int, inicio: datetime
+) -> tuple[Versao, Tendencia]:
+    # escopo "turma" ou "professor", com a versão da turma/do professor
+    fn = get_tendencia_turma if escopo == "turma" else get_tendencia_professor
+    return await _ler_pagina(
+        conn, _PAGINA_TENDENCIA[escopo], fn, (id, inicio), (id, inicio, id),
+        montar=lambda linhas: _montar_tendencia(id, inicio, linhas)
+    )
+
+
+async def rebuild_turma_stats(conn: psycopg.AsyncConnection):
+    async with conn.cursor() as curr:
+        await curr.execute("CALL Recalcular_Turmas_Avaliacoes_Stats()")
+
+
+async def verify_turma_stats(conn: psycopg.AsyncConnection) -> List[tuple]:
+    # Compara os agregados mantidos pelos triggers com uma recontagem de Avaliacoes.
+    # Retorna (turma_id, [qtd, soma, 1..5 estrelas] armazenado, [...] recontado) das divergentes.
+    async with conn.cursor() as curr:
+        await curr.execute("""
+                           SELECT turma_id, armazenado, recontado FROM (
+                               SELECT Turmas.id as turma_id,
+                               ARRAY[COALESCE(s.qtd_avaliacoes, 0), COALESCE(s.sum_avaliacoes, 0),
+                                     COALESCE(s.qtd_1, 0), COALESCE(s.qtd_2, 0), COALESCE(s.qtd_3, 0),
+                                     COALESCE(s.qtd_4, 0), COALESCE(s.qtd_5, 0)] as armazenado,
+                               ARRAY[COALESCE(r.qtd, 0), COALESCE(r.soma, 0),
+                                     COALESCE(r.qtd_1, 0), COALESCE(r.qtd_2, 0), COALESCE(r.qtd_3, 0),
+                                     COALESCE(r.qtd_4, 0), COALESCE(r.qtd_5, 0)] as recontado
+                               FROM Turmas
+                               LEFT JOIN Turmas_Avaliacoes_Stats as s
+                               ON s.turma_id=Turmas.id
+                               LEFT JOIN (
+                                   SELECT turma_id, COUNT(pontuacao) as qtd, SUM(pontuacao) as soma,
+                                   COUNT(*) FILTER (WHERE pontuacao = 1) as qtd_1,
+                                   COUNT(*) FILTER (WHERE pontuacao = 2) as qtd_2,
+                                   COUNT(*) FILTER (WHERE pontuacao = 3) as qtd_3,
+                                   COUNT(*) FILTER (WHERE pontuacao = 4) as qtd_4,
+                                   COUNT(*) FILTER (WHERE pontuacao = 5) as qtd_5
+                                   FROM Avaliacoes
+                                   GROUP BY turma_id
+                               ) as r
+                               ON r.turma_id=Turmas.id
+                           ) as comparacao
+                           WHERE armazenado <> recontado
+                           ORDER BY turma_id
+        """)
+        return await curr.fetchall()
+
+
+# Chamados a cada escrita nas avaliações de uma turma com (turma_id,
+# professor_id, disciplina_id), depois do cache (ex.: pysrc/prerender.py)
+ouvintes_turma: List[Callable[[int, Optional[int], Optional[int]], None]] = []
+
+
+def invalidate_turma_cache(turma_id: int, professor_id: Optional[int], disciplina_id: Optional[int]):
+    # Só o cache de leitura; também chamado para escritas de outros processos
+    # (NOTIFY de Avaliacoes, pysrc/eventos.py)
+    cache.invalidate(
+        ("turma", turma_id), ("turma_resumo", turma_id),
+        ("professor", professor_id), ("disciplina", disciplina_id),
+        ("professores", None), ("tendencia_turma", turma_id), ("tendencia_professor", professor_id),
+    )
+
+
+def invalidate_turma(turma_id: int, professor_id: Optional[int], disciplina_id: Optional[int]):
+    invalidate_turma_cache(turma_id, professor_id, disciplina_id)
+    for ouvinte in ouvintes_turma:
+        ouvinte(turma_id, professor_id, disciplina_id)
+
+
+_ADD_AVALIACAO = preparadas.registrar("add_avaliacao", """
+        WITH nova AS (
+            INSERT INTO Avaliacoes (pontuacao, comentario, user_id, turma_id)
+            VALUES (%s, %s, %s, %s)
+            RETURNING id, user_id, turma_id
         )
+        SELECT nova.id, Users.nome, Turmas.professor_id, Turmas.disciplina_id
+        FROM nova
+        LEFT JOIN Users ON Users.id = nova.user_id
+        LEFT JOIN Turmas ON Turmas.id = nova.turma_id;
+""", aquecer=None)
+
 
 async def add_avaliacao_to_turma(conn, turma_id, avaliacao):
     async with conn.cursor() as curr:
-        await curr.execute("""
-        INSERT INTO Avaliacoes (pontuacao, comentario, user_id, turma_id)
-        VALUES (%s, %s, %s, %s)
-        RETURNING id, (SELECT nome FROM Users WHERE id = user_id);
-        """, (avaliacao.pontuacao, avaliacao.comentario, avaliacao.user_id, turma_id))
-        avaliacao_id, user_nome = await curr.fetchone()
-        return Avaliacao(
+        await preparadas.executar(
+            curr, _ADD_AVALIACAO, (avaliacao.pontuacao, avaliacao.comentario, avaliacao.user_id, turma_id)
+        )
+        avaliacao_id, user_nome, professor_id, disciplina_id = await curr.fetchone()
+
+    # A conexão está em autocommit: o INSERT já está confirmado aqui, então uma
+    # leitura concorrente não tem como recolocar no cache o estado anterior
+    invalidate_turma(turma_id, professor_id, disciplina_id)
+
+    return Avaliacao(
+        id=avaliacao_id,
+        user_id=avaliacao.user_id,
+        user_nome=user_nome,
+        comentario=avaliacao.comentario,
+        pontuacao=avaliacao.pontuacao
+    )
+
+
+_ADD_AVALIACOES = preparadas.registrar("add_avaliacoes", """
+            WITH dados AS (
+                SELECT nextval('Avaliacoes_id_seq') as id, d.*
+                FROM unnest(%s::int[], %s::text[], %s::int[], %s::int[])
+                WITH ORDINALITY as d(pontuacao, comentario, user_id, turma_id, ordem)
+            ), nova AS (
+                INSERT INTO Avaliacoes (id, pontuacao, comentario, user_id, turma_id)
+                SELECT id, pontuacao, comentario, user_id, turma_id
+                FROM dados
+            )
+            SELECT dados.id, Users.nome, Turmas.professor_id, Turmas.disciplina_id
+            FROM dados
+            LEFT JOIN Users ON Users.id = dados.user_id
+            LEFT JOIN Turmas ON Turmas.id = dados.turma_id
+            ORDER BY dados.ordem;
+""", aquecer=None)
+
+
+async def add_avaliacoes(
+        conn: psycopg.AsyncConnection, itens: List[tuple[int, AvaliacaoIn]], synchronous_commit: bool = True
+) -> List[Avaliacao]:
+    # Várias avaliações (turma_id, avaliacao) num único INSERT. Os ids são
+    # tirados da sequência em "dados", na ordem de entrada, para devolver cada
+    # id a quem o pediu. Um comando só já é atômico em autocommit; a transação
+    # explícita só é aberta para o SET LOCAL: com synchronous_commit=False o
+    # COMMIT não espera o WAL ir para o disco.
+    async with conn.cursor() as curr:
+        async with conn.transaction() if not synchronous_commit else nullcontext():
+            if not synchronous_commit:
+                await curr.execute("SET LOCAL synchronous_commit = off")
+            await preparadas.executar(curr, _ADD_AVALIACOES, (
+                [avaliacao.pontuacao for _, avaliacao in itens],
+                [avaliacao.comentario for _, avaliacao in itens],
+                [avaliacao.user_id for _, avaliacao in itens],
+                [turma_id for turma_id, _ in itens],
+            ))
+            rows = await curr.fetchall()
+
+    for turma_id, professor_id, disciplina_id in {
+        (turma_id, row[2], row[3]) for (turma_id, _), row in zip(itens, rows)
+    }:
+        invalidate_turma(turma_id, professor_id, disciplina_id)
+
+    return [
+        Avaliacao(
             id=avaliacao_id,
             user_id=avaliacao.user_id,
             user_nome=user_nome,
             comentario=avaliacao.comentario,
             pontuacao=avaliacao.pontuacao
         )
+        for (_, avaliacao), (avaliacao_id, user_nome, _, _) in zip(itens, rows)
+    ]
 
 
-async def delete_comment(conn, comment_id):
+# Nas exclusões por id a data vem de Avaliacoes_Ids (migration 0009): com
+# criado_em fixado antes da execução só a partição da avaliação é lida.
+_DELETE_AVALIACAO = preparadas.registrar("delete_avaliacao", """
+            WITH removida AS (
+                DELETE FROM Avaliacoes
+                WHERE id = %s AND criado_em = (SELECT criado_em FROM Avaliacoes_Ids WHERE id = %s)
+                AND (%s::int IS NULL OR user_id = %s)
+                RETURNING id, user_id, comentario, pontuacao, turma_id
+            ), denuncias AS (
+                DELETE FROM Denuncias
+                WHERE avaliacao_id IN (SELECT id FROM removida)
+            )
+            SELECT removida.id, removida.user_id, removida.comentario, removida.pontuacao,
+            removida.turma_id, Turmas.professor_id, Turmas.disciplina_id
+            FROM removida
+            LEFT JOIN Turmas ON Turmas.id = removida.turma_id;
+""", aquecer=None)
+
+
+async def delete_comment(conn, comment_id, user_id: Optional[int] = None):
+    # Com user_id, só exclui se a avaliação for desse usuário (None = admin).
+    # As denúncias da avaliação saem no mesmo comando (FK de Denuncias).
     async with conn.cursor() as curr:
-        await curr.execute(
-            """
-            DELETE FROM Avaliacoes
-            WHERE id = %s
-            RETURNING id, user_id, comentario, pontuacao;
-            """,
-            (comment_id,),
-        )
+        await preparadas.executar(curr, _DELETE_AVALIACAO, (comment_id, comment_id, user_id, user_id))
         deleted_row = await curr.fetchone()
-        if deleted_row is not None:
-            return {
-                "id": deleted_row[0],
-                "user_id": deleted_row[1],
-                "comentario": deleted_row[2],
-                "pontuacao": deleted_row[3],
-            }
+
+    if deleted_row is not None:
+        invalidate_turma(deleted_row[4], deleted_row[5], deleted_row[6])
+        return {
+            "id": deleted_row[0],
+            "user_id": deleted_row[1],
+            "comentario": deleted_row[2],
+            "pontuacao": deleted_row[3],
+        }
+    else:
+        return None
+
+
+# Fila de moderação: avaliações denunciadas, as mais denunciadas primeiro,
+# paginadas por keyset em (qtd_denuncias, avaliacao_id)
+_FILA_MODERACAO_SQL = """
+            WITH Contagem AS (
+                SELECT avaliacao_id, avaliacao_criado_em, COUNT(*) as qtd
+                FROM Denuncias
+                WHERE avaliacao_id IS NOT NULL
+                GROUP BY avaliacao_id, avaliacao_criado_em
+            ), Pagina AS (
+                SELECT avaliacao_id, avaliacao_criado_em, qtd
+                FROM Contagem
+                {keyset}
+                ORDER BY qtd DESC, avaliacao_id DESC
+                LIMIT %s
+            )
+            SELECT Pagina.avaliacao_id, Avaliacoes.turma_id, Avaliacoes.user_id, Users.nome,
+            Avaliacoes.comentario, Avaliacoes.pontuacao, Pagina.qtd
+            FROM Pagina
+            INNER JOIN Avaliacoes
+            ON Avaliacoes.id = Pagina.avaliacao_id AND Avaliacoes.criado_em = Pagina.avaliacao_criado_em
+            LEFT JOIN Users ON Users.id = Avaliacoes.user_id
+            ORDER BY Pagina.qtd DESC, Pagina.avaliacao_id DESC
+"""
+_FILA_MODERACAO = preparadas.registrar(
+    "fila_moderacao", _FILA_MODERACAO_SQL.format(keyset=""), aquecer=None
+)
+_FILA_MODERACAO_ANTES = preparadas.registrar(
+    "fila_moderacao_antes", _FILA_MODERACAO_SQL.format(keyset="WHERE (qtd, avaliacao_id) < (%s, %s)"), aquecer=None
+)
+
+
+async def get_fila_moderacao(
+        conn: psycopg.AsyncConnection, before_qtd: Optional[int] = None, before_id: Optional[int] = None,
+        limit: int = DENUNCIAS_POR_PAGINA
+) -> FilaModeracao:
+    async with conn.cursor(row_factory=args_row(DenunciaItem)) as curr:
+        if before_qtd is None or before_id is None:
+            await preparadas.executar(curr, _FILA_MODERACAO, (limit + 1,))
         else:
-            return None
+            await preparadas.executar(curr, _FILA_MODERACAO_ANTES, (before_qtd, before_id, limit + 1))
+        itens = await curr.fetchall()
+
+    proximo_before_qtd, proximo_before_id = None, None
+    if len(itens) > limit:
+        itens = itens[:limit]
+        proximo_before_qtd, proximo_before_id = itens[-1].qtd_denuncias, itens[-1].avaliacao_id
+    return FilaModeracao(itens=itens, proximo_before_qtd=proximo_before_qtd, proximo_before_id=proximo_before_id)
 
 
-        
+# Um único comando por lote: as denúncias e as avaliações saem juntas e os
+# triggers FOR EACH STATEMENT de Avaliacoes ajustam os agregados uma vez por
+# turma. Devolve as denúncias removidas e (turma_id, professor_id,
+# disciplina_id, avaliações removidas) de cada turma afetada.
+_EXCLUIR_AVALIACOES = preparadas.registrar("excluir_avaliacoes", """
+            WITH denuncias AS (
+                DELETE FROM Denuncias
+                WHERE avaliacao_id = ANY(%s::int[])
+                RETURNING 1
+            ), removidas AS (
+                DELETE FROM Avaliacoes
+                WHERE id = ANY(%s::int[])
+                AND criado_em = ANY(ARRAY(SELECT criado_em FROM Avaliacoes_Ids WHERE id = ANY(%s::int[])))
+                RETURNING turma_id
+            ), por_turma AS (
+                SELECT turma_id, COUNT(*) as qtd
+                FROM removidas
+                GROUP BY turma_id
+            )
+            SELECT (SELECT COUNT(*) FROM denuncias),
+            ARRAY(
+                SELECT ARRAY[por_turma.turma_id, Turmas.professor_id, Turmas.disciplina_id, por_turma.qtd]
+                FROM por_turma
+                LEFT JOIN Turmas ON Turmas.id = por_turma.turma_id
+            )
+""", aquecer=None)
 
-async def get_user(conn, username: str):
+_DESCARTAR_DENUNCIAS = preparadas.registrar("descartar_denuncias", """
+            WITH denuncias AS (
+                DELETE FROM Denuncias
+                WHERE avaliacao_id = ANY(%s::int[])
+                RETURNING avaliacao_id
+            )
+            SELECT COUNT(DISTINCT avaliacao_id), COUNT(*)
+            FROM denuncias
+""", aquecer=None)
+
+
+async def moderar(conn: psycopg.AsyncConnection, acao: str, avaliacao_ids: List[int]) -> ModeracaoResultado:
+    ids = sorted(set(avaliacao_ids))
     async with conn.cursor() as curr:
-        await curr.execute("""
-        SELECT id, email, nome, matricula, curso, senha, is_admin
+        if acao == "descartar":
+            await preparadas.executar(curr, _DESCARTAR_DENUNCIAS, (ids,))
+            avaliacoes, denuncias = await curr.fetchone()
+            return ModeracaoResultado(acao=acao, avaliacoes=avaliacoes, denuncias=denuncias)
+
+        await preparadas.executar(curr, _EXCLUIR_AVALIACOES, (ids, ids, ids))
+        denuncias, turmas = await curr.fetchone()
+
+    for turma_id, professor_id, disciplina_id, _ in turmas:
+        invalidate_turma(turma_id, professor_id, disciplina_id)
+    return ModeracaoResultado(acao=acao, avaliacoes=sum(qtd for *_, qtd in turmas), denuncias=denuncias)
+
+
+_USER_POR_NOME = preparadas.registrar("user_por_nome", """
+        SELECT id, email, nome, matricula, curso, is_admin, senha
         FROM Users
         WHERE nome = %s;
-        """, (username,))
-        user_row = await curr.fetchone()
-
-        if user_row:
-            user_id, email, nome, matricula, curso, senha, is_admin = user_row
-            return User(
-                id=user_id,
-                email=email,
-                nome=nome,
-                matricula=matricula,
-                curso=curso,
-                senha=senha,
-                is_admin=is_admin
-            )
-        else:
-            return None
-        
-async def find_user_by_id(conn, user_id: int):
-        async with conn.cursor() as curr:
-            await curr.execute("""
-            SELECT id, email, nome, matricula, curso, senha, is_admin
-            FROM Users
-            WHERE id = %s;
-            """, (user_id,))
-            user_row = await curr.fetchone()
-
-            if user_row:
-                user_id, email, nome, matricula, curso, senha, is_admin = user_row
-                return User(
-                    id=user_id,
-                    email=email,
-                    nome=nome,
-                    matricula=matricula,
-                    curso=curso,
-                    senha=senha,
-                    is_admin=is_admin
-                )
-            else:
-                return None  
+""", aquecer=("",))
+
+
+async def get_user(conn, username: str) -> Optional[User]:
+    async with conn.cursor(row_factory=args_row(User)) as curr:
+        await preparadas.executar(curr, _USER_POR_NOME, (username,))
+        return await curr.fetchone()
+
+
+async def autenticar(conn, nome: str, senha: str) -> Optional[User]:
+    user = await get_user(conn, nome)
+    if user is None or not hmac.compare_digest(user.senha.encode("utf-8"), senha.encode("utf-8")):
+        return None
+    return user
+
+
+_USER_POR_ID = preparadas.registrar("user_por_id", """
+        SELECT id, email, nome, matricula, curso, is_admin, senha
+        FROM Users
+        WHERE id = %s;
+""", aquecer=(0,))
+
+
+async def find_user_by_id(conn, user_id: int) -> Optional[User]:
+    async with conn.cursor(row_factory=args_row(User)) as curr:
+        await preparadas.executar(curr, _USER_POR_ID, (user_id,))
+        return await curr.fetchone()
+
+
+_ADD_USER = preparadas.registrar("add_user", """
+            INSERT INTO Users (email, nome, matricula, curso, senha, is_admin)
+            VALUES (%s, %s, %s, %s, %s, %s)
+            RETURNING id;
+""", aquecer=None)
 
 
 async def add_user(conn, user: UserIn):
+    # Retorna None se o nome já está em uso (índice único Users_nome). Sempre
+    # um usuário comum: admins só entram pela importação (UserImport).
     async with conn.cursor() as curr:
-        await curr.execute("""
-        INSERT INTO Users (email, nome, matricula, curso, senha, is_admin)
-        VALUES (%s, %s, %s, %s, %s, %s)
-        RETURNING id;
-        """, (user.email, user.nome, user.matricula, user.curso, user.senha, user.is_admin))
+        try:
+            await preparadas.executar(
+                curr, _ADD_USER, (user.email, user.nome, user.matricula, user.curso, user.senha, False)
+            )
+        except psycopg.errors.UniqueViolation:
+            return None
         user_id = await curr.fetchone()
-        return User(id=user_id[0], email=user.email, nome=user.nome, matricula=user.matricula, curso=user.curso, senha=user.senha, is_admin=user.is_admin)        
+        return User(id=user_id[0], email=user.email, nome=user.nome, matricula=user.matricula, curso=user.curso, senha=user.senha, is_admin=False)
+
+
+_USER_IDS_POR_NOME = preparadas.registrar("user_ids_por_nome", "SELECT nome, id FROM Users WHERE nome = ANY(%s)", aquecer=None)
+
+
+async def get_user_ids_by_nome(conn, nomes: Iterable[str]) -> dict[str, int]:
+    async with conn.cursor() as curr:
+        await preparadas.executar(curr, _USER_IDS_POR_NOME, (list(nomes),))
+        return dict(await curr.fetchall())
+
+
+_USER_IDS_EXISTENTES = preparadas.registrar("user_ids_existentes", "SELECT id FROM Users WHERE id = ANY(%s)", aquecer=None)
+
+
+async def get_existing_user_ids(conn, user_ids: Iterable[int]) -> set[int]:
+    async with conn.cursor() as curr:
+        await preparadas.executar(curr, _USER_IDS_EXISTENTES, (list(user_ids),))
+        return {row[0] for row in await curr.fetchall()}
+
+
+_TURMAS_REFS = preparadas.registrar("turmas_refs", "SELECT id, professor_id, disciplina_id FROM Turmas WHERE id = ANY(%s)", aquecer=None)
+
+
+async def get_turmas_refs(conn, turma_ids: Iterable[int]) -> dict[int, tuple[int, int]]:
+    # turma_id -> (professor_id, disciplina_id), para validar e invalidar o cache
+    async with conn.cursor() as curr:
+        await preparadas.executar(curr, _TURMAS_REFS, (list(turma_ids),))
+        return {t_id: (p_id, d_id) for t_id, p_id, d_id in await curr.fetchall()}
+
+
+async def copy_users(conn, users: Iterable[UserImport]):
+    async with conn.cursor() as curr:
+        with metrics.rotulo("copy_users"):
+            async with curr.copy(
+                "COPY Users (email, nome, matricula, curso, senha, is_admin) FROM STDIN"
+            ) as copy:
+                for user in users:
+                    await copy.write_row(
+                        (user.email, user.nome, user.matricula, user.curso, user.senha, user.is_admin)
+                    )
+
+
+async def copy_avaliacoes(conn, avaliacoes: Iterable[tuple[int, str, int, int]]):
+    # (pontuacao, comentario, user_id, turma_id). Os triggers FOR EACH STATEMENT
+    # de Avaliacoes atualizam os agregados uma vez por COPY.
+    async with conn.cursor() as curr:
+        with metrics.rotulo("copy_avaliacoes"):
+            async with curr.copy(
+                "COPY Avaliacoes (pontuacao, comentario, user_id, turma_id) FROM STDIN"
+            ) as copy:
+                for row in avaliacoes:
+                    await copy.write_row(row)
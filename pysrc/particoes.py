@@ -0,0 +1,122 @@
+import asyncio
+import logging
+import os
+from dataclasses import dataclass
+from datetime import datetime
+from typing import List, Optional
+
+import psycopg
+
+from pysrc import connection
+
+logger = logging.getLogger(__name__)
+
+# Partições de Avaliacoes por semestre (migration 0009). A aplicação cria as
+# dos próximos semestres com antecedência, no startup e a cada
+# PARTICOES_INTERVALO segundos (0 desliga o agendador). Sem a partição do
+# semestre as avaliações vão para a partição padrão (migration 0011) e passam
+# para a do semestre quando ela é criada.
+# Semestres antigos são arquivados (DETACH) com `python -m pysrc.cli particoes
+# arquivar`.
+
+_task: Optional[asyncio.Task] = None
+
+
+def semestres_futuros() -> int:
+    # Semestres seguintes ao atual que já devem ter partição
+    return int(os.getenv("PARTICOES_SEMESTRES_FUTUROS", "2"))
+
+
+def intervalo() -> float:
+    return float(os.getenv("PARTICOES_INTERVALO", "86400"))
+
+
+@dataclass(slots=True)
+class Particao:
+    nome: str
+    # inicio None na partição padrão e na Avaliacoes_Legado (avaliações sem
+    # data, de antes da migration 0009); fim None só na padrão
+    inicio: Optional[datetime]
+    fim: Optional[datetime]
+    # Estimativa do planner (pg_class.reltuples), sem ler a partição
+    linhas: int
+
+
+async def criar_futuras(conn: psycopg.AsyncConnection, semestres: Optional[int] = None) -> List[str]:
+    # Partições do semestre atual e dos próximos; devolve as criadas
+    semestres = semestres_futuros() if semestres is None else semestres
+    async with conn.cursor() as curr:
+        await curr.execute(
+            "SELECT Criar_Particoes_Avaliacoes(now(), now() + make_interval(months => 6 * %s))", (semestres,)
+        )
+        return [nome for (nome,) in await curr.fetchall()]
+
+
+async def criar(conn: psycopg.AsyncConnection, de: datetime, ate: datetime) -> List[str]:
+    async with conn.cursor() as curr:
+        await curr.execute("SELECT Criar_Particoes_Avaliacoes(%s, %s)", (de, ate))
+        return [nome for (nome,) in await curr.fetchall()]
+
+
+async def listar(conn: psycopg.AsyncConnection) -> List[Particao]:
+    async with conn.cursor() as curr:
+        await curr.execute("""
+                           SELECT Particao.relname,
+                           (regexp_match(pg_get_expr(Particao.relpartbound, Particao.oid), 'FROM \\(''(.*)''\\) TO'))[1]::timestamptz,
+                           (regexp_match(pg_get_expr(Particao.relpartbound, Particao.oid), 'TO \\(''(.*)''\\)'))[1]::timestamptz,
+                           GREATEST(Particao.reltuples, 0)::bigint
+                           FROM pg_inherits
+                           INNER JOIN pg_class as Particao ON Particao.oid = pg_inherits.inhrelid
+                           WHERE pg_inherits.inhparent = 'avaliacoes'::regclass
+                           ORDER BY 3 NULLS LAST
+        """)
+        return [Particao(*row) for row in await curr.fetchall()]
+
+
+async def arquivar(conn: psycopg.AsyncConnection, ate: datetime) -> List[tuple[str, int]]:
+    # Arquiva as partições que terminam até "ate" (início de um semestre),
+    # cada uma na sua transação. Devolve (partição, avaliações arquivadas).
+    # A padrão e a Avaliacoes_Legado não são de um semestre e ficam.
+    arquivadas = []
+    for particao in await listar(conn):
+        if particao.inicio is None or particao.fim > ate:
+            continue
+        async with conn.transaction():
+            async with conn.cursor() as curr:
+                await curr.execute("SELECT Arquivar_Particao_Avaliacoes(%s::regclass)", (particao.nome,))
+                (qtd,) = await curr.fetchone()
+        arquivadas.append((particao.nome, qtd))
+    return arquivadas
+
+
+async def _loop(interval: float):
+    while True:
+        try:
+            async with connection.connect() as conn:
+                for nome in await criar_futuras(conn):
+                    logger.info("Partição %s criada", nome)
+        except Exception:
+            logger.exception("Falha ao criar as partições de Avaliacoes")
+        await asyncio.sleep(interval)
+
+
+def start():
+    global _task
+    interval = intervalo()
+    if _task is not None or interval <= 0:
+        return
+
+    _task = asyncio.create_task(_loop(interval))
+
+
+async def stop():
+    global _task
+    if _task is None:
+        return
+
+    _task.cancel()
+    try:
+        await _task
+    except asyncio.CancelledError:
+        pass
+    _task = None
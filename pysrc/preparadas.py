@@ -0,0 +1,154 @@
+import logging
+import os
+import re
+from typing import Any, NamedTuple, Optional, Sequence
+
+import psycopg
+from psycopg.pq import PipelineStatus, TransactionStatus
+from psycopg.types.numeric import Int8
+
+from pysrc import metrics
+
+logger = logging.getLogger(__name__)
+
+# Registro das consultas de models executadas como prepared statements: cada
+# uma é preparada no servidor uma vez por conexão (na criação da conexão do
+# pool, ver aquecer, ou no primeiro uso) e depois só recebe os parâmetros,
+# sem o Postgres analisar e planejar o SQL de novo.
+#
+# O psycopg guarda os statements preparados por (SQL, tipos dos parâmetros) e
+# escolhe int2/int4/int8 pelo valor de cada int; para que cada consulta tenha
+# um único statement por conexão todo int é enviado como int8.
+#
+# PREPARED_STATEMENTS=0 volta ao comportamento padrão do psycopg (prepara
+# automaticamente depois de algumas execuções iguais na mesma conexão).
+
+ENABLED = os.getenv("PREPARED_STATEMENTS", "1").lower() not in ("0", "false", "no")
+
+
+class Consulta(NamedTuple):
+    nome: str
+    sql: str
+    # Parâmetros para preparar a consulta na criação da conexão sem efeito
+    # (ex.: id 0, que não existe). None: só prepara no primeiro uso (escritas)
+    aquecer: Optional[tuple]
+
+
+CONSULTAS: dict[str, Consulta] = {}
+# nome -> execuções neste processo
+_execucoes: dict[str, int] = {}
+
+
+def registrar(nome: str, sql: str, aquecer: Optional[tuple] = None) -> Consulta:
+    if nome in CONSULTAS:
+        raise ValueError(f"consulta já registrada: {nome}")
+    consulta = Consulta(nome, sql, aquecer)
+    CONSULTAS[nome] = consulta
+    _execucoes[nome] = 0
+    return consulta
+
+
+def _param(valor):
+    if isinstance(valor, int) and not isinstance(valor, bool):
+        return Int8(valor)
+    if isinstance(valor, list):
+        return [_param(item) for item in valor]
+    return valor
+
+
+async def _execute(curr, sql: str, params: Sequence[Any], prepare: Optional[bool]):
+    # Fora de um pipeline a consulta vai num pipeline só dela: numa conexão em
+    # que ela ainda não foi preparada, o Parse segue junto com a execução em
+    # vez de custar uma ida e volta a mais. Dentro de um pipeline ela só entra
+    # na fila dele.
+    conn = curr.connection
+    if conn.pgconn.pipeline_status != PipelineStatus.OFF:
+        return await curr.execute(sql, params, prepare=prepare)
+    async with conn.pipeline():
+        await curr.execute(sql, params, prepare=prepare)
+    return curr
+
+
+async def executar(curr, consulta: Consulta, params: Sequence[Any] = ()):
+    _execucoes[consulta.nome] += 1
+    # Métricas e Server-Timing por nome da consulta
+    with metrics.rotulo(consulta.nome):
+        return await _executar(curr, consulta, params)
+
+
+async def _executar(curr, consulta: Consulta, params: Sequence[Any]):
+    if not ENABLED:
+        return await _execute(curr, consulta.sql, params, None)
+    params = [_param(valor) for valor in params]
+    try:
+        return await _execute(curr, consulta.sql, params, True)
+    except psycopg.errors.FeatureNotSupported as e:
+        # "cached plan must not change result type": uma migration mudou o
+        # tipo de uma coluna do resultado. Descarta os statements desta conexão
+        # e prepara de novo. Dentro de uma transação o erro já a abortou; o
+        # ROLLBACK de quem a abriu faz essa limpeza.
+        conn = curr.connection
+        if "cached plan" not in str(e) or conn.info.transaction_status != TransactionStatus.IDLE:
+            raise
+        # O psycopg esquece os statements e envia DEALLOCATE ALL a cada ROLLBACK
+        async with conn.transaction():
+            raise psycopg.Rollback()
+        return await _execute(curr, consulta.sql, params, True)
+
+
+async def aquecer(conn: psycopg.AsyncConnection):
+    # configure do pool: prepara as consultas de leitura em cada conexão nova.
+    # Uma consulta que falha (ex.: banco ainda sem as tabelas, antes das
+    # migrations) fica para ser preparada no primeiro uso.
+    if not ENABLED:
+        return
+    async with conn.cursor() as curr:
+        with metrics.rotulo("aquecer"):
+            for consulta in CONSULTAS.values():
+                if consulta.aquecer is None:
+                    continue
+                try:
+                    await curr.execute(consulta.sql, [_param(valor) for valor in consulta.aquecer], prepare=True)
+                except psycopg.Error as e:
+                    logger.debug("Consulta %s não preparada no aquecimento: %s", consulta.nome, e)
+
+
+def _normalizar(sql: str) -> str:
+    # Mesmo texto para o SQL do registro (%s, %(nome)s) e o preparado no
+    # servidor ($1, $2...)
+    sql = re.sub(r"%\(\w+\)s|%s|\$\d+", "?", sql)
+    return " ".join(sql.split())
+
+
+_POR_TEXTO: dict[str, str] = {}
+
+
+def stats() -> dict:
+    return {
+        "enabled": ENABLED,
+        "consultas": len(CONSULTAS),
+        "execucoes": dict(_execucoes),
+    }
+
+
+async def stats_conexao(conn: psycopg.AsyncConnection) -> list[dict]:
+    # Statements preparados nesta conexão e quantas vezes o Postgres usou o
+    # plano genérico (reaproveitado) ou gerou um plano para os parâmetros
+    if len(_POR_TEXTO) != len(CONSULTAS):
+        _POR_TEXTO.update({_normalizar(c.sql): c.nome for c in CONSULTAS.values()})
+    async with conn.cursor() as curr:
+        await curr.execute("""
+                           SELECT statement, generic_plans, custom_plans
+                           FROM pg_prepared_statements
+                           ORDER BY generic_plans + custom_plans DESC
+        """)
+        return [
+            {
+                # Fora do registro (ex.: a busca, com SQL montado por filtro):
+                # preparadas automaticamente pelo psycopg
+                "nome": _POR_TEXTO.get(_normalizar(statement)) or " ".join(statement.split())[:80],
+                "generic_plans": generic_plans,
+                "custom_plans": custom_plans,
+            }
+            for statement, generic_plans, custom_plans in await curr.fetchall()
+        ]
@@ -0,0 +1,475 @@
+import asyncio
+import gzip
+import logging
+import os
+from email.utils import formatdate
+from typing import List, Optional
+
+import psycopg
+from fastapi import Request, Response
+from fastapi.responses import FileResponse
+
+from pysrc import connection
+from pysrc import http_cache
+from pysrc import models
+from pysrc import templates
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+# Páginas do catálogo iguais para todo visitante anônimo (lista de
+# professores e de disciplinas, página de cada disciplina, JSON de cada
+# professor e a primeira página de cada turma) gravadas em disco, servidas sem
+# consultar o banco pela aplicação ou direto pelo nginx.
+#
+# Os arquivos ficam em PRERENDER_DIR/<fingerprint dos templates>/, então uma
+# mudança de template nunca serve HTML antigo; PRERENDER_DIR/atual aponta para
+# o diretório da última reconstrução completa (para o nginx).
+#
+# Uma escrita nas avaliações de uma turma (models.invalidate_turma) descarta
+# na hora as páginas afetadas: a requisição seguinte deste processo já vai ao
+# banco, e os arquivos são apagados logo depois, numa thread e em lote (o
+# event loop não espera o disco). Uma tarefa em segundo plano os gera de novo
+# em seguida. Páginas sem arquivo (ainda não geradas) seguem o caminho normal.
+#
+# Os arquivos são compartilhados pelos processos, então a regeração confere a
+# versão da página (a mesma do ETag, models.get_versao) antes de gerar e
+# depois de gravar: se mudou no meio, o arquivo é apagado. Escritas que não
+# passam por models.invalidate_turma neste processo (outros workers,
+# arquivamento de partições, SQL direto) aparecem na verificação feita a cada
+# PRERENDER_INTERVALO segundos das versões das turmas e do catálogo.
+
+DIR = os.getenv("PRERENDER_DIR", "")
+# Variações comprimidas gravadas ao lado de cada arquivo (br só com o pacote
+# brotli instalado)
+COMPRESSAO = [c.strip() for c in os.getenv("PRERENDER_COMPRESSAO", "gzip,br").split(",") if c.strip()]
+# Espera depois de uma escrita para juntar as de uma rajada numa regeração só
+ESPERA = float(os.getenv("PRERENDER_ESPERA_MS", "200")) / 1000
+# Intervalo da verificação das versões (0 desliga)
+INTERVALO = float(os.getenv("PRERENDER_INTERVALO", "30"))
+
+_EXTENSOES = {"gzip": ".gz", "br": ".br"}
+# O FileResponse acrescenta "; charset=utf-8" aos tipos text/*
+_MEDIA_TYPES = {".html": "text/html", ".json": "application/json"}
+
+
+def enabled() -> bool:
+    return bool(DIR)
+
+
+def diretorio() -> str:
+    return os.path.join(DIR, templates.fingerprint)
+
+
+def _arquivo(pagina: str, id: Optional[int] = None) -> str:
+    if pagina in ("professores", "disciplinas"):
+        return f"{pagina}.html"
+    if pagina == "professor":
+        return f"professor/{id}.json"
+    return f"{pagina}/{id}.html"
+
+
+def _comprimir(codificacao: str, conteudo: bytes) -> Optional[bytes]:
+    if codificacao == "gzip":
+        return gzip.compress(conteudo, 9)
+    if codificacao == "br" and brotli is not None:
+        return brotli.compress(conteudo)
+    return None
+
+
+def _substituir(caminho: str, conteudo: bytes):
+    temporario = f"{caminho}.{os.getpid()}.tmp"
+    with open(temporario, "wb") as f:
+        f.write(conteudo)
+    os.replace(temporario, caminho)
+
+
+def _apagar(caminho: str):
+    try:
+        os.unlink(caminho)
+    except FileNotFoundError:
+        pass
+
+
+def gravar(base: str, arquivo: str, conteudo: bytes):
+    # As variações comprimidas antes do arquivo principal: servir só olha as
+    # variações de um arquivo principal que existe
+    caminho = os.path.join(base, arquivo)
+    os.makedirs(os.path.dirname(caminho), exist_ok=True)
+    for codificacao, extensao in _EXTENSOES.items():
+        comprimido = _comprimir(codificacao, conteudo) if codificacao in COMPRESSAO else None
+        if comprimido is None:
+            _apagar(caminho + extensao)
+        else:
+            _substituir(caminho + extensao, comprimido)
+    _substituir(caminho, conteudo)
+
+
+def remover(base: str, arquivo: str):
+    caminho = os.path.join(base, arquivo)
+    _apagar(caminho)
+    for extensao in _EXTENSOES.values():
+        _apagar(caminho + extensao)
+
+
+def _localizar(caminho: str, aceitas: set[str]):
+    # stat do arquivo e da variação comprimida que o cliente aceita (br antes
+    # de gzip); FileNotFoundError se a página não está gravada
+    stat = os.stat(caminho)
+    for codificacao in ("br", "gzip"):
+        if codificacao not in aceitas:
+            continue
+        try:
+            return stat, codificacao, os.stat(caminho + _EXTENSOES[codificacao])
+        except FileNotFoundError:
+            pass
+    return stat, None, stat
+
+
+async def servir(request: Request, pagina: str, id: Optional[int] = None) -> Optional[Response]:
+    # Resposta com o arquivo pré-renderizado da página, ou None se não há.
+    # Os stat rodam numa thread, fora do event loop (disco lento ou NFS
+    # travariam todas as requisições do processo); o FileResponse recebe o
+    # stat pronto e lê o arquivo de forma assíncrona.
+    if not DIR:
+        return None
+    if regerador is not None and regerador.descartada(pagina, id):
+        # Arquivo desatualizado, ainda não apagado ou regerado
+        return None
+    caminho = os.path.join(diretorio(), _arquivo(pagina, id))
+    aceitas = {parte.split(";")[0].strip() for parte in request.headers.get("accept-encoding", "").split(",")}
+    try:
+        stat, codificacao, stat_enviado = await asyncio.to_thread(_localizar, caminho, aceitas)
+    except FileNotFoundError:
+        return None
+
+    headers = {
+        "ETag": f'"estatico-{stat.st_mtime_ns:x}-{stat.st_size:x}"',
+        "Last-Modified": formatdate(stat.st_mtime, usegmt=True),
+        "Cache-Control": http_cache.PUBLICO,
+        "Vary": "Accept-Encoding",
+    }
+    if http_cache.not_modified(request, headers):
+        return http_cache.not_modified_response(headers)
+
+    media_type = _MEDIA_TYPES[os.path.splitext(caminho)[1]]
+    if codificacao is not None:
+        headers["Content-Encoding"] = codificacao
+        caminho += _EXTENSOES[codificacao]
+    return FileResponse(caminho, media_type=media_type, headers=headers, stat_result=stat_enviado)
+
+
+# Conteúdo de cada página, como os endpoints de index.py o montam para um
+# visitante anônimo, lido direto do banco (sem o cache de leitura). None: a
+# página não existe.
+
+async def _professores(conn: psycopg.AsyncConnection, _) -> bytes:
+    professores = await models.get_all_professores.fn(conn)
+    return templates.render("professores.html", professores=professores).encode()
+
+
+async def _disciplinas(conn: psycopg.AsyncConnection, _) -> bytes:
+    disciplinas = await models.get_all_disciplinas(conn)
+    return templates.render("disciplinas.html", disciplinas=disciplinas).encode()
+
+
+async def _disciplina(conn: psycopg.AsyncConnection, disciplina_id: int) -> Optional[bytes]:
+    disciplina = await models.get_disciplina_info.fn(conn, disciplina_id)
+    if disciplina is None:
+        return None
+    return templates.render("disciplina.html", disciplina=disciplina).encode()
+
+
+async def _professor(conn: psycopg.AsyncConnection, professor_id: int) -> bytes:
+    return await models.get_professor_info.fn(conn, professor_id)
+
+
+async def _turma(conn: psycopg.AsyncConnection, turma_id: int) -> Optional[bytes]:
+    turma = await models.get_turma_info.fn(conn, turma_id)
+    if turma is None:
+        return None
+    return templates.render(
+        "turma.html", turma=turma, avaliacoes=turma.avaliacoes,
+        url=f"/api/turma/{turma_id}", proximo_before_id=turma.proximo_before_id,
+        limit=models.AVALIACOES_POR_PAGINA, user_id=None, sessao=None
+    ).encode()
+
+
+_PAGINAS = {
+    "professores": _professores,
+    "disciplinas": _disciplinas,
+    "disciplina": _disciplina,
+    "professor": _professor,
+    "turma": _turma,
+}
+
+
+async def _versao(conn: psycopg.AsyncConnection, pagina: str, id: Optional[int]) -> str:
+    # A versão que o endpoint da página usa no ETag
+    if pagina == "disciplinas":
+        versao = await models.get_versao_catalogo(conn)
+    elif pagina == "professores":
+        versao = await models.get_versao(conn)
+    else:
+        versao = await models.get_versao(conn, pagina, id)
+    return versao.versao
+
+
+async def renderizar(
+    conn: psycopg.AsyncConnection, base: str, pagina: str, id: Optional[int] = None
+) -> Optional[bool]:
+    # Grava (ou remove, se a página não existe) o arquivo de uma página.
+    # Retorna None se a versão mudou enquanto a página era gerada: o arquivo,
+    # talvez com dados de antes da escrita, é apagado. A conferência é depois
+    # de gravar, então uma escrita confirmada depois dela apaga um arquivo já
+    # gravado (models.invalidate_turma ou a verificação do Regerador).
+    versao = await _versao(conn, pagina, id)
+    conteudo = await _PAGINAS[pagina](conn, id)
+    arquivo = _arquivo(pagina, id)
+    if conteudo is None:
+        await asyncio.to_thread(remover, base, arquivo)
+        return False
+    await asyncio.to_thread(gravar, base, arquivo, conteudo)
+    if await _versao(conn, pagina, id) != versao:
+        await asyncio.to_thread(remover, base, arquivo)
+        return None
+    return True
+
+
+async def paginas(conn: psycopg.AsyncConnection) -> List[tuple[str, Optional[int]]]:
+    # Todas as páginas do catálogo
+    async with conn.cursor() as curr:
+        await curr.execute("SELECT id FROM Disciplinas ORDER BY id")
+        disciplinas = [row[0] for row in await curr.fetchall()]
+        await curr.execute("SELECT id FROM Professores ORDER BY id")
+        professores = [row[0] for row in await curr.fetchall()]
+        await curr.execute("SELECT id FROM Turmas ORDER BY id")
+        turmas = [row[0] for row in await curr.fetchall()]
+    return (
+        [("professores", None), ("disciplinas", None)]
+        + [("disciplina", id) for id in disciplinas]
+        + [("professor", id) for id in professores]
+        + [("turma", id) for id in turmas]
+    )
+
+
+async def reconstruir(conn: psycopg.AsyncConnection, base: Optional[str] = None) -> int:
+    # Todas as páginas do catálogo; no fim PRERENDER_DIR/atual passa a
+    # apontar para o diretório gerado. Retorna quantas páginas foram gravadas
+    # (as que mudaram durante a reconstrução ficam sem arquivo).
+    base = base or diretorio()
+    gravadas = 0
+    for pagina, id in await paginas(conn):
+        gravadas += bool(await renderizar(conn, base, pagina, id))
+
+    atual = os.path.join(os.path.dirname(base), "atual")
+    temporario = f"{atual}.{os.getpid()}.tmp"
+    _apagar(temporario)
+    os.symlink(os.path.basename(base), temporario)
+    os.replace(temporario, atual)
+    return gravadas
+
+
+class Regerador:
+    # Regera em segundo plano as páginas afetadas pelas escritas
+    def __init__(self, base: str, espera: float, intervalo: float):
+        self.base = base
+        self.espera = espera
+        self.intervalo = intervalo
+        self._pendentes: set[tuple[str, Optional[int]]] = set()
+        self._evento = asyncio.Event()
+        # Páginas descartadas e ainda não regeradas (-> quantas vezes foram
+        # descartadas, para a regeração saber se chegou outra escrita) e as
+        # que ainda têm os arquivos a apagar
+        self._descartadas: dict[tuple[str, Optional[int]], int] = {}
+        self._a_apagar: set[tuple[str, Optional[int]]] = set()
+        self._evento_apagar = asyncio.Event()
+        # Apagar e regerar não se cruzam: um lote atrasado não apaga um
+        # arquivo que acabou de ser regerado
+        self._disco = asyncio.Lock()
+        self._tasks: List[asyncio.Task] = []
+        # Verificação: versão do catálogo e maior versão de turma vistas na
+        # última rodada, o limite da consulta (a maior da rodada anterior, para
+        # pegar uma escrita que pegou a versão antes e confirmou depois) e as
+        # versões das turmas acima do limite já tratadas
+        self._catalogo: Optional[int] = None
+        self._ultima: Optional[int] = None
+        self._desde: Optional[int] = None
+        self._vistas: dict[int, int] = {}
+        self.paginas = 0
+        self.desatualizadas = 0
+        self.verificacoes = 0
+        self.falhas = 0
+
+    def start(self):
+        self._tasks.append(asyncio.create_task(self._loop()))
+        self._tasks.append(asyncio.create_task(self._loop_apagar()))
+        if self.intervalo > 0:
+            self._tasks.append(asyncio.create_task(self._loop_verificar()))
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        for task in self._tasks:
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        self._tasks.clear()
+
+    def _descartar(self, chaves):
+        # Chamado a cada escrita, no event loop: só marca as páginas
+        for chave in chaves:
+            self._descartadas[chave] = self._descartadas.get(chave, 0) + 1
+            self._a_apagar.add(chave)
+            self._pendentes.add(chave)
+        self._evento_apagar.set()
+        self._evento.set()
+
+    def descartada(self, pagina: str, id: Optional[int]) -> bool:
+        return (pagina, id) in self._descartadas
+
+    def _apagar(self, chaves):
+        for chave in chaves:
+            remover(self.base, _arquivo(*chave))
+
+    async def _loop_apagar(self):
+        while True:
+            await self._evento_apagar.wait()
+            self._evento_apagar.clear()
+            async with self._disco:
+                chaves, self._a_apagar = self._a_apagar, set()
+                try:
+                    await asyncio.to_thread(self._apagar, chaves)
+                except Exception:
+                    logger.exception("Falha ao apagar %d página(s) pré-renderizadas", len(chaves))
+                    self.falhas += 1
+
+    def invalidar(self, turma_id: int, professor_id: Optional[int], disciplina_id: Optional[int]):
+        chaves = [("turma", turma_id), ("professores", None)]
+        if professor_id is not None:
+            chaves.append(("professor", professor_id))
+        if disciplina_id is not None:
+            chaves.append(("disciplina", disciplina_id))
+        self._descartar(chaves)
+
+    async def _loop(self):
+        while True:
+            await self._evento.wait()
+            await asyncio.sleep(self.espera)
+            self._evento.clear()
+            pendentes, self._pendentes = self._pendentes, set()
+            try:
+                await self._regerar(pendentes)
+            except Exception:
+                logger.exception("Falha ao regerar %d página(s) pré-renderizadas", len(pendentes))
+                self.falhas += 1
+
+    async def _regerar(self, pendentes: set):
+        # Primário: as réplicas podem ainda não ter a escrita
+        async with connection.connect() as conn:
+            for chave in sorted(pendentes, key=str):
+                descartes = self._descartadas.get(chave)
+                async with self._disco:
+                    # O arquivo vai ser regravado (ou apagado, se mudar de novo)
+                    self._a_apagar.discard(chave)
+                    resultado = await renderizar(conn, self.base, *chave)
+                if resultado is None:
+                    # Outra escrita chegou durante a regeração: tenta de novo
+                    self.desatualizadas += 1
+                    self._pendentes.add(chave)
+                    self._evento.set()
+                    continue
+                if self._descartadas.get(chave) == descartes:
+                    self._descartadas.pop(chave, None)
+                self.paginas += 1
+
+    async def _loop_verificar(self):
+        while True:
+            try:
+                await self._verificar()
+                self.verificacoes += 1
+            except Exception:
+                logger.exception("Falha ao verificar as versões das páginas pré-renderizadas")
+                self.falhas += 1
+            await asyncio.sleep(self.intervalo)
+
+    async def _verificar(self):
+        async with connection.connect() as conn:
+            async with conn.cursor() as curr:
+                await curr.execute("SELECT versao FROM Versoes WHERE nome='catalogo'")
+                (catalogo,) = await curr.fetchone()
+                if self._ultima is None:
+                    # Primeira rodada: só marca de onde começar
+                    await curr.execute("SELECT COALESCE(MAX(versao), 0) FROM Turmas_Avaliacoes_Stats")
+                    (self._ultima,) = await curr.fetchone()
+                    self._desde = self._ultima
+                    self._catalogo = catalogo
+                    return
+                await curr.execute("""
+                                   SELECT Stats.turma_id, Stats.versao, Turmas.professor_id, Turmas.disciplina_id
+                                   FROM Turmas_Avaliacoes_Stats as Stats
+                                   INNER JOIN Turmas
+                                   ON Turmas.id=Stats.turma_id
+                                   WHERE Stats.versao > %s
+                """, (self._desde,))
+                turmas = await curr.fetchall()
+
+            if catalogo != self._catalogo:
+                # Nomes, turmas ou professores mudaram: todas as páginas
+                self._descartar(await paginas(conn))
+            self._catalogo = catalogo
+
+        vistas = {}
+        for turma_id, versao, professor_id, disciplina_id in turmas:
+            vistas[turma_id] = versao
+            if self._vistas.get(turma_id) != versao:
+                self.invalidar(turma_id, professor_id, disciplina_id)
+        self._vistas = vistas
+        self._desde, self._ultima = self._ultima, max([self._ultima, *vistas.values()])
+
+    def stats(self) -> dict:
+        return {
+            "enabled": True,
+            "diretorio": self.base,
+            "compressao": [c for c in COMPRESSAO if c != "br" or brotli is not None],
+            "pendentes": len(self._pendentes),
+            "descartadas": len(self._descartadas),
+            "paginas": self.paginas,
+            "desatualizadas": self.desatualizadas,
+            "verificacoes": self.verificacoes,
+            "falhas": self.falhas,
+        }
+
+
+regerador: Optional[Regerador] = None
+
+
+def start():
+    global regerador
+    if regerador is not None or not enabled():
+        return
+    if "br" in COMPRESSAO and brotli is None:
+        logger.warning("PRERENDER_COMPRESSAO inclui br, mas o pacote brotli não está instalado: só gzip")
+    regerador = Regerador(diretorio(), ESPERA, INTERVALO)
+    regerador.start()
+    models.ouvintes_turma.append(regerador.invalidar)
+
+
+async def stop():
+    global regerador
+    if regerador is None:
+        return
+    models.ouvintes_turma.remove(regerador.invalidar)
+    await regerador.stop()
+    regerador = None
+
+
+def stats() -> dict:
+    if regerador is None:
+        return {"enabled": False}
+    return regerador.stats()
@@ -0,0 +1,48 @@
+import asyncio
+import logging
+import os
+from typing import Optional
+
+from pysrc import connection
+from pysrc import models
+
+logger = logging.getLogger(__name__)
+
+_refresh_task: Optional[asyncio.Task] = None
+
+
+def refresh_interval() -> float:
+    # Segundos entre dois REFRESH do ranking; 0 desliga o agendador
+    return float(os.getenv("RANKING_REFRESH_INTERVAL", "300"))
+
+
+async def _refresh_loop(interval: float):
+    while True:
+        try:
+            async with connection.connect() as conn:
+                await models.refresh_ranking(conn)
+        except Exception:
+            logger.exception("Falha ao atualizar Professores_Ranking")
+        await asyncio.sleep(interval)
+
+
+def start_scheduler():
+    global _refresh_task
+    interval = refresh_interval()
+    if _refresh_task is not None or interval <= 0:
+        return
+
+    _refresh_task = asyncio.create_task(_refresh_loop(interval))
+
+
+async def stop_scheduler():
+    global _refresh_task
+    if _refresh_task is None:
+        return
+
+    _refresh_task.cancel()
+    try:
+        await _refresh_task
+    except asyncio.CancelledError:
+        pass
+    _refresh_task = None
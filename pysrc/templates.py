@@ -0,0 +1,63 @@
+import hashlib
+import os
+from time import perf_counter
+
+from jinja2 import Environment, FileSystemLoader, select_autoescape
+from markupsafe import Markup
+
+from pysrc import metrics
+
+TEMPLATES_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "templates")
+
+# Os templates não mudam com a aplicação rodando: sem auto_reload, cada um é
+# compilado uma vez (load_all, no startup) e reaproveitado do cache do Environment.
+env = Environment(
+    loader=FileSystemLoader(TEMPLATES_DIR),
+    autoescape=select_autoescape(["html"]),
+    trim_blocks=True,
+    lstrip_blocks=True,
+    auto_reload=False,
+    cache_size=-1,
+)
+
+# HTML das estrelas de 0 a 5, igual à macro estrelas de _macros.html, para o
+# laço das avaliações não chamar uma macro por linha
+env.globals["ESTRELAS"] = [Markup(f"<div>{'★' * n}{'☆' * (5 - n)}</div>") for n in range(6)]
+
+LOTE_STREAM = 100
+
+# Hash do conteúdo dos templates (calculado em load_all). Entra nos ETags para
+# que uma mudança de template invalide as páginas guardadas pelos clientes.
+fingerprint = ""
+
+
+def load_all():
+    global fingerprint
+    digest = hashlib.sha1()
+    for name in sorted(env.list_templates(extensions=["html"])):
+        env.get_template(name)
+        source, _, _ = env.loader.get_source(env, name)
+        digest.update(source.encode("utf-8"))
+    fingerprint = digest.hexdigest()[:8]
+
+
+def render(name: str, **context) -> str:
+    inicio = perf_counter()
+    html = env.get_template(name).render(**context)
+    metrics.registrar_render(name, perf_counter() - inicio)
+    return html
+
+
+async def stream_turma(avaliacoes, **context):
+    # Mesmo conteúdo de turma.html, mas enviado em partes: o início sai de
+    # imediato e as avaliações (iterador assíncrono) em lotes de LOTE_STREAM
+    yield render("turma_inicio.html", **context)
+
+    lote = []
+    async for avaliacao in avaliacoes:
+        lote.append(avaliacao)
+        if len(lote) >= LOTE_STREAM:
+            yield render("turma_avaliacoes.html", avaliacoes=lote, **context)
+            lote = []
+
+    yield render("turma_avaliacoes.html", avaliacoes=lote, **context) + render("turma_fim.html", **context)
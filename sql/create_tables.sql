@@ -17,7 +17,7 @@ CREATE TABLE Professores (
 );
 
 CREATE TABLE Disciplinas (
-    id varchar,
+    id SERIAL,
     nome VARCHAR NOT NULL,
     departamento_id INT,
 
@@ -0,0 +1,9 @@
+-- usa: Turmas_professor_id
+SELECT turma_id, professor_nome, disciplina_nome, qtd_avaliacoes, sum_avaliacoes
+FROM Turmas_Avaliacoes_View
+WHERE professor_id = (SELECT MAX(id) FROM Professores);
+
+-- usa: Turmas_disciplina_id
+SELECT turma_id, professor_nome, qtd_avaliacoes, sum_avaliacoes, disciplina_nome
+FROM Turmas_Avaliacoes_View
+WHERE disciplina_id = (SELECT MAX(id) FROM Disciplinas);
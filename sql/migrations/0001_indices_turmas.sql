@@ -0,0 +1,4 @@
+-- Turmas_Avaliacoes_View é filtrada por professor (get_professor_info,
+-- get_versao) e por disciplina (get_disciplina_info)
+CREATE INDEX IF NOT EXISTS Turmas_professor_id ON Turmas (professor_id);
+CREATE INDEX IF NOT EXISTS Turmas_disciplina_id ON Turmas (disciplina_id);
@@ -0,0 +1,7 @@
+-- usa: Users_nome
+SELECT id, email, nome, matricula, curso, senha, is_admin
+FROM Users
+WHERE nome = (SELECT MAX(nome) FROM Users);
+
+-- usa: Users_nome
+SELECT nome, id FROM Users WHERE nome = ANY(ARRAY['explain-1', 'explain-2', 'explain-3']);
@@ -0,0 +1,25 @@
+-- O login é pelo nome (get_user, get_user_ids_by_nome): o índice serve a busca
+-- e garante que dois usuários não tenham o mesmo nome. A migration não mexe
+-- nos nomes: se já houver nomes repetidos ela falha listando-os, e quem opera
+-- o banco decide com os usuários como resolvê-los antes de rodá-la de novo.
+DO $$
+DECLARE
+    repetidos TEXT;
+BEGIN
+    SELECT string_agg(format('%L (ids %s)', nome, ids), ', ' ORDER BY nome) INTO repetidos
+    FROM (
+        SELECT nome, string_agg(id::text, ', ' ORDER BY id) as ids
+        FROM Users
+        GROUP BY nome
+        HAVING COUNT(*) > 1
+    ) as Repetidos;
+
+    IF repetidos IS NOT NULL THEN
+        RAISE unique_violation USING
+            MESSAGE = 'Users.nome tem nomes repetidos: ' || repetidos,
+            HINT = 'SELECT nome, array_agg(id ORDER BY id) FROM Users GROUP BY nome HAVING COUNT(*) > 1';
+    END IF;
+END;
+$$;
+
+CREATE UNIQUE INDEX IF NOT EXISTS Users_nome ON Users (nome);
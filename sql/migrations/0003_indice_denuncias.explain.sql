@@ -0,0 +1,2 @@
+-- usa: Denuncias_avaliacao_id
+SELECT 1 FROM Denuncias WHERE avaliacao_id = (SELECT MAX(id) FROM Avaliacoes);
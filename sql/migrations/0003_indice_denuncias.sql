@@ -0,0 +1,3 @@
+-- Cada DELETE em Avaliacoes (delete_comment) confere a FK de Denuncias; sem
+-- índice em avaliacao_id essa conferência lê a tabela inteira
+CREATE INDEX IF NOT EXISTS Denuncias_avaliacao_id ON Denuncias (avaliacao_id);
@@ -0,0 +1,8 @@
+-- usa: Avaliacoes_turma_id_id
+SELECT Avaliacoes.id, Users.nome, Avaliacoes.user_id, Avaliacoes.pontuacao, Avaliacoes.comentario
+FROM Avaliacoes
+INNER JOIN Users
+ON Avaliacoes.user_id=Users.id
+WHERE Avaliacoes.turma_id = (SELECT MAX(id) FROM Turmas)
+ORDER BY Avaliacoes.id DESC
+LIMIT 51;
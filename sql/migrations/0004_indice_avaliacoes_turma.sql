@@ -0,0 +1,2 @@
+-- Paginação por keyset das avaliações de uma turma (WHERE turma_id=? AND id < ? ORDER BY id DESC)
+CREATE INDEX IF NOT EXISTS Avaliacoes_turma_id_id ON Avaliacoes (turma_id, id);
@@ -0,0 +1,167 @@
+-- Agregados de avaliações por turma, mantidos pelos triggers abaixo.
+-- Evita recontar Avaliacoes a cada leitura da Turmas_Avaliacoes_View.
+-- Idempotente (IF NOT EXISTS / OR REPLACE / DROP IF EXISTS): pode ser
+-- reaplicada sem erro.
+CREATE TABLE IF NOT EXISTS Turmas_Avaliacoes_Stats (
+    turma_id INT,
+    qtd_avaliacoes INT NOT NULL DEFAULT 0,
+    sum_avaliacoes BIGINT NOT NULL DEFAULT 0,
+    -- histograma: quantidade de avaliações com 1, 2, ..., 5 estrelas
+    qtd_1 INT NOT NULL DEFAULT 0,
+    qtd_2 INT NOT NULL DEFAULT 0,
+    qtd_3 INT NOT NULL DEFAULT 0,
+    qtd_4 INT NOT NULL DEFAULT 0,
+    qtd_5 INT NOT NULL DEFAULT 0,
+
+    PRIMARY KEY(turma_id),
+    CONSTRAINT fk_turma
+      FOREIGN KEY(turma_id)
+	  REFERENCES Turmas(id)
+	  ON DELETE CASCADE
+);
+
+-- Aplica o delta de um comando sobre Avaliacoes (triggers FOR EACH STATEMENT
+-- com transition tables: um upsert por turma afetada, não por linha).
+CREATE OR REPLACE FUNCTION Atualizar_Turmas_Avaliacoes_Stats()
+RETURNS TRIGGER
+LANGUAGE plpgsql
+AS
+$$
+DECLARE
+    delta TEXT;
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        delta := 'SELECT turma_id, pontuacao, 1 AS sinal FROM novas';
+    ELSIF TG_OP = 'DELETE' THEN
+        delta := 'SELECT turma_id, pontuacao, -1 AS sinal FROM antigas';
+    ELSE
+        delta := 'SELECT turma_id, pontuacao, 1 AS sinal FROM novas
+                  UNION ALL
+                  SELECT turma_id, pontuacao, -1 AS sinal FROM antigas';
+    END IF;
+
+    EXECUTE format($sql$
+        INSERT INTO Turmas_Avaliacoes_Stats AS s
+            (turma_id, qtd_avaliacoes, sum_avaliacoes, qtd_1, qtd_2, qtd_3, qtd_4, qtd_5)
+        SELECT turma_id,
+            COALESCE(SUM(sinal) FILTER (WHERE pontuacao IS NOT NULL), 0),
+            COALESCE(SUM(sinal * pontuacao), 0),
+            COALESCE(SUM(sinal) FILTER (WHERE pontuacao = 1), 0),
+            COALESCE(SUM(sinal) FILTER (WHERE pontuacao = 2), 0),
+            COALESCE(SUM(sinal) FILTER (WHERE pontuacao = 3), 0),
+            COALESCE(SUM(sinal) FILTER (WHERE pontuacao = 4), 0),
+            COALESCE(SUM(sinal) FILTER (WHERE pontuacao = 5), 0)
+        FROM (%s) delta
+        WHERE turma_id IS NOT NULL
+        GROUP BY turma_id
+        ON CONFLICT (turma_id) DO UPDATE SET
+            qtd_avaliacoes = s.qtd_avaliacoes + EXCLUDED.qtd_avaliacoes,
+            sum_avaliacoes = s.sum_avaliacoes + EXCLUDED.sum_avaliacoes,
+            qtd_1 = s.qtd_1 + EXCLUDED.qtd_1,
+            qtd_2 = s.qtd_2 + EXCLUDED.qtd_2,
+            qtd_3 = s.qtd_3 + EXCLUDED.qtd_3,
+            qtd_4 = s.qtd_4 + EXCLUDED.qtd_4,
+            qtd_5 = s.qtd_5 + EXCLUDED.qtd_5
+    $sql$, delta);
+
+    RETURN NULL;
+END;
+$$;
+
+CREATE OR REPLACE FUNCTION Limpar_Turmas_Avaliacoes_Stats()
+RETURNS TRIGGER
+LANGUAGE plpgsql
+AS
+$$
+BEGIN
+    DELETE FROM Turmas_Avaliacoes_Stats;
+    RETURN NULL;
+END;
+$$;
+
+-- Reconstrói os agregados do zero a partir de Avaliacoes.
+-- O lock SHARE bloqueia escritas em Avaliacoes enquanto recalcula.
+CREATE OR REPLACE PROCEDURE Recalcular_Turmas_Avaliacoes_Stats()
+LANGUAGE plpgsql
+AS
+$$
+BEGIN
+    LOCK TABLE Avaliacoes IN SHARE MODE;
+    DELETE FROM Turmas_Avaliacoes_Stats;
+    INSERT INTO Turmas_Avaliacoes_Stats
+        (turma_id, qtd_avaliacoes, sum_avaliacoes, qtd_1, qtd_2, qtd_3, qtd_4, qtd_5)
+    SELECT turma_id,
+        COUNT(pontuacao),
+        COALESCE(SUM(pontuacao), 0),
+        COUNT(*) FILTER (WHERE pontuacao = 1),
+        COUNT(*) FILTER (WHERE pontuacao = 2),
+        COUNT(*) FILTER (WHERE pontuacao = 3),
+        COUNT(*) FILTER (WHERE pontuacao = 4),
+        COUNT(*) FILTER (WHERE pontuacao = 5)
+    FROM Avaliacoes
+    WHERE turma_id IS NOT NULL
+    GROUP BY turma_id;
+END;
+$$;
+
+-- Escritas em Avaliacoes esperam até os triggers existirem e os agregados
+-- das avaliações existentes estarem gravados
+LOCK TABLE Avaliacoes IN SHARE ROW EXCLUSIVE MODE;
+
+DROP TRIGGER IF EXISTS Avaliacoes_Stats_Insert ON Avaliacoes;
+CREATE TRIGGER Avaliacoes_Stats_Insert
+    AFTER INSERT ON Avaliacoes
+    REFERENCING NEW TABLE AS novas
+    FOR EACH STATEMENT EXECUTE FUNCTION Atualizar_Turmas_Avaliacoes_Stats();
+
+DROP TRIGGER IF EXISTS Avaliacoes_Stats_Update ON Avaliacoes;
+CREATE TRIGGER Avaliacoes_Stats_Update
+    AFTER UPDATE ON Avaliacoes
+    REFERENCING OLD TABLE AS antigas NEW TABLE AS novas
+    FOR EACH STATEMENT EXECUTE FUNCTION Atualizar_Turmas_Avaliacoes_Stats();
+
+DROP TRIGGER IF EXISTS Avaliacoes_Stats_Delete ON Avaliacoes;
+CREATE TRIGGER Avaliacoes_Stats_Delete
+    AFTER DELETE ON Avaliacoes
+    REFERENCING OLD TABLE AS antigas
+    FOR EACH STATEMENT EXECUTE FUNCTION Atualizar_Turmas_Avaliacoes_Stats();
+
+DROP TRIGGER IF EXISTS Avaliacoes_Stats_Truncate ON Avaliacoes;
+CREATE TRIGGER Avaliacoes_Stats_Truncate
+    AFTER TRUNCATE ON Avaliacoes
+    FOR EACH STATEMENT EXECUTE FUNCTION Limpar_Turmas_Avaliacoes_Stats();
+
+-- Turmas que ainda não têm agregados (todas, num banco vindo do schema inicial)
+INSERT INTO Turmas_Avaliacoes_Stats
+    (turma_id, qtd_avaliacoes, sum_avaliacoes, qtd_1, qtd_2, qtd_3, qtd_4, qtd_5)
+SELECT turma_id,
+    COUNT(pontuacao),
+    COALESCE(SUM(pontuacao), 0),
+    COUNT(*) FILTER (WHERE pontuacao = 1),
+    COUNT(*) FILTER (WHERE pontuacao = 2),
+    COUNT(*) FILTER (WHERE pontuacao = 3),
+    COUNT(*) FILTER (WHERE pontuacao = 4),
+    COUNT(*) FILTER (WHERE pontuacao = 5)
+FROM Avaliacoes
+WHERE turma_id IS NOT NULL
+GROUP BY turma_id
+ON CONFLICT (turma_id) DO NOTHING;
+
+-- As colunas mudam de tipo (COUNT era BIGINT): a view é recriada
+DROP VIEW IF EXISTS Turmas_Avaliacoes_View;
+CREATE VIEW Turmas_Avaliacoes_View AS
+    SELECT Turmas.id as turma_id, Turmas.professor_id, Turmas.disciplina_id, Professores.nome as professor_nome, Disciplinas.nome as disciplina_nome,
+	COALESCE(Stats.qtd_avaliacoes, 0) as qtd_avaliacoes,
+	COALESCE(Stats.sum_avaliacoes, 0) as sum_avaliacoes,
+	ARRAY[
+	    COALESCE(Stats.qtd_1, 0), COALESCE(Stats.qtd_2, 0), COALESCE(Stats.qtd_3, 0),
+	    COALESCE(Stats.qtd_4, 0), COALESCE(Stats.qtd_5, 0)
+	] as histograma
+    FROM Turmas
+    INNER JOIN Professores
+    ON Turmas.professor_id=Professores.id
+    INNER JOIN Disciplinas
+    ON Turmas.disciplina_id=Disciplinas.id
+    LEFT JOIN Turmas_Avaliacoes_Stats as Stats
+    ON Stats.turma_id=Turmas.id
+;
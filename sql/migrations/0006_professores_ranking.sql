@@ -0,0 +1,64 @@
+-- Ranking de professores por média bayesiana, servido pelos endpoints de
+-- leaderboard. É atualizado periodicamente pela aplicação (pysrc/ranking.py)
+-- com REFRESH ... CONCURRENTLY, que exige o índice único em professor_id.
+CREATE MATERIALIZED VIEW IF NOT EXISTS Professores_Ranking AS
+    WITH Professores_Stats AS (
+        SELECT Turmas.professor_id,
+        SUM(Stats.qtd_avaliacoes) as qtd_avaliacoes,
+        SUM(Stats.sum_avaliacoes) as sum_avaliacoes
+        FROM Turmas
+        INNER JOIN Turmas_Avaliacoes_Stats as Stats
+        ON Stats.turma_id=Turmas.id
+        GROUP BY Turmas.professor_id
+    ), Media_Global AS (
+        SELECT COALESCE(SUM(sum_avaliacoes)::numeric / NULLIF(SUM(qtd_avaliacoes), 0), 0) as media
+        FROM Turmas_Avaliacoes_Stats
+    )
+    SELECT Professores.id as professor_id, Professores.nome as professor_nome,
+    Professores.departamento_id, Departamentos.nome as departamento_nome,
+    Professores_Stats.qtd_avaliacoes, Professores_Stats.sum_avaliacoes,
+    Professores_Stats.sum_avaliacoes::numeric / Professores_Stats.qtd_avaliacoes as media,
+    -- média bayesiana com peso de 10 votos na média global: professores com
+    -- poucas avaliações ficam próximos da média em vez de no topo/fundo
+    (10 * Media_Global.media + Professores_Stats.sum_avaliacoes) / (10 + Professores_Stats.qtd_avaliacoes) as score
+    FROM Professores
+    INNER JOIN Professores_Stats
+    ON Professores_Stats.professor_id=Professores.id
+    LEFT JOIN Departamentos
+    ON Professores.departamento_id=Departamentos.id
+    CROSS JOIN Media_Global
+    WHERE Professores_Stats.qtd_avaliacoes > 0
+;
+
+CREATE UNIQUE INDEX IF NOT EXISTS Professores_Ranking_professor_id ON Professores_Ranking (professor_id);
+CREATE INDEX IF NOT EXISTS Professores_Ranking_score ON Professores_Ranking (score DESC, professor_id);
+CREATE INDEX IF NOT EXISTS Professores_Ranking_departamento_score ON Professores_Ranking (departamento_id, score DESC, professor_id);
+
+-- Momento do último refresh de cada materialized view
+CREATE TABLE IF NOT EXISTS Materialized_Views_Refresh (
+    nome VARCHAR,
+    atualizado_em TIMESTAMPTZ NOT NULL,
+
+    PRIMARY KEY(nome)
+);
+
+INSERT INTO Materialized_Views_Refresh (nome, atualizado_em) VALUES ('Professores_Ranking', now())
+ON CONFLICT (nome) DO NOTHING;
+
+CREATE OR REPLACE PROCEDURE Atualizar_Professores_Ranking()
+LANGUAGE plpgsql
+AS
+$$
+BEGIN
+    -- Com vários processos da aplicação, só um atualiza por vez; os outros pulam
+    IF NOT pg_try_advisory_xact_lock(hashtext('Professores_Ranking')) THEN
+        RETURN;
+    END IF;
+
+    REFRESH MATERIALIZED VIEW CONCURRENTLY Professores_Ranking;
+
+    UPDATE Materialized_Views_Refresh
+    SET atualizado_em = now()
+    WHERE nome = 'Professores_Ranking';
+END;
+$$;
@@ -0,0 +1,103 @@
+-- Carimbos de versão usados nos ETags: toda escrita que muda o conteúdo de uma
+-- página pega um valor novo desta sequência (ver Turmas_Avaliacoes_Stats.versao
+-- e Versoes).
+CREATE SEQUENCE IF NOT EXISTS Versoes_Seq;
+
+-- Mudam a cada comando que insere, altera ou remove avaliações da turma
+ALTER TABLE Turmas_Avaliacoes_Stats
+    ADD COLUMN IF NOT EXISTS versao BIGINT NOT NULL DEFAULT nextval('Versoes_Seq'),
+    ADD COLUMN IF NOT EXISTS atualizado_em TIMESTAMPTZ NOT NULL DEFAULT now();
+
+CREATE OR REPLACE FUNCTION Atualizar_Turmas_Avaliacoes_Stats()
+RETURNS TRIGGER
+LANGUAGE plpgsql
+AS
+$$
+DECLARE
+    delta TEXT;
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        delta := 'SELECT turma_id, pontuacao, 1 AS sinal FROM novas';
+    ELSIF TG_OP = 'DELETE' THEN
+        delta := 'SELECT turma_id, pontuacao, -1 AS sinal FROM antigas';
+    ELSE
+        delta := 'SELECT turma_id, pontuacao, 1 AS sinal FROM novas
+                  UNION ALL
+                  SELECT turma_id, pontuacao, -1 AS sinal FROM antigas';
+    END IF;
+
+    EXECUTE format($sql$
+        INSERT INTO Turmas_Avaliacoes_Stats AS s
+            (turma_id, qtd_avaliacoes, sum_avaliacoes, qtd_1, qtd_2, qtd_3, qtd_4, qtd_5)
+        SELECT turma_id,
+            COALESCE(SUM(sinal) FILTER (WHERE pontuacao IS NOT NULL), 0),
+            COALESCE(SUM(sinal * pontuacao), 0),
+            COALESCE(SUM(sinal) FILTER (WHERE pontuacao = 1), 0),
+            COALESCE(SUM(sinal) FILTER (WHERE pontuacao = 2), 0),
+            COALESCE(SUM(sinal) FILTER (WHERE pontuacao = 3), 0),
+            COALESCE(SUM(sinal) FILTER (WHERE pontuacao = 4), 0),
+            COALESCE(SUM(sinal) FILTER (WHERE pontuacao = 5), 0)
+        FROM (%s) delta
+        WHERE turma_id IS NOT NULL
+        GROUP BY turma_id
+        ON CONFLICT (turma_id) DO UPDATE SET
+            qtd_avaliacoes = s.qtd_avaliacoes + EXCLUDED.qtd_avaliacoes,
+            sum_avaliacoes = s.sum_avaliacoes + EXCLUDED.sum_avaliacoes,
+            qtd_1 = s.qtd_1 + EXCLUDED.qtd_1,
+            qtd_2 = s.qtd_2 + EXCLUDED.qtd_2,
+            qtd_3 = s.qtd_3 + EXCLUDED.qtd_3,
+            qtd_4 = s.qtd_4 + EXCLUDED.qtd_4,
+            qtd_5 = s.qtd_5 + EXCLUDED.qtd_5,
+            versao = nextval('Versoes_Seq'),
+            atualizado_em = now()
+    $sql$, delta);
+
+    RETURN NULL;
+END;
+$$;
+
+-- Versão do "catálogo" (departamentos, professores, disciplinas e turmas), que
+-- aparece em todas as páginas e não muda pela aplicação, mas pode ser editado
+-- direto no banco.
+CREATE TABLE IF NOT EXISTS Versoes (
+    nome VARCHAR,
+    versao BIGINT NOT NULL DEFAULT nextval('Versoes_Seq'),
+    atualizado_em TIMESTAMPTZ NOT NULL DEFAULT now(),
+
+    PRIMARY KEY(nome)
+);
+
+INSERT INTO Versoes (nome) VALUES ('catalogo') ON CONFLICT (nome) DO NOTHING;
+
+CREATE OR REPLACE FUNCTION Atualizar_Versao_Catalogo()
+RETURNS TRIGGER
+LANGUAGE plpgsql
+AS
+$$
+BEGIN
+    UPDATE Versoes
+    SET versao = nextval('Versoes_Seq'), atualizado_em = now()
+    WHERE nome = 'catalogo';
+    RETURN NULL;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS Departamentos_Versao ON Departamentos;
+CREATE TRIGGER Departamentos_Versao
+    AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON Departamentos
+    FOR EACH STATEMENT EXECUTE FUNCTION Atualizar_Versao_Catalogo();
+
+DROP TRIGGER IF EXISTS Professores_Versao ON Professores;
+CREATE TRIGGER Professores_Versao
+    AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON Professores
+    FOR EACH STATEMENT EXECUTE FUNCTION Atualizar_Versao_Catalogo();
+
+DROP TRIGGER IF EXISTS Disciplinas_Versao ON Disciplinas;
+CREATE TRIGGER Disciplinas_Versao
+    AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON Disciplinas
+    FOR EACH STATEMENT EXECUTE FUNCTION Atualizar_Versao_Catalogo();
+
+DROP TRIGGER IF EXISTS Turmas_Versao ON Turmas;
+CREATE TRIGGER Turmas_Versao
+    AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON Turmas
+    FOR EACH STATEMENT EXECUTE FUNCTION Atualizar_Versao_Catalogo();
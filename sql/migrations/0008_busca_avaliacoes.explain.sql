@@ -0,0 +1,6 @@
+-- usa: Avaliacoes_comentario_tsv
+SELECT id, ts_rank(comentario_tsv, consulta) as rank
+FROM Avaliacoes, websearch_to_tsquery('portuguese', 'explain 1234') as consulta
+WHERE comentario_tsv @@ consulta
+ORDER BY rank DESC, id DESC
+LIMIT 21;
@@ -0,0 +1,7 @@
+-- Busca textual nos comentários (/api/busca): tsvector com stemming em
+-- português, mantido pelo próprio Postgres como coluna gerada, e índice GIN.
+-- O ALTER reescreve Avaliacoes; em tabelas grandes rode fora do horário de pico.
+ALTER TABLE Avaliacoes ADD COLUMN IF NOT EXISTS comentario_tsv tsvector
+    GENERATED ALWAYS AS (to_tsvector('portuguese', COALESCE(comentario, ''))) STORED;
+
+CREATE INDEX IF NOT EXISTS Avaliacoes_comentario_tsv ON Avaliacoes USING GIN (comentario_tsv);
@@ -0,0 +1,8 @@
+-- usa: Avaliacoes_turma_id_id
+SELECT Semestre_Inicio(criado_em), COUNT(pontuacao), AVG(pontuacao)
+FROM Avaliacoes
+WHERE turma_id = (SELECT MAX(id) FROM Turmas) AND criado_em >= Semestre_Inicio(now())
+GROUP BY 1;
+
+-- usa: Avaliacoes_Ids_pkey
+SELECT criado_em FROM Avaliacoes_Ids WHERE id = ANY(ARRAY[(SELECT MAX(id) FROM Avaliacoes) - 10]);
@@ -0,0 +1,305 @@
+-- Avaliacoes particionada por semestre (RANGE em criado_em): as consultas com
+-- período (tendências por semestre) leem só as partições do período, e
+-- semestres antigos saem da tabela com DETACH, sem DELETE (ver
+-- Arquivar_Particao_Avaliacoes e pysrc/particoes.py).
+-- Reescreve Avaliacoes inteira; em tabelas grandes rode fora do horário de pico.
+-- As avaliações já existentes não têm data, e nada nas turmas diz o semestre:
+-- ficam com criado_em = '-infinity' na partição Avaliacoes_Legado, que não
+-- entra nas tendências (o filtro de período já a deixa de fora) nem no
+-- arquivamento, e continua contando nos agregados das turmas.
+
+-- Semestres em UTC: janeiro a junho e julho a dezembro
+CREATE OR REPLACE FUNCTION Semestre_Inicio(t TIMESTAMPTZ)
+RETURNS TIMESTAMPTZ
+LANGUAGE sql
+IMMUTABLE PARALLEL SAFE
+AS
+$$
+    SELECT make_timestamptz(
+        extract(year FROM t AT TIME ZONE 'UTC')::int,
+        CASE WHEN extract(month FROM t AT TIME ZONE 'UTC') < 7 THEN 1 ELSE 7 END,
+        1, 0, 0, 0, 'UTC'
+    )
+$$;
+
+-- Cria as partições (avaliacoes_<ano>_<1|2>) que ainda não existem para os
+-- semestres de "de" até "ate" e devolve o nome das criadas. Chamada pela
+-- aplicação para manter partições dos próximos semestres (pysrc/particoes.py):
+-- não há partição padrão, e uma avaliação sem partição é recusada.
+CREATE OR REPLACE FUNCTION Criar_Particoes_Avaliacoes(de TIMESTAMPTZ, ate TIMESTAMPTZ)
+RETURNS SETOF TEXT
+LANGUAGE plpgsql
+AS
+$$
+DECLARE
+    inicio TIMESTAMPTZ := Semestre_Inicio(de);
+    fim TIMESTAMPTZ;
+    nome TEXT;
+BEGIN
+    WHILE inicio <= ate LOOP
+        fim := ((inicio AT TIME ZONE 'UTC') + interval '6 months') AT TIME ZONE 'UTC';
+        nome := format(
+            'avaliacoes_%s_%s',
+            extract(year FROM inicio AT TIME ZONE 'UTC'),
+            CASE WHEN extract(month FROM inicio AT TIME ZONE 'UTC') = 1 THEN 1 ELSE 2 END
+        );
+        IF to_regclass(nome) IS NULL THEN
+            EXECUTE format(
+                'CREATE TABLE %I PARTITION OF Avaliacoes FOR VALUES FROM (%L) TO (%L)', nome, inicio, fim
+            );
+            RETURN NEXT nome;
+        END IF;
+        inicio := fim;
+    END LOOP;
+END;
+$$;
+
+ALTER TABLE Denuncias DROP CONSTRAINT fk_avaliacao;
+ALTER TABLE Avaliacoes RENAME TO Avaliacoes_Antiga;
+ALTER TABLE Avaliacoes_Antiga RENAME CONSTRAINT avaliacoes_pkey TO avaliacoes_antiga_pkey;
+DROP INDEX Avaliacoes_turma_id_id;
+DROP INDEX Avaliacoes_comentario_tsv;
+-- A sequência dos ids continua a mesma (models.add_avaliacoes usa o nome)
+ALTER SEQUENCE Avaliacoes_id_seq OWNED BY NONE;
+
+-- A chave de partição tem que fazer parte da chave primária; a unicidade do
+-- id fica com Avaliacoes_Ids, abaixo
+CREATE TABLE Avaliacoes (
+    id INT NOT NULL DEFAULT nextval('Avaliacoes_id_seq'),
+    pontuacao INT,
+    comentario TEXT,
+    user_id INT,
+    turma_id INT,
+    criado_em TIMESTAMPTZ NOT NULL DEFAULT now(),
+    comentario_tsv tsvector
+        GENERATED ALWAYS AS (to_tsvector('portuguese', COALESCE(comentario, ''))) STORED,
+
+    PRIMARY KEY(id, criado_em),
+    CONSTRAINT fk_user
+      FOREIGN KEY(user_id)
+	  REFERENCES Users(id),
+    CONSTRAINT fk_turma
+      FOREIGN KEY(turma_id)
+	  REFERENCES Turmas(id)
+) PARTITION BY RANGE (criado_em);
+
+SELECT Criar_Particoes_Avaliacoes(now(), now() + interval '1 year');
+
+-- Só as avaliações anteriores a esta migration, sem data (o limite superior
+-- só existe porque MINVALUE a MINVALUE seria vazio)
+CREATE TABLE Avaliacoes_Legado PARTITION OF Avaliacoes
+    (CONSTRAINT legado_sem_data CHECK (criado_em = '-infinity'))
+    FOR VALUES FROM (MINVALUE) TO ('1970-01-01 00:00:00+00');
+
+-- Sem os triggers ainda: os agregados de Turmas_Avaliacoes_Stats já contam
+-- estas avaliações
+INSERT INTO Avaliacoes (id, pontuacao, comentario, user_id, turma_id, criado_em)
+SELECT id, pontuacao, comentario, user_id, turma_id, '-infinity'
+FROM Avaliacoes_Antiga;
+
+DROP TABLE Avaliacoes_Antiga;
+ALTER SEQUENCE Avaliacoes_id_seq OWNED BY Avaliacoes.id;
+
+-- Criados na tabela particionada, valem para cada partição (atual e futuras)
+CREATE INDEX Avaliacoes_turma_id_id ON Avaliacoes (turma_id, id);
+CREATE INDEX Avaliacoes_comentario_tsv ON Avaliacoes USING GIN (comentario_tsv);
+
+-- id -> criado_em de cada avaliação em Avaliacoes, mantida pelos triggers
+-- abaixo. A chave primária daqui é o que mantém o id único entre as partições
+-- (os ids vêm todos de Avaliacoes_id_seq; um id repetido em outro semestre é
+-- recusado), e as consultas por id (models.delete_comment, moderar) leem daqui
+-- a data para que só a partição da avaliação seja lida.
+CREATE TABLE Avaliacoes_Ids (
+    id INT,
+    criado_em TIMESTAMPTZ NOT NULL,
+
+    PRIMARY KEY(id)
+);
+
+INSERT INTO Avaliacoes_Ids (id, criado_em)
+SELECT id, criado_em FROM Avaliacoes;
+
+CREATE OR REPLACE FUNCTION Atualizar_Avaliacoes_Ids()
+RETURNS TRIGGER
+LANGUAGE plpgsql
+AS
+$$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        INSERT INTO Avaliacoes_Ids (id, criado_em) SELECT id, criado_em FROM novas;
+    ELSIF TG_OP = 'DELETE' THEN
+        DELETE FROM Avaliacoes_Ids WHERE id IN (SELECT id FROM antigas);
+    ELSE
+        -- Só as linhas em que id ou criado_em mudou
+        DELETE FROM Avaliacoes_Ids WHERE (id, criado_em) IN (
+            SELECT id, criado_em FROM antigas EXCEPT SELECT id, criado_em FROM novas
+        );
+        INSERT INTO Avaliacoes_Ids (id, criado_em)
+        SELECT id, criado_em FROM novas EXCEPT SELECT id, criado_em FROM antigas;
+    END IF;
+    RETURN NULL;
+END;
+$$;
+
+CREATE OR REPLACE FUNCTION Limpar_Avaliacoes_Ids()
+RETURNS TRIGGER
+LANGUAGE plpgsql
+AS
+$$
+BEGIN
+    DELETE FROM Avaliacoes_Ids;
+    RETURN NULL;
+END;
+$$;
+
+CREATE TRIGGER Avaliacoes_Ids_Insert
+    AFTER INSERT ON Avaliacoes
+    REFERENCING NEW TABLE AS novas
+    FOR EACH STATEMENT EXECUTE FUNCTION Atualizar_Avaliacoes_Ids();
+
+CREATE TRIGGER Avaliacoes_Ids_Update
+    AFTER UPDATE ON Avaliacoes
+    REFERENCING OLD TABLE AS antigas NEW TABLE AS novas
+    FOR EACH STATEMENT EXECUTE FUNCTION Atualizar_Avaliacoes_Ids();
+
+CREATE TRIGGER Avaliacoes_Ids_Delete
+    AFTER DELETE ON Avaliacoes
+    REFERENCING OLD TABLE AS antigas
+    FOR EACH STATEMENT EXECUTE FUNCTION Atualizar_Avaliacoes_Ids();
+
+CREATE TRIGGER Avaliacoes_Ids_Truncate
+    AFTER TRUNCATE ON Avaliacoes
+    FOR EACH STATEMENT EXECUTE FUNCTION Limpar_Avaliacoes_Ids();
+
+CREATE TRIGGER Avaliacoes_Stats_Insert
+    AFTER INSERT ON Avaliacoes
+    REFERENCING NEW TABLE AS novas
+    FOR EACH STATEMENT EXECUTE FUNCTION Atualizar_Turmas_Avaliacoes_Stats();
+
+CREATE TRIGGER Avaliacoes_Stats_Update
+    AFTER UPDATE ON Avaliacoes
+    REFERENCING OLD TABLE AS antigas NEW TABLE AS novas
+    FOR EACH STATEMENT EXECUTE FUNCTION Atualizar_Turmas_Avaliacoes_Stats();
+
+CREATE TRIGGER Avaliacoes_Stats_Delete
+    AFTER DELETE ON Avaliacoes
+    REFERENCING OLD TABLE AS antigas
+    FOR EACH STATEMENT EXECUTE FUNCTION Atualizar_Turmas_Avaliacoes_Stats();
+
+CREATE TRIGGER Avaliacoes_Stats_Truncate
+    AFTER TRUNCATE ON Avaliacoes
+    FOR EACH STATEMENT EXECUTE FUNCTION Limpar_Turmas_Avaliacoes_Stats();
+
+-- A FK de Denuncias precisa da chave inteira (id, criado_em). Quem insere
+-- denúncias continua informando só avaliacao_id: o trigger completa a data.
+ALTER TABLE Denuncias ADD COLUMN avaliacao_criado_em TIMESTAMPTZ;
+
+UPDATE Denuncias
+SET avaliacao_criado_em = Avaliacoes_Ids.criado_em
+FROM Avaliacoes_Ids
+WHERE Avaliacoes_Ids.id = Denuncias.avaliacao_id;
+
+ALTER TABLE Denuncias ADD CONSTRAINT fk_avaliacao
+    FOREIGN KEY(avaliacao_id, avaliacao_criado_em)
+    REFERENCES Avaliacoes(id, criado_em);
+
+CREATE OR REPLACE FUNCTION Completar_Denuncia_Avaliacao()
+RETURNS TRIGGER
+LANGUAGE plpgsql
+AS
+$$
+BEGIN
+    IF TG_OP = 'UPDATE' AND NEW.avaliacao_id IS DISTINCT FROM OLD.avaliacao_id THEN
+        NEW.avaliacao_criado_em := NULL;
+    END IF;
+    IF NEW.avaliacao_id IS NOT NULL AND NEW.avaliacao_criado_em IS NULL THEN
+        SELECT criado_em INTO NEW.avaliacao_criado_em FROM Avaliacoes_Ids WHERE id = NEW.avaliacao_id;
+        -- Com a coluna nula a FK não seria conferida
+        IF NOT FOUND THEN
+            RAISE foreign_key_violation USING MESSAGE = format('avaliação %s não existe', NEW.avaliacao_id);
+        END IF;
+    END IF;
+    RETURN NEW;
+END;
+$$;
+
+CREATE TRIGGER Denuncias_Avaliacao
+    BEFORE INSERT OR UPDATE OF avaliacao_id ON Denuncias
+    FOR EACH ROW EXECUTE FUNCTION Completar_Denuncia_Avaliacao();
+
+-- Semestres arquivados: a partição sai de Avaliacoes (DETACH) e vai, com as
+-- denúncias das suas avaliações, para o schema Arquivo, onde continua
+-- consultável e pode ser exportada e removida com DROP TABLE.
+CREATE SCHEMA IF NOT EXISTS Arquivo;
+CREATE TABLE IF NOT EXISTS Arquivo.Denuncias (LIKE Denuncias);
+
+-- Arquiva uma partição e devolve quantas avaliações saíram. Os agregados de
+-- Turmas_Avaliacoes_Stats passam a contar só as avaliações que ficaram (como
+-- se tivessem sido excluídas). O lock SHARE bloqueia escritas em Avaliacoes
+-- enquanto a partição é lida, para que nenhuma escrita fique de fora do ajuste.
+CREATE OR REPLACE FUNCTION Arquivar_Particao_Avaliacoes(particao REGCLASS)
+RETURNS BIGINT
+LANGUAGE plpgsql
+AS
+$$
+DECLARE
+    qtd BIGINT;
+    nome TEXT;
+BEGIN
+    LOCK TABLE Avaliacoes IN SHARE MODE;
+
+    EXECUTE format($sql$
+        WITH Movidas AS (
+            DELETE FROM Denuncias
+            WHERE (avaliacao_id, avaliacao_criado_em) IN (SELECT id, criado_em FROM %s)
+            RETURNING *
+        )
+        INSERT INTO Arquivo.Denuncias SELECT * FROM Movidas
+    $sql$, particao);
+
+    EXECUTE format($sql$
+        WITH Delta AS (
+            SELECT turma_id,
+                COUNT(pontuacao) as qtd,
+                COALESCE(SUM(pontuacao), 0) as soma,
+                COUNT(*) FILTER (WHERE pontuacao = 1) as qtd_1,
+                COUNT(*) FILTER (WHERE pontuacao = 2) as qtd_2,
+                COUNT(*) FILTER (WHERE pontuacao = 3) as qtd_3,
+                COUNT(*) FILTER (WHERE pontuacao = 4) as qtd_4,
+                COUNT(*) FILTER (WHERE pontuacao = 5) as qtd_5,
+                COUNT(*) as linhas
+            FROM %s
+            GROUP BY turma_id
+        ), Ajuste AS (
+            UPDATE Turmas_Avaliacoes_Stats as s SET
+                qtd_avaliacoes = s.qtd_avaliacoes - Delta.qtd,
+                sum_avaliacoes = s.sum_avaliacoes - Delta.soma,
+                qtd_1 = s.qtd_1 - Delta.qtd_1,
+                qtd_2 = s.qtd_2 - Delta.qtd_2,
+                qtd_3 = s.qtd_3 - Delta.qtd_3,
+                qtd_4 = s.qtd_4 - Delta.qtd_4,
+                qtd_5 = s.qtd_5 - Delta.qtd_5,
+                versao = nextval('Versoes_Seq'),
+                atualizado_em = now()
+            FROM Delta
+            WHERE s.turma_id = Delta.turma_id
+        )
+        SELECT COALESCE(SUM(linhas), 0) FROM Delta
+    $sql$, particao) INTO qtd;
+
+    EXECUTE format('DELETE FROM Avaliacoes_Ids WHERE id IN (SELECT id FROM %s)', particao);
+    EXECUTE format('ALTER TABLE Avaliacoes DETACH PARTITION %s', particao);
+    nome := (SELECT relname FROM pg_class WHERE oid = particao);
+    IF to_regclass(format('Arquivo.%I', nome)) IS NULL THEN
+        EXECUTE format('ALTER TABLE %s SET SCHEMA Arquivo', particao);
+    ELSE
+        -- Semestre já arquivado antes (a partição foi criada de novo)
+        EXECUTE format($sql$
+            INSERT INTO Arquivo.%I (id, pontuacao, comentario, user_id, turma_id, criado_em)
+            SELECT id, pontuacao, comentario, user_id, turma_id, criado_em FROM %s
+        $sql$, nome, particao);
+        EXECUTE format('DROP TABLE %s', particao);
+    END IF;
+    RETURN qtd;
+END;
+$$;
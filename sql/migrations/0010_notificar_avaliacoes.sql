@@ -0,0 +1,81 @@
+-- Atualizações ao vivo das páginas de turma (pysrc/eventos.py): a cada comando
+-- em Avaliacoes, um NOTIFY no canal "avaliacoes" por turma afetada, com os ids
+-- inseridos, alterados ou removidos, e o professor e a disciplina da turma
+-- (para invalidar o cache de leitura dos outros processos). O NOTIFY só é entregue no COMMIT, então
+-- quem recebe já enxerga a escrita.
+-- O payload de um NOTIFY tem limite de 8000 bytes: acima de
+-- NOTIFICAR_MAX_IDS linhas de uma turma no mesmo comando (importações) vai
+-- "ids": null, e as páginas abertas da turma recarregam.
+-- Num UPDATE, uma avaliação que mudou de turma sai da antiga ("removidas") e
+-- entra na nova ("inseridas"); as outras são "alteradas" na própria turma.
+CREATE OR REPLACE FUNCTION Notificar_Avaliacoes()
+RETURNS TRIGGER
+LANGUAGE plpgsql
+AS
+$$
+DECLARE
+    NOTIFICAR_MAX_IDS CONSTANT INT := 200;
+BEGIN
+    IF TG_OP = 'UPDATE' THEN
+        PERFORM pg_notify('avaliacoes', json_build_object(
+            'turma_id', Mudancas.turma_id,
+            'professor_id', Turmas.professor_id,
+            'disciplina_id', Turmas.disciplina_id,
+            'op', op,
+            'ids', CASE WHEN COUNT(*) <= NOTIFICAR_MAX_IDS THEN array_agg(Mudancas.id ORDER BY Mudancas.id) END
+        )::text)
+        FROM (
+            SELECT novas.turma_id, novas.id,
+            CASE WHEN antigas.turma_id IS NOT DISTINCT FROM novas.turma_id THEN 'alteradas' ELSE 'inseridas' END as op
+            FROM novas
+            LEFT JOIN antigas ON antigas.id = novas.id
+            UNION ALL
+            SELECT antigas.turma_id, antigas.id, 'removidas'
+            FROM antigas
+            LEFT JOIN novas ON novas.id = antigas.id
+            WHERE novas.id IS NULL OR novas.turma_id IS DISTINCT FROM antigas.turma_id
+        ) as Mudancas
+        LEFT JOIN Turmas ON Turmas.id = Mudancas.turma_id
+        WHERE Mudancas.turma_id IS NOT NULL
+        GROUP BY Mudancas.turma_id, Turmas.professor_id, Turmas.disciplina_id, op;
+        RETURN NULL;
+    END IF;
+
+    EXECUTE format($sql$
+        SELECT pg_notify('avaliacoes', json_build_object(
+            'turma_id', Linhas.turma_id,
+            'professor_id', Turmas.professor_id,
+            'disciplina_id', Turmas.disciplina_id,
+            'op', %L,
+            'ids', CASE WHEN COUNT(*) <= %s THEN array_agg(Linhas.id ORDER BY Linhas.id) END
+        )::text)
+        FROM %I as Linhas
+        LEFT JOIN Turmas ON Turmas.id = Linhas.turma_id
+        WHERE Linhas.turma_id IS NOT NULL
+        GROUP BY Linhas.turma_id, Turmas.professor_id, Turmas.disciplina_id
+    $sql$,
+        CASE TG_OP WHEN 'INSERT' THEN 'inseridas' ELSE 'removidas' END,
+        NOTIFICAR_MAX_IDS,
+        CASE TG_OP WHEN 'INSERT' THEN 'novas' ELSE 'antigas' END
+    );
+    RETURN NULL;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS Avaliacoes_Notificar_Insert ON Avaliacoes;
+CREATE TRIGGER Avaliacoes_Notificar_Insert
+    AFTER INSERT ON Avaliacoes
+    REFERENCING NEW TABLE AS novas
+    FOR EACH STATEMENT EXECUTE FUNCTION Notificar_Avaliacoes();
+
+DROP TRIGGER IF EXISTS Avaliacoes_Notificar_Update ON Avaliacoes;
+CREATE TRIGGER Avaliacoes_Notificar_Update
+    AFTER UPDATE ON Avaliacoes
+    REFERENCING OLD TABLE AS antigas NEW TABLE AS novas
+    FOR EACH STATEMENT EXECUTE FUNCTION Notificar_Avaliacoes();
+
+DROP TRIGGER IF EXISTS Avaliacoes_Notificar_Delete ON Avaliacoes;
+CREATE TRIGGER Avaliacoes_Notificar_Delete
+    AFTER DELETE ON Avaliacoes
+    REFERENCING OLD TABLE AS antigas
+    FOR EACH STATEMENT EXECUTE FUNCTION Notificar_Avaliacoes();
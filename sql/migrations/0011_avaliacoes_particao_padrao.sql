@@ -0,0 +1,68 @@
+-- Partição padrão de Avaliacoes: se as partições de um semestre não forem
+-- criadas a tempo (agendador de pysrc/particoes.py parado, importação de um
+-- semestre antigo), as avaliações vão para Avaliacoes_Padrao em vez de serem
+-- recusadas. Ao criar a partição do semestre, Criar_Particoes_Avaliacoes move
+-- para ela as linhas do período que estavam na padrão.
+CREATE TABLE IF NOT EXISTS Avaliacoes_Padrao PARTITION OF Avaliacoes DEFAULT;
+
+-- Mover uma avaliação de partição é apagar e inserir: durante a mudança a FK
+-- de Denuncias é adiada até a linha estar na partição nova (só dentro de
+-- Criar_Particoes_Avaliacoes; fora dela continua conferida a cada comando)
+ALTER TABLE Denuncias ALTER CONSTRAINT fk_avaliacao DEFERRABLE INITIALLY IMMEDIATE;
+
+CREATE OR REPLACE FUNCTION Criar_Particoes_Avaliacoes(de TIMESTAMPTZ, ate TIMESTAMPTZ)
+RETURNS SETOF TEXT
+LANGUAGE plpgsql
+AS
+$$
+DECLARE
+    inicio TIMESTAMPTZ := Semestre_Inicio(de);
+    fim TIMESTAMPTZ;
+    nome TEXT;
+BEGIN
+    WHILE inicio <= ate LOOP
+        fim := ((inicio AT TIME ZONE 'UTC') + interval '6 months') AT TIME ZONE 'UTC';
+        nome := format(
+            'avaliacoes_%s_%s',
+            extract(year FROM inicio AT TIME ZONE 'UTC'),
+            CASE WHEN extract(month FROM inicio AT TIME ZONE 'UTC') = 1 THEN 1 ELSE 2 END
+        );
+        IF to_regclass(nome) IS NULL THEN
+            -- O ATTACH também pegaria este lock; antes do EXISTS, nenhuma
+            -- linha do período entra na padrão depois de conferida
+            LOCK TABLE Avaliacoes_Padrao IN ACCESS EXCLUSIVE MODE;
+            IF EXISTS (SELECT 1 FROM Avaliacoes_Padrao WHERE criado_em >= inicio AND criado_em < fim) THEN
+                -- A partição nasce fora de Avaliacoes, recebe as linhas e só
+                -- então é anexada (o ATTACH confere que a padrão não tem mais
+                -- linhas do período). Comandos direto nas partições não
+                -- disparam os triggers FOR EACH STATEMENT de Avaliacoes: as
+                -- avaliações são as mesmas (id e criado_em também), e
+                -- agregados, Avaliacoes_Ids e NOTIFYs não mudam.
+                SET CONSTRAINTS fk_avaliacao DEFERRED;
+                EXECUTE format('CREATE TABLE %I (LIKE Avaliacoes INCLUDING DEFAULTS INCLUDING GENERATED)', nome);
+                EXECUTE format($sql$
+                    WITH Movidas AS (
+                        DELETE FROM Avaliacoes_Padrao
+                        WHERE criado_em >= %L AND criado_em < %L
+                        RETURNING id, pontuacao, comentario, user_id, turma_id, criado_em
+                    )
+                    INSERT INTO %I (id, pontuacao, comentario, user_id, turma_id, criado_em)
+                    SELECT id, pontuacao, comentario, user_id, turma_id, criado_em FROM Movidas
+                $sql$, inicio, fim, nome);
+                EXECUTE format(
+                    'ALTER TABLE Avaliacoes ATTACH PARTITION %I FOR VALUES FROM (%L) TO (%L)', nome, inicio, fim
+                );
+                -- Confere as denúncias das linhas movidas aqui mesmo e devolve
+                -- a FK ao modo declarado, sem mudar a transação de quem chamou
+                SET CONSTRAINTS fk_avaliacao IMMEDIATE;
+            ELSE
+                EXECUTE format(
+                    'CREATE TABLE %I PARTITION OF Avaliacoes FOR VALUES FROM (%L) TO (%L)', nome, inicio, fim
+                );
+            END IF;
+            RETURN NEXT nome;
+        END IF;
+        inicio := fim;
+    END LOOP;
+END;
+$$;
@@ -11,7 +11,7 @@ VALUES
     ('Luan Lemos', (SELECT id FROM Departamentos WHERE nome='CIC')),
     ('Rodrigo José', (SELECT id FROM Departamentos WHERE nome='CIC'));
 
-INSERT INTO Disciplinas (id, nome, departamento_id)
+INSERT INTO Disciplinas (nome, departamento_id)
 VALUES
     ('Programação Competitiva', (SELECT id FROM Departamentos WHERE nome='CIC')),
     ('Linguagens de Programação', (SELECT id FROM Departamentos WHERE nome='CIC')),
@@ -0,0 +1,111 @@
+import asyncio
+import os
+import sys
+from contextlib import asynccontextmanager
+from types import SimpleNamespace
+
+import psycopg
+import pytest
+from psycopg.pq import PipelineStatus
+
+# index.py e pysrc/ ficam na raiz do repositório
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pysrc import connection
+from pysrc import migrations
+
+# Dados mínimos além de sql/seed.sql: um usuário e algumas avaliações
+DADOS = """
+INSERT INTO Users (email, nome, matricula, curso, senha, is_admin)
+VALUES ('testes@example.com', 'testes', '0', 'testes', 'testes', false);
+
+INSERT INTO Avaliacoes (pontuacao, comentario, user_id, turma_id)
+SELECT g % 5 + 1, 'comentário de teste ' || g, (SELECT MIN(id) FROM Users), (SELECT MIN(id) FROM Turmas)
+FROM generate_series(1, 60) g;
+"""
+
+
+class CursorFalso:
+    # Cursor que só registra os comandos e devolve as linhas de `respostas`
+    def __init__(self, conn):
+        self.conn = self.connection = conn
+        self.adapters = self
+        self.linhas = []
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    def register_loader(self, *args):
+        pass
+
+    async def execute(self, sql, params=(), prepare=None):
+        self.conn.comandos.append((" ".join(sql.split()), list(params)))
+        self.linhas = list(self.conn.respostas.pop(0)) if self.conn.respostas else []
+
+    async def fetchone(self):
+        return self.linhas[0] if self.linhas else None
+
+    async def fetchall(self):
+        return self.linhas
+
+
+class ConexaoFalsa:
+    def __init__(self, respostas=()):
+        self.comandos = []
+        self.respostas = list(respostas)
+        self.pgconn = SimpleNamespace(pipeline_status=PipelineStatus.OFF)
+
+    @asynccontextmanager
+    async def pipeline(self):
+        yield self
+
+    def cursor(self, *args, **kwargs):
+        return CursorFalso(self)
+
+
+async def _preparar_banco():
+    async with connection.connect() as conn:
+        await migrations.aplicar(conn)
+        async with conn.cursor() as curr:
+            with open(os.path.join(migrations.SQL_DIR, "seed.sql"), encoding="utf-8") as f:
+                await curr.execute(f.read())
+            await curr.execute(DADOS)
+
+
+@pytest.fixture(scope="session")
+def banco():
+    # O banco das variáveis POSTGRES_* (pysrc/connection.py), num schema só dos
+    # testes (search_path via PGOPTIONS), com as migrations e sql/seed.sql, e
+    # apagado no final. Sem banco acessível os testes que o usam são pulados.
+    try:
+        admin = psycopg.connect(connection.get_conninfo(), autocommit=True, connect_timeout=2)
+    except psycopg.OperationalError as e:
+        pytest.skip(f"sem banco para os testes: {e}")
+
+    schema = f"testes_{os.getpid()}"
+    opcoes = os.environ.get("PGOPTIONS")
+    with admin:
+        admin.execute(f"CREATE SCHEMA {schema}")
+        os.environ["PGOPTIONS"] = f"-c search_path={schema}"
+        try:
+            asyncio.run(_preparar_banco())
+            yield schema
+        finally:
+            if opcoes is None:
+                os.environ.pop("PGOPTIONS", None)
+            else:
+                os.environ["PGOPTIONS"] = opcoes
+            admin.execute(f"DROP SCHEMA {schema} CASCADE")
+
+
+@pytest.fixture
+def client():
+    from fastapi.testclient import TestClient
+    from index import app
+
+    # Sem o lifespan: nada de pool nem tarefas em segundo plano
+    yield TestClient(app)
+    app.dependency_overrides.clear()
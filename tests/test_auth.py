@@ -0,0 +1,60 @@
+import pytest
+from fastapi import HTTPException, Request
+
+from pysrc import auth
+
+
+def _request(sessao):
+    return Request({"type": "http", "headers": [], "sessao": sessao})
+
+
+def test_token_emitido_e_verificado():
+    token, sessao = auth.emitir(7, True)
+
+    assert auth.verificar(token) == sessao
+    assert sessao.user_id == 7 and sessao.is_admin is True
+
+
+def test_token_alterado_e_recusado():
+    token, _ = auth.emitir(7, False)
+    user_id, is_admin, expira_em, assinatura = token.split(".")
+
+    # Virar admin sem a chave
+    assert auth.verificar(f"{user_id}.1.{expira_em}.{assinatura}") is None
+    # Assinatura trocada
+    outra = "A" if assinatura[0] != "A" else "B"
+    assert auth.verificar(f"{user_id}.{is_admin}.{expira_em}.{outra}{assinatura[1:]}") is None
+    # Malformados
+    assert auth.verificar("") is None
+    assert auth.verificar("7.0") is None
+    assert auth.verificar(f"{user_id}.{is_admin}.{assinatura}") is None
+
+
+def test_token_expirado_e_recusado(monkeypatch):
+    token, sessao = auth.emitir(7, False)
+
+    monkeypatch.setattr(auth.time, "time", lambda: sessao.expira_em + 1)
+    assert auth.verificar(token) is None
+
+
+def test_exigir_admin():
+    with pytest.raises(HTTPException) as e:
+        auth.exigir_admin(_request(None))
+    assert e.value.status_code == 401
+
+    _, sessao = auth.emitir(7, False)
+    with pytest.raises(HTTPException) as e:
+        auth.exigir_admin(_request(sessao))
+    assert e.value.status_code == 403
+
+    _, sessao = auth.emitir(7, True)
+    assert auth.exigir_admin(_request(sessao)) == sessao
+
+
+def test_middleware_le_o_bearer_antes_do_cookie():
+    token, sessao = auth.emitir(7, False)
+    outro, _ = auth.emitir(8, False)
+    headers = [(b"cookie", f"{auth.COOKIE}={outro}".encode()), (b"authorization", f"Bearer {token}".encode())]
+
+    assert auth.verificar(auth._token(headers)) == sessao
+    assert auth.verificar(auth._token(headers[:1])).user_id == 8
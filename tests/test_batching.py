@@ -0,0 +1,56 @@
+import asyncio
+from contextlib import asynccontextmanager
+
+import psycopg
+import pytest
+
+from pysrc import batching
+from pysrc import connection
+from pysrc import models
+
+
+def test_lote_com_item_invalido_regrava_so_as_partes_que_falharam(monkeypatch):
+    # Turma 0 não existe: o INSERT de qualquer grupo com ela falha inteiro
+    comandos = []
+
+    async def add_avaliacoes(conn, itens, synchronous_commit=True):
+        comandos.append(len(itens))
+        if any(turma_id == 0 for turma_id, _ in itens):
+            raise psycopg.errors.ForeignKeyViolation("turma inexistente")
+        return [
+            models.Avaliacao(id=turma_id, user_id=a.user_id, user_nome="", comentario=a.comentario, pontuacao=a.pontuacao)
+            for turma_id, a in itens
+        ]
+
+    @asynccontextmanager
+    async def connect(leitura=False):
+        yield None
+
+    monkeypatch.setattr(models, "add_avaliacoes", add_avaliacoes)
+    monkeypatch.setattr(connection, "connect", connect)
+
+    async def rodar():
+        lotes = batching.Lotes(64, 0.01, 100, 1, True)
+        lotes.start()
+        avaliacao = models.AvaliacaoIn(user_id=1, comentario="ok", pontuacao=5)
+        turmas = list(range(1, 64)) + [0]
+        resultados = await asyncio.gather(
+            *(lotes.add_avaliacao(turma_id, avaliacao) for turma_id in turmas), return_exceptions=True
+        )
+        await lotes.stop()
+        return turmas, resultados
+
+    turmas, resultados = asyncio.run(rodar())
+    for turma_id, resultado in zip(turmas, resultados):
+        if turma_id == 0:
+            assert isinstance(resultado, psycopg.errors.ForeignKeyViolation)
+        else:
+            assert resultado.id == turma_id
+    # Um lote de 64: o inteiro, e duas metades por nível até isolar o item
+    assert comandos[0] == 64
+    assert len(comandos) <= 1 + 2 * 6
+
+
+def test_avaliacao_com_nul_e_recusada_antes_do_lote():
+    with pytest.raises(ValueError):
+        models.AvaliacaoIn(user_id=1, comentario="a\x00b", pontuacao=3)
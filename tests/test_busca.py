@@ -0,0 +1,36 @@
+import asyncio
+
+from pysrc import models
+
+from conftest import ConexaoFalsa
+
+_VERSAO = [("1.1", None)]
+
+
+def _buscar(conn, **kwargs):
+    return asyncio.run(models.buscar_avaliacoes(conn, "professor", **kwargs))[1]
+
+
+def test_busca_exata_por_padrao(monkeypatch):
+    monkeypatch.setattr(models, "BUSCA_JANELA", 0)
+    monkeypatch.setattr(models, "BUSCA_MAX_CANDIDATOS", 0)
+    conn = ConexaoFalsa([_VERSAO, [(False, *[None] * 10)]])
+
+    resultado = _buscar(conn)
+    sql, _ = conn.comandos[-1]
+    assert "Janela)" not in sql and "max_candidatos" not in sql
+    assert resultado.resultados == [] and not resultado.limitado
+
+
+def test_limitado_numa_pagina_vazia(monkeypatch):
+    # Os limites cortaram ocorrências, mas nenhuma sobrou para esta página:
+    # a linha de Resumo ainda diz que a busca foi limitada
+    monkeypatch.setattr(models, "BUSCA_JANELA", 1000)
+    monkeypatch.setattr(models, "BUSCA_MAX_CANDIDATOS", 10)
+    conn = ConexaoFalsa([_VERSAO, [(True, *[None] * 10)]])
+
+    resultado = _buscar(conn, before_rank=0.1, before_id=5)
+    sql, _ = conn.comandos[-1]
+    assert "(SELECT COUNT(*) FROM Candidatos) > %(max_candidatos)s" in sql
+    assert "(SELECT primeiro_id <= id_minimo FROM Janela)" in sql
+    assert resultado.resultados == [] and resultado.limitado
@@ -0,0 +1,18 @@
+from pysrc import http_cache
+from pysrc.models import Versao
+
+VERSAO = Versao(versao="7", atualizado_em=None)
+
+
+def test_parametros_mudam_o_etag():
+    primeira = http_cache.headers(VERSAO, "turma", 1, None, 50)["ETag"]
+    assert http_cache.headers(VERSAO, "turma", 1, 900, 50)["ETag"] != primeira
+    assert http_cache.headers(VERSAO, "turma", 1, None, 10)["ETag"] != primeira
+    assert http_cache.headers(VERSAO, "turma", 1, None, "stream")["ETag"] != primeira
+
+
+def test_texto_livre_vira_hash_no_etag():
+    etag = http_cache.headers(VERSAO, "busca", 'prova "difícil" -fácil', None, 20)["ETag"]
+    assert etag.startswith('"busca-') and etag.endswith('"')
+    assert '"' not in etag[1:-1] and etag.isascii() and " " not in etag
+    assert etag != http_cache.headers(VERSAO, "busca", "prova", None, 20)["ETag"]
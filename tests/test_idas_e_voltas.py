@@ -0,0 +1,155 @@
+import re
+import socket
+import threading
+
+import psycopg
+import pytest
+from psycopg.conninfo import conninfo_to_dict
+
+from pysrc import auth
+from pysrc import connection
+
+_IDAS = re.compile(r'db;[^,]*desc="\d+ consultas, (\d+) idas"')
+
+
+class ProxyContador:
+    # Proxy TCP entre a aplicação e o Postgres que conta as idas e voltas no
+    # protocolo, e não pelo que a aplicação acha que fez: cada ReadyForQuery
+    # ('Z') do servidor fecha uma, inclusive o Parse separado de uma consulta
+    # preparada fora de pipeline. O primeiro 'Z' de cada conexão (fim do
+    # startup) não conta.
+    def __init__(self, host: str, port: int):
+        self.destino = (host, port)
+        self.idas = 0
+        self._lock = threading.Lock()
+        self._servidor = socket.create_server(("127.0.0.1", 0))
+        self.porta = self._servidor.getsockname()[1]
+        threading.Thread(target=self._aceitar, daemon=True).start()
+
+    def zerar(self) -> int:
+        with self._lock:
+            idas, self.idas = self.idas, 0
+        return idas
+
+    def fechar(self):
+        self._servidor.close()
+
+    def _conectar(self) -> socket.socket:
+        host, port = self.destino
+        if host.startswith("/"):
+            s = socket.socket(socket.AF_UNIX)
+            s.connect(f"{host}/.s.PGSQL.{port}")
+            return s
+        return socket.create_connection((host, port))
+
+    def _aceitar(self):
+        while True:
+            try:
+                cliente, _ = self._servidor.accept()
+            except OSError:
+                return
+            banco = self._conectar()
+            threading.Thread(target=self._repassar, args=(cliente, banco), daemon=True).start()
+            threading.Thread(target=self._respostas, args=(banco, cliente), daemon=True).start()
+
+    @staticmethod
+    def _repassar(origem: socket.socket, destino: socket.socket):
+        try:
+            while dados := origem.recv(65536):
+                destino.sendall(dados)
+        except OSError:
+            pass
+        finally:
+            destino.close()
+
+    def _respostas(self, banco: socket.socket, cliente: socket.socket):
+        buf, pronta = b"", False
+        try:
+            while dados := banco.recv(65536):
+                buf += dados
+                # Mensagens do servidor: tipo (1 byte) + tamanho (4 bytes, inclui ele mesmo)
+                while len(buf) >= 5 and len(buf) >= 1 + int.from_bytes(buf[1:5], "big"):
+                    tipo, buf = buf[:1], buf[1 + int.from_bytes(buf[1:5], "big"):]
+                    if tipo == b"Z":
+                        if pronta:
+                            with self._lock:
+                                self.idas += 1
+                        pronta = True
+                # Conta antes de repassar: quando o cliente recebe a resposta a ida já foi contada
+                cliente.sendall(dados)
+        except OSError:
+            pass
+        finally:
+            cliente.close()
+
+
+@pytest.fixture
+def proxy(banco, monkeypatch):
+    destino = conninfo_to_dict(connection.get_conninfo())
+    p = ProxyContador(destino.get("host", "localhost"), int(destino.get("port", 5432)))
+    monkeypatch.setenv("POSTGRES_HOST", "127.0.0.1")
+    monkeypatch.setenv("POSTGRES_5432", str(p.porta))
+    # O proxy só entende o protocolo sem criptografia
+    monkeypatch.setenv("PGSSLMODE", "disable")
+    monkeypatch.setenv("PGGSSENCMODE", "disable")
+    try:
+        psycopg.connect(connection.get_conninfo(), connect_timeout=2).close()
+    except psycopg.OperationalError as e:
+        p.fechar()
+        pytest.skip(f"banco não aceita conexão sem SSL: {e}")
+    p.zerar()
+    yield p
+    p.fechar()
+
+
+def _ids():
+    with psycopg.connect(connection.get_conninfo()) as conn:
+        turma_id, professor_id, disciplina_id = conn.execute(
+            "SELECT id, professor_id, disciplina_id FROM Turmas ORDER BY id LIMIT 1"
+        ).fetchone()
+        (user_id,) = conn.execute("SELECT MIN(id) FROM Users").fetchone()
+        (departamento_id,) = conn.execute("SELECT departamento_id FROM Professores WHERE id = %s", (professor_id,)).fetchone()
+    return turma_id, professor_id, disciplina_id, user_id, departamento_id
+
+
+def test_idas_e_voltas_por_rota(client, proxy):
+    # Sem o lifespan não há pool: cada requisição abre uma conexão nova, em que
+    # nenhuma consulta está preparada (o pior caso para o Parse)
+    turma_id, professor_id, disciplina_id, user_id, departamento_id = _ids()
+    proxy.zerar()
+    token, _ = auth.emitir(user_id, False)
+
+    # (url, máximo de idas e voltas); cada uma é pedida duas vezes (a segunda
+    # com o cache de leitura preenchido) e depois com If-None-Match (304)
+    casos = [
+        ("/api/professores", 1),
+        ("/api/disciplinas", 1),
+        (f"/api/disciplina/{disciplina_id}", 1),
+        (f"/api/professor/{professor_id}", 1),
+        (f"/api/professor/{professor_id}/tendencia", 1),
+        (f"/api/turma/{turma_id}", 1),
+        (f"/api/turma/{turma_id}?before_id=2000000000&limit=10", 1),
+        (f"/api/turma/{turma_id}/{user_id}", 1),
+        (f"/api/turma/{turma_id}/avaliacoes", 1),
+        (f"/api/turma/{turma_id}/tendencia", 1),
+        ("/api/ranking", 1),
+        (f"/api/departamento/{departamento_id}/ranking", 1),
+        ("/api/busca?q=comentário", 1),
+    ]
+    excedidas = []
+    for url, maximo in casos:
+        etag = None
+        for tentativa in ("fria", "quente", "304"):
+            headers = {"Authorization": f"Bearer {token}"}
+            if tentativa == "304":
+                headers["If-None-Match"] = etag
+            r = client.get(url, headers=headers)
+            idas = proxy.zerar()
+            assert r.status_code == (304 if tentativa == "304" else 200), (url, tentativa)
+            etag = r.headers["etag"]
+            # O Server-Timing conta as mesmas idas que o proxy viu
+            assert _IDAS.search(r.headers["server-timing"]).group(1) == str(idas), (url, tentativa)
+            if idas > maximo:
+                excedidas.append((url, tentativa, idas, maximo))
+
+    assert excedidas == []
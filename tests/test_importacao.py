@@ -0,0 +1,74 @@
+import asyncio
+
+import pytest
+
+from conftest import ConexaoFalsa
+from index import app
+from pysrc import auth
+from pysrc import bulk
+from pysrc import connection
+
+
+def test_arquivo_que_nao_e_utf8_responde_422_com_a_linha(client):
+    db = ConexaoFalsa()
+
+    async def get_db():
+        yield db
+
+    app.dependency_overrides[connection.get_db] = get_db
+    token, _ = auth.emitir(1, True)
+    corpo = "turma_id,user_id,comentario,pontuacao\n1,1,ótimo,5\n".encode("utf-8") + "1,1,péssimo,1\n".encode("latin-1")
+    response = client.post(
+        "/api/importacao/avaliacoes", content=corpo, headers={"Authorization": f"Bearer {token}"}
+    )
+
+    assert response.status_code == 422
+    (erro,) = response.json()["erros"]
+    assert erro["linha"] == 3
+    assert "UTF-8" in erro["erro"]
+    assert response.json()["inseridos"] == 0
+    # Nada foi importado
+    assert db.comandos == []
+
+
+def test_arquivo_grande_demais_responde_413(client, monkeypatch):
+    db = ConexaoFalsa()
+
+    async def get_db():
+        yield db
+
+    app.dependency_overrides[connection.get_db] = get_db
+    monkeypatch.setattr(bulk, "IMPORTACAO_MAX_BYTES", 10)
+    token, _ = auth.emitir(1, True)
+    response = client.post(
+        "/api/importacao/avaliacoes", content=b"turma_id,user_id,comentario,pontuacao\n",
+        headers={"Authorization": f"Bearer {token}"},
+    )
+
+    assert response.status_code == 413
+    assert db.comandos == []
+
+
+def test_spool_acha_o_erro_num_caractere_dividido_entre_blocos(monkeypatch):
+    monkeypatch.setattr(bulk, "SPOOL_BLOCO", 4)
+
+    async def chunks():
+        # "é" em UTF-8 é c3 a9; o c3 fecha um bloco e o byte seguinte não é a9
+        for chunk in (b"ab\ncd", b"\xc3", b"xy\n"):
+            yield chunk
+
+    with pytest.raises(bulk.ArquivoInvalido) as e:
+        asyncio.run(bulk.spool(chunks()))
+    assert e.value.erro.linha == 2
+    assert "0xc3 na posição 3" in e.value.erro.erro
+
+
+def test_spool_aceita_caractere_dividido_entre_blocos(monkeypatch):
+    monkeypatch.setattr(bulk, "SPOOL_BLOCO", 1)
+
+    async def chunks():
+        for byte in "péssimo\nótimo\n".encode("utf-8"):
+            yield bytes([byte])
+
+    with asyncio.run(bulk.spool(chunks())) as f:
+        assert f.read() == "péssimo\nótimo\n"
@@ -0,0 +1,23 @@
+import asyncio
+import os
+
+from pysrc import connection
+from pysrc import migrations
+
+
+def test_checks_cobrem_os_explain_das_migrations():
+    # checks() pula arquivos que não existem: todo .explain.sql do diretório
+    # tem que ser de uma migration e aparecer nos checks
+    arquivos = {arquivo for arquivo in os.listdir(migrations.MIGRATIONS_DIR) if arquivo.endswith(".explain.sql")}
+    assert arquivos
+    assert {arquivo for arquivo, _, _ in migrations.checks()} == arquivos
+
+
+def test_explain_usa_os_indices(banco):
+    async def rodar():
+        async with connection.connect() as conn:
+            return await migrations.explain(conn)
+
+    resultado = asyncio.run(rodar())
+    assert len(resultado) == len(migrations.checks())
+    assert [(arquivo, indice) for arquivo, indice, ok, _ in resultado if not ok] == []
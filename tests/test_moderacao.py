@@ -0,0 +1,21 @@
+from conftest import ConexaoFalsa
+from index import app
+from pysrc import auth
+from pysrc import connection
+
+
+def test_id_fora_de_int4_responde_422_sem_ir_ao_banco(client):
+    db = ConexaoFalsa()
+
+    async def get_db():
+        yield db
+
+    app.dependency_overrides[connection.get_db] = get_db
+    token, _ = auth.emitir(1, True)
+    response = client.post(
+        "/api/moderacao", json={"acao": "excluir", "avaliacao_ids": [1, 2**31]},
+        headers={"Authorization": f"Bearer {token}"},
+    )
+
+    assert response.status_code == 422
+    assert db.comandos == []
@@ -0,0 +1,71 @@
+import asyncio
+import os
+import threading
+
+from starlette.requests import Request
+
+from pysrc import prerender
+
+
+def test_serve_a_variacao_comprimida_com_o_etag_do_arquivo(client, monkeypatch, tmp_path):
+    monkeypatch.setattr(prerender, "DIR", str(tmp_path))
+    monkeypatch.setattr(prerender, "COMPRESSAO", ["gzip"])
+    conteudo = b"<html>" + b"professores " * 200 + b"</html>"
+    prerender.gravar(prerender.diretorio(), "professores.html", conteudo)
+
+    r = client.get("/api/professores", headers={"Accept-Encoding": "gzip"})
+    assert r.status_code == 200
+    assert r.headers["content-encoding"] == "gzip"
+    assert r.headers["etag"].startswith('"estatico-')
+    # Tamanho da variação enviada, não do arquivo principal
+    assert int(r.headers["content-length"]) == os.path.getsize(
+        os.path.join(prerender.diretorio(), "professores.html.gz")
+    )
+    assert r.content == conteudo
+
+    r = client.get("/api/professores", headers={"If-None-Match": r.headers["etag"]})
+    assert r.status_code == 304
+
+
+def test_sem_arquivo_gravado_servir_devolve_none(monkeypatch, tmp_path):
+    monkeypatch.setattr(prerender, "DIR", str(tmp_path))
+    request = Request({"type": "http", "method": "GET", "path": "/", "headers": []})
+    assert asyncio.run(prerender.servir(request, "disciplina", 1)) is None
+
+
+def test_invalidar_apaga_os_arquivos_numa_thread(monkeypatch, tmp_path):
+    monkeypatch.setattr(prerender, "DIR", str(tmp_path))
+    base = prerender.diretorio()
+    prerender.gravar(base, "turma/1.html", b"<html>turma</html>")
+    caminho = os.path.join(base, "turma", "1.html")
+    request = Request({"type": "http", "method": "GET", "path": "/", "headers": []})
+
+    threads = []
+    remover = prerender.remover
+
+    def remover_registrando(*args):
+        threads.append(threading.current_thread())
+        remover(*args)
+
+    monkeypatch.setattr(prerender, "remover", remover_registrando)
+
+    async def rodar():
+        # Espera longa: a regeração (que iria ao banco) não roda no teste
+        regerador = prerender.Regerador(base, espera=60, intervalo=0)
+        monkeypatch.setattr(prerender, "regerador", regerador)
+        regerador.start()
+        try:
+            regerador.invalidar(1, None, None)
+            # O arquivo ainda está lá, mas já não é servido
+            assert os.path.exists(caminho)
+            assert await prerender.servir(request, "turma", 1) is None
+            for _ in range(200):
+                if not os.path.exists(caminho):
+                    break
+                await asyncio.sleep(0.01)
+        finally:
+            await regerador.stop()
+
+    asyncio.run(rodar())
+    assert not os.path.exists(caminho)
+    assert threads and threading.main_thread() not in threads
@@ -0,0 +1,21 @@
+from conftest import ConexaoFalsa
+from index import app
+from pysrc import connection
+
+
+def test_cadastro_publico_nao_cria_admin(client):
+    db = ConexaoFalsa(respostas=[[(7,)]])
+
+    async def get_db():
+        yield db
+
+    app.dependency_overrides[connection.get_db] = get_db
+    response = client.post("/api/usuario", json={
+        "email": "a@example.com", "nome": "a", "matricula": "1", "curso": "cc", "senha": "x", "is_admin": True,
+    })
+
+    assert response.status_code == 200
+    assert response.json()["is_admin"] is False
+    ((sql, params),) = db.comandos
+    assert sql.startswith("INSERT INTO Users")
+    assert params[-1] is False